@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare the installed JSON libraries on payloads shaped like opinel's I/O: the ip-ranges data file and a Scout2-like
+scan result with nested services, regions, and resources.
+
+Usage: python benchmarks/json_backends.py [--resources N] [--repeat N]
+"""
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from opinel.utils.fs import load_data, write_json
+from opinel.utils.json_backend import json_backends, json_dumps, json_loads, set_json_backend
+
+
+def build_scan_results(resources_per_region):
+    regions = {}
+    for region in ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-central-1', 'ap-southeast-1']:
+        instances = {}
+        for i in range(resources_per_region):
+            instance_id = 'i-%017x' % i
+            instances[instance_id] = {
+                'id': instance_id,
+                'name': 'instance-%d' % i,
+                'LaunchTime': datetime.datetime(2017, 6, 12, i % 24, i % 60),
+                'State': {'Code': 16, 'Name': 'running'},
+                'PrivateIpAddress': '10.0.%d.%d' % (i // 256 % 256, i % 256),
+                'SecurityGroups': [{'GroupId': 'sg-%08x' % (i % 50), 'GroupName': 'group-%d' % (i % 50)}],
+                'Tags': [{'Key': 'Name', 'Value': 'instance-%d' % i}, {'Key': 'env', 'Value': 'prod'}],
+                'monitoring_enabled': i % 2 == 0
+            }
+        regions[region] = {'vpcs': {'vpc-00000001': {'instances': instances, 'instances_count': len(instances)}}}
+    return {'account_id': '123456789012', 'last_run': {'time': datetime.datetime.now()},
+            'services': {'ec2': {'regions': regions}}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.strip().split('\n')[0])
+    parser.add_argument('--resources', type = int, default = 2000, help = 'Number of resources per region')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'Number of runs of each operation')
+    args = parser.parse_args()
+
+    payloads = [
+        ('ip-ranges', load_data('ip-ranges/aws.json')),
+        ('scan results', build_scan_results(args.resources))
+    ]
+    set_json_backend('json')
+    print('%-14s %-8s %10s %10s %10s %10s' % ('payload', 'backend', 'size (MB)', 'dumps (s)', 'loads (s)', 'write (s)'))
+    for name, payload in payloads:
+        for backend in json_backends:
+            try:
+                set_json_backend(backend)
+            except Exception:
+                continue
+            output = json_dumps(payload)
+            dumps_time = min(timeit.repeat(lambda: json_dumps(payload), number = 1, repeat = args.repeat))
+            loads_time = min(timeit.repeat(lambda: json_loads(output), number = 1, repeat = args.repeat))
+            write_time = min(timeit.repeat(lambda: write_json(io.StringIO(), payload), number = 1, repeat = args.repeat))
+            print('%-14s %-8s %10.2f %10.4f %10.4f %10.4f' % (name, backend, len(output) / 1048576.0, dumps_time,
+                                                               loads_time, write_time))
+    set_json_backend()
+
+
+if __name__ == '__main__':
+    main()
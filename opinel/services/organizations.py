@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from opinel.utils.aws import handle_truncated_response
+from opinel.utils.aws import handle_truncated_response, iterate_truncated_response
 from opinel.utils.console import printDebug, printInfo
 
 
@@ -13,18 +13,18 @@ def get_organization_account_ids(api_client, exceptions = [], quiet = True):
 
 def get_organization_accounts(api_client, exceptions = [], quiet = True):
 
-    # List all accounts in the organization
-    org_accounts = handle_truncated_response(api_client.list_accounts, {}, ['Accounts'])['Accounts']
-    if not quiet:
-        printInfo('Found %d accounts in the organization.' % len(org_accounts))
-        for account in org_accounts:
+    # List all accounts in the organization, filtering them as pages come in
+    exceptions = set(exceptions)
+    org_accounts = []
+    account_count = 0
+    for account in iterate_truncated_response(api_client.list_accounts, {}, 'Accounts'):
+        account_count += 1
+        if not quiet:
             printDebug(str(account))
-    if len(exceptions):
-        filtered_accounts = []
-        for account in org_accounts:
-            if account['Id'] not in exceptions:
-                filtered_accounts.append(account)
-        org_accounts = filtered_accounts
+        if account['Id'] not in exceptions:
+            org_accounts.append(account)
+    if not quiet:
+        printInfo('Found %d accounts in the organization.' % account_count)
     return org_accounts
 
 
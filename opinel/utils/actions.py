@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+from threading import Lock
+
+from iampoliciesgonewild import all_permissions, _expand_wildcard_action
+
+from opinel.utils.cache import LRUCache
+from opinel.utils.json_backend import json_dumps, json_loads
+
+
+
+class ActionIndex(object):
+    """
+    Map of IAM action names to bit positions, so that sets of actions can be stored as integer bitsets. Known actions
+    get the lowest positions; actions that are not in the master permission list get a position on first use.
+    """
+
+    def __init__(self, actions):
+        self.positions = {}
+        self.lock = Lock()
+        for action in actions:
+            self.positions[action] = len(self.positions)
+        self.universe = (1 << len(self.positions)) - 1
+
+
+    def get_mask(self, actions):
+        """
+        Build the bitset of a number of actions
+
+        :param actions:                 Iterable of action names
+
+        :return:                        Integer bitset
+        """
+        mask = 0
+        for action in actions:
+            position = self.positions.get(action)
+            if position is None:
+                with self.lock:
+                    position = self.positions.setdefault(action, len(self.positions))
+            mask |= 1 << position
+        return mask
+
+
+    def get_actions(self, mask):
+        """
+        List the actions of a bitset
+
+        :param mask:                    Integer bitset
+
+        :return:                        Set of action names
+        """
+        return set(action for action, position in self.positions.items() if (mask >> position) & 1)
+
+
+    def has_action(self, mask, action):
+        """
+        Check whether a bitset contains an action
+
+        :param mask:                    Integer bitset
+        :param action:                  Action name
+
+        :return:                        True if the action is in the bitset, False otherwise
+        """
+        position = self.positions.get(action)
+        return position is not None and (mask >> position) & 1 == 1
+
+
+action_index = ActionIndex(sorted(all_permissions))
+
+expanded_actions_cache = LRUCache(max_size = 4096)
+
+statement_actions_cache = LRUCache(max_size = 4096)
+
+
+
+def expand_actions(actions):
+    """
+    Expand wildcard actions (e.g. iam:Get*) into the bitset of matching actions
+
+    :param actions:                     Action name or list of action names
+
+    :return:                            Integer bitset
+    """
+    key = tuple(actions) if type(actions) == list else actions
+    mask = expanded_actions_cache.get(key)
+    if mask is None:
+        mask = action_index.get_mask(_expand_wildcard_action(actions))
+        expanded_actions_cache.set(key, mask)
+    return mask
+
+
+def get_statement_actions(statement):
+    """
+    Build the bitset of the actions allowed by a policy statement (Action minus NotAction, wildcards expanded). Results
+    are cached by a hash of the statement's Action and NotAction elements, or of the JSON string.
+
+    :param statement:                   Policy statement, as a dictionary or a JSON string
+
+    :return:                            Integer bitset
+    """
+    if type(statement) == dict:
+        # Same normalization as iampoliciesgonewild.get_actions_from_statement
+        for element in ['Action', 'NotAction']:
+            if element in statement and type(statement[element]) != list:
+                statement[element] = [ statement[element] ]
+        key = json_dumps([statement.get('Action', []), statement.get('NotAction', [])])
+    else:
+        key = statement
+    key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    mask = statement_actions_cache.get(key)
+    if mask is None:
+        if type(statement) != dict:
+            mask = get_statement_actions(json_loads(statement))
+        else:
+            mask = 0
+            for action in statement.get('Action', []):
+                mask |= expand_actions(action)
+            not_actions = 0
+            for action in statement.get('NotAction', []):
+                not_actions |= expand_actions(action)
+            if not_actions:
+                mask |= action_index.universe & ~not_actions
+        statement_actions_cache.set(key, mask)
+    return mask
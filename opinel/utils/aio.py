@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+# asyncio fan-out engine (Python 3.5+). Written with futures and callbacks rather than coroutine syntax, so that the
+# module still imports on older interpreters.
+
+from collections import deque, OrderedDict
+import copy
+from threading import Lock
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    asyncio = None
+
+from opinel.utils.threads import TaskResult
+
+
+__executors = {}
+__executors_lock = Lock()
+
+
+def get_executor(max_workers):
+    """
+    Return the process-wide thread pool used to bridge blocking calls (e.g. boto3 clients) into the event loop
+
+    :param max_workers:                 Maximum number of blocking calls in flight
+
+    :return:                            concurrent.futures.ThreadPoolExecutor
+    """
+    with __executors_lock:
+        if max_workers not in __executors:
+            __executors[max_workers] = ThreadPoolExecutor(max_workers = max_workers)
+        return __executors[max_workers]
+
+
+def async_map(targets, function, params = {}, max_concurrency = 100, max_per_host = 10, host_key = None,
+              timeout = None):
+    """
+    Run function(target, params) for each target from the running event loop. Coroutine functions are scheduled on
+    the loop, other functions run in a thread pool.
+
+    :param targets:                     List of targets (e.g. (account, region) tuples)
+    :param function:                    Function or coroutine function called with a target and a private copy of params
+    :param params:                      Parameters passed to each call
+    :param max_concurrency:             Maximum number of calls in flight, all hosts included
+    :param max_per_host:                Maximum number of calls in flight for a single host
+    :param host_key:                    Function that returns the host (e.g. the region's endpoint) of a target.
+                                        Defaults to the target itself.
+    :param timeout:                     Maximum number of seconds to wait
+
+    :return:                            asyncio.Future of the list of TaskResult, in the same order as the targets
+    """
+    if asyncio is None:
+        raise Exception('async_map requires Python 3.5 or later')
+    return AsyncBatch(targets, function, params, max_concurrency, max_per_host, host_key, timeout).future
+
+
+class AsyncBatch(object):
+    """
+    Tasks run by async_map(). Tasks wait in one queue per host and start, in the order of the targets, whenever their
+    host and the batch both have a free slot.
+    """
+
+    def __init__(self, targets, function, params, max_concurrency, max_per_host, host_key, timeout):
+        self.loop = asyncio.get_event_loop()
+        self.future = self.loop.create_future()
+        self.function = function
+        self.params = params
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.results = [TaskResult(target) for target in targets]
+        self.is_coroutine = asyncio.iscoroutinefunction(function)
+        self.executor = None if self.is_coroutine else get_executor(max_concurrency)
+        self.queues = OrderedDict()
+        self.in_flight = {}
+        self.running = {}
+        for task in self.results:
+            host = host_key(task.target) if host_key else task.target
+            self.queues.setdefault(host, deque()).append(task)
+            self.in_flight[host] = 0
+        self.timer = self.loop.call_later(timeout, self.finish) if timeout is not None else None
+        self.future.add_done_callback(lambda future: self.finish())
+        self.__start_tasks()
+
+
+    def __start_tasks(self):
+        for host, queue in self.queues.items():
+            while queue and self.in_flight[host] < self.max_per_host and len(self.running) < self.max_concurrency:
+                self.__start_task(host, queue.popleft())
+        if not self.running:
+            self.finish()
+
+
+    def __start_task(self, host, task):
+        task.status = 'running'
+        task_params = copy.copy(self.params)
+        try:
+            if self.is_coroutine:
+                future = asyncio.ensure_future(self.function(task.target, task_params))
+            else:
+                future = self.loop.run_in_executor(self.executor, self.function, task.target, task_params)
+        except Exception as e:
+            task.exception = e
+            task.status = 'failed'
+            return
+        self.in_flight[host] += 1
+        self.running[future] = (host, task)
+        future.add_done_callback(self.__task_done)
+
+
+    def __task_done(self, future):
+        # Futures cancelled by finish() are no longer running
+        if future not in self.running:
+            return
+        host, task = self.running.pop(future)
+        self.in_flight[host] -= 1
+        if future.cancelled():
+            # Cancelled from outside the batch, or the coroutine raised CancelledError
+            task.status = 'cancelled'
+        elif future.exception() is not None:
+            task.exception = future.exception()
+            task.status = 'failed'
+        else:
+            task.result = future.result()
+            task.status = 'done'
+        if not self.future.done():
+            self.__start_tasks()
+
+
+    def finish(self):
+        """
+        Cancel the tasks that are still running or waiting, and resolve the batch's future
+
+        :return:                        None
+        """
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        running = list(self.running)
+        self.running.clear()
+        for future in running:
+            future.cancel()
+        for queue in self.queues.values():
+            queue.clear()
+        for task in self.results:
+            if task.status == 'running':
+                task.status = 'timeout'
+            elif task.status == 'pending':
+                task.status = 'cancelled'
+        if not self.future.done():
+            self.future.set_result(self.results)
+
+
+def run_async_map(targets, function, params = {}, max_concurrency = 100, max_per_host = 10, host_key = None,
+                  timeout = None):
+    """
+    Blocking wrapper around async_map() that runs its own event loop, with the same contract as thread_map()
+
+    :param targets:                     List of targets (e.g. (account, region) tuples)
+    :param function:                    Function or coroutine function called with a target and a private copy of params
+    :param params:                      Parameters passed to each call
+    :param max_concurrency:             Maximum number of calls in flight, all hosts included
+    :param max_per_host:                Maximum number of calls in flight for a single host
+    :param host_key:                    Function that returns the host of a target. Defaults to the target itself.
+    :param timeout:                     Maximum number of seconds to wait
+
+    :return:                            List of TaskResult, in the same order as the targets
+    """
+    if asyncio is None:
+        raise Exception('run_async_map requires Python 3.5 or later')
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(async_map(targets, function, params, max_concurrency, max_per_host,
+                                                 host_key, timeout))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
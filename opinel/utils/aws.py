@@ -3,9 +3,29 @@
 import boto3
 from botocore.session import Session
 from collections import Counter
-import time
+import hashlib
+from threading import Lock
 
+from opinel.utils.cache import LRUCache
 from opinel.utils.console import printInfo, printException
+from opinel.utils.threads import thread_map
+from opinel.utils.throttling import get_throttling_controller
+
+
+########################################
+# Globals
+########################################
+
+# API clients shared by all callers of connect_service, keyed by (credentials fingerprint, service, region, config)
+client_cache = LRUCache(max_size = 512)
+
+# Single boto3 session used to build cached clients; all clients share its botocore loader and service models
+__client_session = None
+__client_session_lock = Lock()
+
+# Fingerprint of the last credentials seen for each access key ID, used to detect rotated credentials
+__credentials_fingerprints = {}
+__credentials_fingerprints_lock = Lock()
 
 
 
@@ -28,15 +48,17 @@ def build_region_list(service, chosen_regions = [], partition_name = 'aws'):
         return regions
 
 
-def connect_service(service, credentials, region_name = None, config = None, silent = False):
+def connect_service(service, credentials, region_name = None, config = None, silent = False, use_cache = True):
     """
-    Instantiates an AWS API client
+    Instantiates an AWS API client. Clients are cached and reused for identical credentials, service, region, and
+    config values unless use_cache is set to False.
 
     :param service:
     :param credentials:
     :param region_name:
     :param config:
     :param silent:
+    :param use_cache:                   Return a cached client if one exists
 
     :return:
     """
@@ -44,27 +66,120 @@ def connect_service(service, credentials, region_name = None, config = None, sil
     try:
         client_params = {}
         client_params['service_name'] = service.lower()
-        session_params = {}
-        session_params['aws_access_key_id'] = credentials['AccessKeyId']
-        session_params['aws_secret_access_key'] = credentials['SecretAccessKey']
-        session_params['aws_session_token'] = credentials['SessionToken']
+        client_params['aws_access_key_id'] = credentials['AccessKeyId']
+        client_params['aws_secret_access_key'] = credentials['SecretAccessKey']
+        client_params['aws_session_token'] = credentials['SessionToken']
         if region_name:
             client_params['region_name'] = region_name
-            session_params['region_name'] = region_name
         if config:
             client_params['config'] = config
-        aws_session = boto3.session.Session(**session_params)
         if not silent:
             infoMessage = 'Connecting to AWS %s' % service
             if region_name:
                 infoMessage = infoMessage + ' in %s' % region_name
             printInfo('%s...' % infoMessage)
-        api_client = aws_session.client(**client_params)
+        if use_cache:
+            fingerprint = get_credentials_fingerprint(credentials)
+            __invalidate_rotated_credentials(credentials['AccessKeyId'], fingerprint)
+            cache_key = (fingerprint, client_params['service_name'], region_name, get_config_fingerprint(config))
+            api_client = client_cache.get(cache_key)
+            if api_client is None:
+                # Build the client without holding the cache's lock, so that cache hits in other threads never wait
+                api_client = client_cache.set_if_absent(cache_key, __create_client(client_params))
+        else:
+            api_client = __create_client(client_params)
     except Exception as e:
         printException(e)
     return api_client
 
 
+def __create_client(client_params):
+    """
+    Create an API client from the shared boto3 session
+
+    :param client_params:               Arguments passed to boto3.session.Session.client()
+
+    :return:                            API client
+    """
+    global __client_session
+    # boto3 sessions are not thread-safe; serialize client creation
+    with __client_session_lock:
+        if __client_session is None:
+            __client_session = boto3.session.Session()
+        return __client_session.client(**client_params)
+
+
+def __invalidate_rotated_credentials(access_key_id, fingerprint):
+    """
+    Drop cached clients built with previous credentials for the same access key ID (e.g. refreshed session token)
+
+    :param access_key_id:
+    :param fingerprint:
+
+    :return:                            None
+    """
+    with __credentials_fingerprints_lock:
+        previous_fingerprint = __credentials_fingerprints.get(access_key_id)
+        __credentials_fingerprints[access_key_id] = fingerprint
+        if previous_fingerprint and previous_fingerprint != fingerprint:
+            client_cache.invalidate(lambda key: key[0] == previous_fingerprint)
+
+
+def get_client_cache_stats():
+    """
+    Return the API client cache's counters
+
+    :return:                            Dictionary with hits, misses, evictions, size, and max_size
+    """
+    return client_cache.stats()
+
+
+def get_config_fingerprint(config):
+    """
+    Build a hashable representation of a botocore config
+
+    :param config:                      botocore.config.Config object
+
+    :return:                            String that identifies the config's options, or None
+    """
+    if not config:
+        return None
+    options = getattr(config, '_user_provided_options', None)
+    if options is not None:
+        return repr(sorted(options.items()))
+    return repr(config)
+
+
+def get_credentials_fingerprint(credentials):
+    """
+    Hash a set of credentials so that cache keys never hold secrets
+
+    :param credentials:
+
+    :return:                            Hex digest of the access key ID, secret key, and session token
+    """
+    fingerprint = hashlib.sha256()
+    for value in [credentials['AccessKeyId'], credentials['SecretAccessKey'], credentials['SessionToken']]:
+        fingerprint.update(('%s\0' % value).encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+def invalidate_client_cache(credentials = None):
+    """
+    Drop cached API clients
+
+    :param credentials:                 Only drop clients built with these credentials when set
+
+    :return:                            Number of clients dropped
+    """
+    if credentials is None:
+        with __credentials_fingerprints_lock:
+            __credentials_fingerprints.clear()
+            return client_cache.invalidate()
+    fingerprint = get_credentials_fingerprint(credentials)
+    return client_cache.invalidate(lambda key: key[0] == fingerprint)
+
+
 def get_name(src, dst, default_attribute):
     """
 
@@ -118,27 +233,96 @@ def handle_truncated_response(callback, params, entities):
     results = {}
     for entity in entities:
         results[entity] = []
-    while True:
-        try:
-            marker_found = False
-            response = callback(**params)
-            for entity in entities:
-                if entity in response:
-                    results[entity] = results[entity] + response[entity]
-            for marker_name in ['NextToken', 'Marker', 'PaginationToken']:
-                if marker_name in response and response[marker_name]:
-                    params[marker_name] = response[marker_name]
-                    marker_found = True
-            if not marker_found:
-                break
-        except Exception as e:
-            if is_throttled(e):
-                time.sleep(1)
-            else:
-                raise e
+    for page in iterate_truncated_response_pages(callback, params, entities):
+        for entity in page:
+            results[entity].extend(page[entity])
+    return results
+
+
+def handle_truncated_responses(calls, entities, num_threads = 10):
+    """
+    Handle truncated responses for a number of independent calls (e.g. one per user or per region) in parallel
+
+    :param calls:                       List of (callback, params) tuples
+    :param entities:
+    :param num_threads:                 Maximum number of calls in flight
+
+    :return:                            List of results, in the same order as calls
+    """
+    def worker(call, params):
+        callback, call_params = call
+        return handle_truncated_response(callback, dict(call_params), entities)
+    results = []
+    for task in thread_map(calls, worker, max_workers = num_threads):
+        if task.exception:
+            raise task.exception
+        results.append(task.result)
     return results
 
 
+def iterate_truncated_response_pages(callback, params, entities):
+    """
+    Generator that fetches truncated responses page by page
+
+    :param callback:
+    :param params:
+    :param entities:
+
+    :return:                            Dictionary of entity name to list of items, for each page
+    """
+    throttling_key = get_throttling_key(callback)
+    while True:
+        marker_found = False
+        response = get_throttling_controller().call(throttling_key, callback, params, is_throttled)
+        page = {}
+        for entity in entities:
+            if entity in response:
+                page[entity] = response[entity]
+        for marker_name in ['NextToken', 'Marker', 'PaginationToken']:
+            if marker_name in response and response[marker_name]:
+                params[marker_name] = response[marker_name]
+                marker_found = True
+        yield page
+        if not marker_found:
+            break
+
+
+def iterate_truncated_response(callback, params, entity, token = None):
+    """
+    Iterate over the items of a truncated response, fetching one page at a time
+
+    :param callback:
+    :param params:
+    :param entity:                      Name of the response's key that holds the items
+    :param token:                       Continuation token returned by a previous iterator, to resume iterating
+
+    :return:                            TruncatedResponseIterator
+    """
+    return TruncatedResponseIterator(callback, params, entity, token)
+
+
+def get_throttling_key(callback):
+    """
+    Build the (account, region, service) key used to rate limit calls made with an API client's method. The account
+    is identified by the access key ID of the client's credentials.
+
+    :param callback:                    Bound method of an API client
+
+    :return:                            (account, region, service) tuple
+    """
+    api_client = getattr(callback, '__self__', None)
+    try:
+        service = api_client.meta.service_model.service_name
+        region = api_client.meta.region_name
+    except AttributeError:
+        return (None, None, getattr(callback, '__name__', None))
+    try:
+        account = api_client._request_signer._credentials.access_key
+    except AttributeError:
+        account = None
+    return (account, region, service)
+
+
 def is_throttled(e):
     """
     Determines whether the exception is due to API throttling.
@@ -147,3 +331,71 @@ def is_throttled(e):
     :return:                            True if it's a throttling exception else False
     """
     return True if  (hasattr(e, 'response') and 'Error' in e.response and e.response['Error']['Code'] in [ 'Throttling', 'RequestLimitExceeded', 'ThrottlingException', 'TooManyRequestsException' ]) else False
+
+
+class TruncatedResponseIterator(object):
+    """
+    Iterator over the items of a truncated response. Only the current page is held in memory. The token attribute
+    is a JSON-serializable continuation token (None once all items were consumed) that can be passed back to
+    iterate_truncated_response() to resume right after the last item returned.
+    """
+
+    marker_names = ['NextToken', 'Marker', 'PaginationToken']
+
+    def __init__(self, callback, params, entity, token = None):
+        self.entity = entity
+        self.params = dict(params)
+        self.skip = 0
+        if token:
+            self.params.update(token['markers'])
+            self.skip = token['offset']
+        self.pages = iterate_truncated_response_pages(callback, self.params, [ entity ])
+        self.page_markers = None
+        self.items = []
+        self.index = 0
+        self.last_page = False
+
+
+    def __iter__(self):
+        return self
+
+
+    def __next__(self):
+        while self.index >= len(self.items):
+            if self.last_page:
+                raise StopIteration
+            self.__fetch_page()
+        item = self.items[self.index]
+        self.index += 1
+        return item
+
+
+    # Python2
+    next = __next__
+
+
+    @property
+    def token(self):
+        if self.index < len(self.items):
+            return {'markers': self.page_markers, 'offset': self.index}
+        if self.last_page:
+            return None
+        return {'markers': self.__get_markers(), 'offset': self.skip}
+
+
+    def __fetch_page(self):
+        self.page_markers = self.__get_markers()
+        page = next(self.pages)
+        self.items = page[self.entity] if self.entity in page else []
+        self.index = self.skip
+        self.skip = 0
+        # The page generator leaves the markers untouched when there are no more pages
+        self.last_page = (self.__get_markers() == self.page_markers)
+
+
+    def __get_markers(self):
+        markers = {}
+        for marker_name in self.marker_names:
+            if marker_name in self.params:
+                markers[marker_name] = self.params[marker_name]
+        return markers
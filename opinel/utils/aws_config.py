@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import os
+import re
+
+from opinel.utils.cache import LRUCache
+
+
+re_section_header = re.compile(r'\[(.*)\]')
+
+aws_config_files = LRUCache(max_size = 64)
+
+
+
+class AWSConfigSection(object):
+    """
+    Section of an AWS config or credentials file, from its [header] line to the next header
+
+    :ivar header:                       Text between the brackets, e.g. 'profile name'
+    :ivar name:                         Profile name, i.e. the last word of the header
+    :ivar start:                        Offset of the header line in the file's contents
+    :ivar end:                          Offset of the next header line, or length of the contents
+    :ivar lines:                        Lines after the header, with their line endings
+    :ivar attributes:                   Attributes set at the start of a line, in order of appearance; the last value
+                                        wins when an attribute is repeated
+    """
+
+    def __init__(self, header, start):
+        self.header = header
+        words = header.split()
+        self.name = words[-1] if len(words) else None
+        self.start = start
+        self.end = start
+        self.lines = []
+        self.attributes = OrderedDict()
+
+
+    def add_line(self, line):
+        self.lines.append(line)
+        # Indented lines belong to nested settings (e.g. s3 =), which are not attributes of the profile
+        if line[:1].isspace() or '=' not in line:
+            return
+        attribute, value = line.split('=', 1)
+        self.attributes[attribute.strip()] = value.strip()
+
+
+
+class AWSConfigFile(object):
+    """
+    Parsed AWS config or credentials file. Sections are indexed by their exact header and by profile name, so that
+    finding a profile is a dictionary lookup.
+    """
+
+    def __init__(self, filename, contents, stat_key = None):
+        self.filename = filename
+        self.contents = contents
+        self.stat_key = stat_key
+        self.sections = []
+        self.headers = {}
+        self.names = {}
+        section = None
+        offset = 0
+        for line in iter_lines(contents):
+            header = re_section_header.match(line)
+            if header:
+                section = AWSConfigSection(header.groups()[0], offset)
+                self.sections.append(section)
+                self.headers.setdefault(section.header, []).append(section)
+                if section.name is not None:
+                    self.names.setdefault(section.name, []).append(section)
+            elif section:
+                section.add_line(line)
+            offset += len(line)
+            if section:
+                section.end = offset
+
+
+    def get_sections(self, header):
+        """
+        Return the sections with a given header, in file order
+
+        :param header:                  Text between the brackets
+
+        :return:                        List of AWSConfigSection
+        """
+        return self.headers.get(header, [])
+
+
+    def get_profile_sections(self, name):
+        """
+        Return the sections of a profile, whether the header is [name] or [profile name], in file order
+
+        :param name:                    Name of the profile
+
+        :return:                        List of AWSConfigSection
+        """
+        return self.names.get(name, [])
+
+
+    def get_raw_section(self, section):
+        """
+        Return the text of a section, header included
+
+        :param section:                 AWSConfigSection
+
+        :return:                        Text of the section
+        """
+        return self.contents[section.start:section.end]
+
+
+
+def iter_lines(contents):
+    """
+    Split text on newlines only, the same way iterating over a text file does
+
+    :param contents:                    Text
+
+    :return:                            Iterator of lines, with their line endings
+    """
+    start = 0
+    while start < len(contents):
+        end = contents.find('\n', start) + 1 or len(contents)
+        yield contents[start:end]
+        start = end
+
+
+def get_aws_config_file(filename):
+    """
+    Return the parsed contents of an AWS config or credentials file, parsing it again only when its modification time
+    or size changed
+
+    :param filename:                    Path of the file
+
+    :return:                            AWSConfigFile. Raises OSError or IOError if the file cannot be read.
+    """
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    stat_key = (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size)
+    config_file = aws_config_files.get(filename)
+    if config_file is None or config_file.stat_key != stat_key:
+        with open(filename, 'rt') as f:
+            config_file = AWSConfigFile(filename, f.read(), stat_key)
+        aws_config_files.set(filename, config_file)
+    return config_file
+
+
+def invalidate_aws_config_file(filename = None):
+    """
+    Drop parsed AWS config files, e.g. after modifying them
+
+    :param filename:                    Path of the file, defaults to all files
+
+    :return:                            Number of files dropped
+    """
+    if filename is None:
+        return aws_config_files.invalidate()
+    filename = os.path.abspath(filename)
+    return aws_config_files.invalidate(lambda key: key == filename)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import copy
+from threading import RLock
+
+try:
+    # Python2
+    immutable_types = (basestring, int, long, float, bool, type(None))
+except NameError:
+    # Python3
+    immutable_types = (str, bytes, int, float, bool, type(None))
+
+
+
+class LRUCache(object):
+    """
+    Thread-safe, bounded least-recently-used cache with hit/miss counters
+    """
+
+    def __init__(self, max_size = 128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = RLock()
+
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+    def get(self, key, default = None):
+        """
+        Return the value cached for key and mark it as the most recently used
+
+        :param key:                     Cache key
+        :param default:                 Value returned on cache miss
+
+        :return:                        Cached value or default
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+
+    def set(self, key, value):
+        """
+        Cache a value, evicting the least recently used entries if needed
+
+        :param key:                     Cache key
+        :param value:                   Value to be cached
+
+        :return:                        None
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while self.max_size and len(self._data) > self.max_size:
+                self._data.popitem(last = False)
+                self.evictions += 1
+
+
+    def set_if_absent(self, key, value):
+        """
+        Cache a value unless the key is already cached, e.g. when concurrent callers built the same value without
+        holding the cache's lock
+
+        :param key:                     Cache key
+        :param value:                   Value to be cached
+
+        :return:                        Value cached for key, i.e. the first value set
+        """
+        with self._lock:
+            if key in self._data:
+                return self.get(key)
+            self.set(key, value)
+            return value
+
+
+    def get_or_create(self, key, factory):
+        """
+        Return the value cached for key, creating it with factory() on cache miss. Creation happens under the cache's
+        lock so that concurrent callers never build the same entry twice.
+
+        :param key:                     Cache key
+        :param factory:                 Callable that returns the value to be cached
+
+        :return:                        Cached value
+        """
+        with self._lock:
+            if key in self._data:
+                return self.get(key)
+            self.misses += 1
+            value = factory()
+            self.set(key, value)
+            return value
+
+
+    def invalidate(self, match = None):
+        """
+        Drop cached entries
+
+        :param match:                   Callable that receives a key and returns True if the entry should be dropped.
+                                        All entries are dropped when not set.
+
+        :return:                        Number of entries dropped
+        """
+        with self._lock:
+            if match is None:
+                count = len(self._data)
+                self._data.clear()
+                return count
+            keys = [key for key in self._data if match(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+
+    def stats(self):
+        """
+        Return the cache's counters
+
+        :return:                        Dictionary with hits, misses, evictions, size, and max_size
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._data), 'max_size': self.max_size}
+
+
+
+def copy_tree(value):
+    """
+    Copy nested dictionaries and lists, e.g. cached data that callers may modify. Faster than copy.deepcopy() for
+    parsed JSON and YAML documents.
+
+    :param value:                       Value to copy
+
+    :return:                            Copy of the value; immutable scalars are shared
+    """
+    if type(value) == dict:
+        return {k: copy_tree(v) for k, v in value.items()}
+    elif type(value) == list:
+        return [ copy_tree(v) for v in value ]
+    elif isinstance(value, immutable_types):
+        return value
+    return copy.deepcopy(value)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_right
+import netaddr
+
+from opinel.utils.cache import LRUCache
+
+
+address_bits = {4: 32, 6: 128}
+
+subnet_index_cache = LRUCache(max_size = 64)
+
+
+
+class SubnetIndex(object):
+    """
+    Index of known IPv4 and IPv6 subnets.
+
+    contains() answers whether a CIDR falls within any known subnet in O(log n): since two CIDRs are either nested or
+    disjoint, the subnets that are not nested in another one form sorted, disjoint intervals that can be bisected.
+    lookup() returns the values attached to every known subnet that contains a CIDR, most specific first, with one
+    hash lookup per distinct prefix length (i.e. a flattened prefix tree).
+    """
+
+    def __init__(self, subnets = [], values = None):
+        self.subnets = {4: {}, 6: {}}
+        self.intervals = None
+        if values is None:
+            values = subnets
+        for subnet, value in zip(subnets, values):
+            self.add(subnet, value)
+
+
+    def __len__(self):
+        return sum(len(subnets) for prefixes in self.subnets.values() for subnets in prefixes.values())
+
+
+    def add(self, subnet, value = None):
+        """
+        Add a known subnet to the index
+
+        :param subnet:                  CIDR string or netaddr.IPNetwork
+        :param value:                   Value returned by lookup() for this subnet, defaults to the subnet itself
+
+        :return:                        None
+        """
+        network = netaddr.IPNetwork(subnet)
+        prefixes = self.subnets[network.version].setdefault(network.prefixlen, {})
+        prefixes.setdefault(network.first, []).append(subnet if value is None else value)
+        self.intervals = None
+
+
+    def contains(self, cidr):
+        """
+        Check whether a CIDR falls within any known subnet
+
+        :param cidr:                    CIDR or IP address string, or netaddr.IPNetwork
+
+        :return:                        True if a known subnet contains the CIDR, False otherwise
+        """
+        network = cidr if isinstance(cidr, netaddr.IPNetwork) else netaddr.IPNetwork(cidr)
+        if self.intervals is None:
+            self.__build_intervals()
+        starts, ends = self.intervals[network.version]
+        i = bisect_right(starts, network.first) - 1
+        return i >= 0 and network.last <= ends[i]
+
+
+    def lookup(self, cidr):
+        """
+        Return the values of all known subnets that contain a CIDR
+
+        :param cidr:                    CIDR or IP address string, or netaddr.IPNetwork
+
+        :return:                        List of values, most specific subnet first
+        """
+        network = cidr if isinstance(cidr, netaddr.IPNetwork) else netaddr.IPNetwork(cidr)
+        bits = address_bits[network.version]
+        all_ones = (1 << bits) - 1
+        values = []
+        prefixes = self.subnets[network.version]
+        for prefixlen in sorted(prefixes, reverse = True):
+            if prefixlen > network.prefixlen:
+                continue
+            first = network.first & (all_ones ^ ((1 << (bits - prefixlen)) - 1))
+            if first in prefixes[prefixlen]:
+                values += prefixes[prefixlen][first]
+        return values
+
+
+    def __build_intervals(self):
+        intervals = {}
+        for version, prefixes in self.subnets.items():
+            bits = address_bits[version]
+            ranges = sorted((first, first + (1 << (bits - prefixlen)) - 1) for prefixlen in prefixes for first in prefixes[prefixlen])
+            starts = []
+            ends = []
+            for first, last in ranges:
+                # Ranges are sorted by start; a range that starts before the end of the previous one is nested in it
+                if len(ends) and first <= ends[-1]:
+                    ends[-1] = max(ends[-1], last)
+                    continue
+                starts.append(first)
+                ends.append(last)
+            intervals[version] = (starts, ends)
+        self.intervals = intervals
+
+
+
+def encode_cidr(cidr):
+    """
+    Encode a CIDR or IP address as a single integer, e.g. to deduplicate large numbers of addresses in a set
+
+    :param cidr:                        CIDR or IP address string
+
+    :return:                            Integer made of the address, prefix length, and IP version
+    """
+    address, separator, prefixlen = cidr.partition('/')
+    ip = netaddr.IPAddress(address)
+    prefixlen = int(prefixlen) if separator else address_bits[ip.version]
+    return (((ip.value << 8) | prefixlen) << 1) | (ip.version == 6)
+
+
+def get_subnet_index(subnets):
+    """
+    Return a shared index of known subnets, building it on first use
+
+    :param subnets:                     List of CIDR strings
+
+    :return:                            SubnetIndex
+    """
+    key = tuple(str(subnet) for subnet in subnets)
+    return subnet_index_cache.get_or_create(key, lambda: SubnetIndex(list(subnets)))
@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import json
 import os
 import sys
 import tempfile
 
+from opinel.utils.json_backend import json_load
+
 opinel_arg_dir = os.path.join(os.path.expanduser('~'), '.aws/opinel')
 
+execution_modes = ['threads', 'processes', 'hybrid']
+
 class OpinelArgumentParser(object):
     """
     """
@@ -56,6 +59,24 @@ class OpinelArgumentParser(object):
                                 default=[],
                                 nargs='+',
                                 help='Name of VPC to run the tool in, defaults to all' if not help else help)
+        elif argument_name == 'execution-mode':
+            self.parser.add_argument('--execution-mode',
+                                dest='execution_mode',
+                                default='threads',
+                                choices=execution_modes,
+                                help='Run tasks in threads, in processes (one per CPU), or in threads within processes' if not help else help)
+        elif argument_name == 'output-format':
+            self.parser.add_argument('--output-format',
+                                dest='output_format',
+                                default='json',
+                                choices=['json', 'ndjson', 'csv', 'arrow', 'parquet', 'npy'],
+                                help='Write results as JSON, as line-delimited JSON, as CSV, or in a columnar format (arrow and parquet require pyarrow) when supported' if not help else help)
+        elif argument_name == 'compression':
+            self.parser.add_argument('--compression',
+                                dest='compression',
+                                default=None,
+                                choices=['gzip', 'zstd'],
+                                help='Compress output files (zstd requires the zstandard package)' if not help else help)
         elif argument_name == 'force':
             self.parser.add_argument('--force',
                                 dest='force_write',
@@ -169,7 +190,7 @@ def read_default_args(tool_name):
     default_args = {}
     if os.path.isfile(opinel_arg_file):
         with open(opinel_arg_file, 'rt') as f:
-            all_args = json.load(f)
+            all_args = json_load(f)
         for target in all_args:
             if tool_name.endswith(target):
                 default_args.update(all_args[target])
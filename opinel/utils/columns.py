@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+# Columnar export of lists of records: Arrow IPC or Parquet files with pyarrow, directories of .npy files otherwise
+
+from collections import OrderedDict
+import datetime
+import os
+import shutil
+import tempfile
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from opinel.utils.json_backend import json_dumps, json_load
+
+try:
+    # Python2
+    long_type = long
+    text_type = unicode
+except NameError:
+    # Python3
+    long_type = int
+    text_type = str
+
+
+columnar_extensions = {'arrow': '.arrow', 'parquet': '.parquet', 'npy': '.columns'}
+
+npy_metadata_file = 'columns.json'
+
+
+
+def get_columnar_format(filename):
+    """
+    Detect the columnar format of a file from its extension
+
+    :param filename:                    Name of the file or directory
+
+    :return:                            arrow, parquet, npy, or None
+    """
+    for format, extension in columnar_extensions.items():
+        if filename.endswith(extension):
+            return format
+    return None
+
+
+def get_default_columnar_format():
+    """
+    Return the best columnar format supported by the installed libraries
+
+    :return:                            arrow with pyarrow, npy with NumPy only
+    """
+    if pyarrow is not None:
+        return 'arrow'
+    elif numpy is not None:
+        return 'npy'
+    raise Exception('Columnar export requires pyarrow or numpy')
+
+
+def records_to_columns(records, columns = None):
+    """
+    Transpose records into columns of values of a single type. Columns that mix types are converted to strings, and
+    nested dictionaries and lists to JSON strings. Missing values are None.
+
+    :param records:                     Iterable of dictionaries
+    :param columns:                     Names of the columns to keep, defaults to all keys, in order of appearance
+
+    :return:                            OrderedDict of column name to (type, list of values) tuples, where type is one
+                                        of bool, int, float, datetime, or string
+    """
+    data = OrderedDict((name, []) for name in columns or [])
+    count = 0
+    for record in records:
+        for name, value in record.items():
+            if name not in data:
+                if columns:
+                    continue
+                data[name] = [ None ] * count
+            data[name].append(value)
+        count += 1
+        for values in data.values():
+            if len(values) < count:
+                values.append(None)
+    return OrderedDict((name, __normalize_column(values)) for name, values in data.items())
+
+
+def __normalize_column(values):
+    types = set(type(value) for value in values if value is not None)
+    if types == set([bool]):
+        return 'bool', values
+    elif types and types.issubset(set([int, long_type])):
+        return 'int', values
+    elif types and types.issubset(set([int, long_type, float])):
+        return 'float', [ float(value) if value is not None else None for value in values ]
+    elif types == set([datetime.datetime]):
+        return 'datetime', [ value.replace(tzinfo = None) if value is not None else None for value in values ]
+    return 'string', [ __to_string(value) for value in values ]
+
+
+def __to_string(value):
+    if value is None or type(value) == text_type:
+        return value
+    elif type(value) in [dict, list]:
+        return json_dumps(value)
+    elif type(value) == bytes:
+        return value.decode('utf-8')
+    return text_type(value)
+
+
+########################################
+# Writers
+########################################
+
+def write_columns(path, records, format = None, columns = None):
+    """
+    Write records to a columnar file (arrow, parquet) or directory (npy). The output is written next to its
+    destination and moved over it once complete.
+
+    :param path:                        Path of the file or directory
+    :param records:                     Iterable of dictionaries
+    :param format:                      arrow, parquet, or npy. Defaults to the path's extension, then to the best
+                                        supported format.
+    :param columns:                     Names of the columns to keep, defaults to all keys
+
+    :return:                            None
+    """
+    format = format or get_columnar_format(path) or get_default_columnar_format()
+    data = records_to_columns(records, columns)
+    directory = os.path.dirname(os.path.abspath(path))
+    if format == 'npy':
+        tmp_path = tempfile.mkdtemp(dir = directory, prefix = '.%s.' % os.path.basename(path), suffix = '.tmp')
+        try:
+            __write_npy_columns(tmp_path, data)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.rename(tmp_path, path)
+        except:
+            shutil.rmtree(tmp_path, ignore_errors = True)
+            raise
+        return
+    if pyarrow is None:
+        raise Exception('Writing %s files requires pyarrow' % format)
+    table = pyarrow.table(OrderedDict((name, __to_arrow_array(kind, values)) for name, (kind, values) in data.items()))
+    fd, tmp_path = tempfile.mkstemp(dir = directory, prefix = '.%s.' % os.path.basename(path), suffix = '.tmp')
+    os.close(fd)
+    try:
+        if format == 'arrow':
+            with pyarrow.OSFile(tmp_path, 'wb') as sink:
+                with pyarrow.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        elif format == 'parquet':
+            pyarrow.parquet.write_table(table, tmp_path)
+        else:
+            raise Exception('Unsupported columnar format %s' % format)
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def __to_arrow_array(kind, values):
+    types = {'bool': pyarrow.bool_(), 'int': pyarrow.int64(), 'float': pyarrow.float64(),
+             'datetime': pyarrow.timestamp('us'), 'string': pyarrow.string()}
+    return pyarrow.array(values, type = types[kind])
+
+
+def __write_npy_columns(directory, data):
+    if numpy is None:
+        raise Exception('Writing npy columns requires numpy')
+    metadata = []
+    rows = 0
+    for i, (name, (kind, values)) in enumerate(data.items()):
+        rows = len(values)
+        column = {'name': name, 'type': kind, 'file': 'column-%d.npy' % i, 'mask': None}
+        mask = [ value is None for value in values ]
+        if any(mask):
+            column['mask'] = 'column-%d.mask.npy' % i
+            numpy.save(os.path.join(directory, column['mask']), numpy.array(mask, dtype = bool))
+        numpy.save(os.path.join(directory, column['file']), __to_numpy_array(kind, values))
+        metadata.append(column)
+    with open(os.path.join(directory, npy_metadata_file), 'wt') as f:
+        f.write(json_dumps({'columns': metadata, 'rows': rows}))
+
+
+def __to_numpy_array(kind, values):
+    # Missing values are stored as NaN, NaT, or the type's zero value, and flagged in the column's mask
+    if kind == 'float':
+        return numpy.array([ value if value is not None else numpy.nan for value in values ], dtype = numpy.float64)
+    elif kind == 'datetime':
+        return numpy.array([ value if value is not None else 'NaT' for value in values ], dtype = 'datetime64[us]')
+    elif kind == 'string':
+        return numpy.array([ value if value is not None else u'' for value in values ], dtype = text_type)
+    zero = False if kind == 'bool' else 0
+    dtype = bool if kind == 'bool' else numpy.int64
+    return numpy.array([ value if value is not None else zero for value in values ], dtype = dtype)
+
+
+########################################
+# Readers
+########################################
+
+def read_columns(path, columns = None):
+    """
+    Memory-map a columnar file or directory written by write_columns()
+
+    :param path:                        Path of the file or directory
+    :param columns:                     Names of the columns to read, defaults to all columns
+
+    :return:                            pyarrow.Table for arrow and parquet files; OrderedDict of column name to NumPy
+                                        array for npy directories, as numpy.ma.MaskedArray when values are missing
+    """
+    format = get_columnar_format(path) or ('npy' if os.path.isdir(path) else None)
+    if format == 'npy':
+        return __read_npy_columns(path, columns)
+    if pyarrow is None:
+        raise Exception('Reading %s files requires pyarrow' % format)
+    if format == 'arrow':
+        table = pyarrow.ipc.open_file(pyarrow.memory_map(path, 'r')).read_all()
+        return table.select(columns) if columns else table
+    elif format == 'parquet':
+        return pyarrow.parquet.read_table(path, columns = columns, memory_map = True)
+    raise Exception('Unknown columnar format for %s' % path)
+
+
+def __read_npy_columns(directory, columns):
+    if numpy is None:
+        raise Exception('Reading npy columns requires numpy')
+    with open(os.path.join(directory, npy_metadata_file), 'rt') as f:
+        metadata = json_load(f)
+    data = OrderedDict()
+    for column in metadata['columns']:
+        if columns and column['name'] not in columns:
+            continue
+        values = numpy.load(os.path.join(directory, column['file']), mmap_mode = 'r')
+        if column['mask']:
+            values = numpy.ma.masked_array(values, mask = numpy.load(os.path.join(directory, column['mask'])))
+        data[column['name']] = values
+    return data
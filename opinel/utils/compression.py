@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+from threading import Thread
+import zlib
+try:
+    # Python2
+    from Queue import Queue
+except ImportError:
+    # Python3
+    from queue import Queue
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+compression_extensions = {'gzip': '.gz', 'zstd': '.zst'}
+
+ndjson_extensions = ['.ndjson', '.jsonl']
+
+compressed_write_buffer_size = 256 * 1024
+
+
+
+def get_compression(filename):
+    """
+    Detect the compression of a file from its extension
+
+    :param filename:                    Name of the file
+
+    :return:                            gzip, zstd, or None
+    """
+    for compression, extension in compression_extensions.items():
+        if filename.endswith(extension):
+            return compression
+    return None
+
+
+def is_ndjson_file(filename):
+    """
+    Check whether a file contains line-delimited JSON, from its extension
+
+    :param filename:                    Name of the file, optionally with a compression extension
+
+    :return:                            True if the file contains one JSON value per line
+    """
+    compression = get_compression(filename)
+    if compression:
+        filename = filename[:-len(compression_extensions[compression])]
+    return any(filename.endswith(extension) for extension in ndjson_extensions)
+
+
+def open_compressed(filename):
+    """
+    Open a text file for reading, decompressing it on the fly if its extension is .gz or .zst
+
+    :param filename:                    Path of the file
+
+    :return:                            Text file object
+    """
+    compression = get_compression(filename)
+    if compression is None:
+        return open(filename, 'rt')
+    elif compression == 'gzip':
+        return io.TextIOWrapper(gzip.open(filename, 'rb'), encoding = 'utf-8')
+    __check_zstandard()
+    return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd = True),
+                            encoding = 'utf-8')
+
+
+def get_compressor(compression, level = None):
+    """
+    Create a streaming compressor
+
+    :param compression:                 gzip or zstd
+    :param level:                       Compression level, defaults to each library's default
+
+    :return:                            Object with compress(data) and flush() methods
+    """
+    if compression == 'gzip':
+        # wbits = 31 writes a gzip header and trailer
+        return zlib.compressobj(level if level is not None else 6, zlib.DEFLATED, 31)
+    elif compression == 'zstd':
+        __check_zstandard()
+        return zstandard.ZstdCompressor(level = level if level is not None else 3).compressobj()
+    raise Exception('Unsupported compression %s' % compression)
+
+
+def __check_zstandard():
+    if zstandard is None:
+        raise Exception('The zstandard package is required to read and write .zst files')
+
+
+class CompressedWriter(object):
+    """
+    Text file wrapper that compresses and writes data on a background thread, so that serialization in the calling
+    thread overlaps with compression (zlib and zstandard release the GIL). Errors raised on the background thread are
+    raised again by the next write() or by close().
+    """
+
+    def __init__(self, f, compression, level = None, queue_size = 8):
+        self.f = f
+        self.compressor = get_compressor(compression, level)
+        self.queue = Queue(maxsize = queue_size)
+        self.buffer = []
+        self.size = 0
+        self.exception = None
+        self.thread = Thread(target = self.__compress)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def write(self, data):
+        """
+        Queue text for compression
+
+        :param data:                    Text to write
+
+        :return:                        None
+        """
+        if self.exception:
+            raise self.exception
+        if type(data) != bytes:
+            data = data.encode('utf-8')
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= compressed_write_buffer_size:
+            self.__flush_buffer()
+
+
+    def close(self):
+        """
+        Compress the remaining data and wait for the background thread
+
+        :return:                        None
+        """
+        self.__flush_buffer()
+        self.queue.put(None)
+        self.thread.join()
+        if self.exception:
+            raise self.exception
+
+
+    def __flush_buffer(self):
+        if self.buffer:
+            self.queue.put(b''.join(self.buffer))
+            self.buffer = []
+            self.size = 0
+
+
+    def __compress(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            # Keep consuming after an error so that the writing thread never blocks on a full queue
+            if self.exception is None:
+                try:
+                    self.f.write(self.compressor.compress(data))
+                except Exception as e:
+                    self.exception = e
+        if self.exception is None:
+            try:
+                self.f.write(self.compressor.flush())
+            except Exception as e:
+                self.exception = e
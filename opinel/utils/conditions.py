@@ -2,17 +2,92 @@
 
 import datetime
 import dateutil.parser
-import json
-import netaddr
+import operator
 import re
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
+from opinel.utils.actions import action_index, expand_actions, get_statement_actions
+from opinel.utils.cache import LRUCache
+from opinel.utils.cidr import get_subnet_index
 from opinel.utils.console import printError
 
-from iampoliciesgonewild import get_actions_from_statement, _expand_wildcard_action
+try:
+    # Python2
+    string_types = basestring
+    scalar_types = (basestring, int, long, float, bool, type(None))
+except NameError:
+    # Python3
+    string_types = str
+    scalar_types = (str, int, float, bool, type(None))
 
 
+arn_cache = LRUCache(max_size = 4096)
 
-def __prepare_age_test(a, b):
+date_cache = LRUCache(max_size = 8192)
+
+iso_date_regex = re.compile(r'^(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d+))?)?)?(?:Z|[+-]\d{2}:?\d{2})?$')
+
+clock_tests = ['olderThan', 'newerThan']
+
+# Conditions compiled by pass_condition(), per test case and argument
+compiled_conditions = {}
+compiled_conditions_max_size = 4096
+
+
+
+def parse_arn(arn):
+    """
+    Split an ARN into its fields
+
+    :param arn:                         ARN string (e.g. arn:aws:iam::123456789012:role/name)
+
+    :return:                            Dictionary with partition, service, region, account and resource keys, or None
+                                        if the string is not an ARN
+    """
+    parsed = arn_cache.get(arn)
+    if parsed is None:
+        try:
+            fields = arn.split(':', 5)
+        except AttributeError:
+            fields = []
+        if len(fields) != 6 or fields[0] != 'arn':
+            parsed = {}
+        else:
+            parsed = dict(zip(['partition', 'service', 'region', 'account', 'resource'], fields[1:]))
+        arn_cache.set(arn, parsed)
+    return parsed or None
+
+
+def parse_date(value):
+    """
+    Parse a date into a naive datetime, ignoring the timezone like dateutil.parser.parse(...).replace(tzinfo=None).
+    ISO 8601 strings, such as the timestamps returned by AWS, skip dateutil. Results are cached per string.
+
+    :param value:                       Date string or datetime
+
+    :return:                            datetime.datetime without tzinfo
+    """
+    value = str(value)
+    date = date_cache.get(value)
+    if date is None:
+        date = __parse_iso_date(value) or dateutil.parser.parse(value).replace(tzinfo=None)
+        date_cache.set(value, date)
+    return date
+
+
+def __parse_iso_date(value):
+    match = iso_date_regex.match(value)
+    if not match:
+        return None
+    fields = match.groups()
+    microseconds = int(fields[6][:6].ljust(6, '0')) if fields[6] else 0
+    return datetime.datetime(*([int(field or 0) for field in fields[:6]] + [microseconds]))
+
+
+def __prepare_age_test(a):
     if type(a) != list:
         printError('Error: olderThan requires a list such as [ N , \'days\' ] or [ M, \'hours\'].')
         raise Exception
@@ -27,8 +102,15 @@ def __prepare_age_test(a, b):
     elif unit == 'minutes':
         number *= 60
         unit = 'seconds'
-    age = getattr((datetime.datetime.today() - dateutil.parser.parse(str(b)).replace(tzinfo=None)), unit)
-    return age, number
+    return number, unit
+
+
+def __get_age(b, unit, now):
+    return getattr(now - parse_date(b), unit)
+
+
+def __listify(a):
+    return a if type(a) == list else [ a ]
 
 
 def pass_condition(b, test, a):
@@ -41,176 +123,361 @@ def pass_condition(b, test, a):
 
     :return:                            True of condition is met, False otherwise
     """
+    if test in condition_evaluators:
+        return condition_evaluators[test](b, a)
+    # Other test cases are compiled once per argument. Strings are their own key; other arguments are keyed with their
+    # type, because 1, 1.0, and True are equal but not interchangeable (e.g. str(True) != str(1)).
+    key = a if type(a) == str else (list, tuple(a)) if type(a) == list else (type(a), a)
+    try:
+        condition = compiled_conditions[test][key]
+    except (KeyError, TypeError):
+        # TypeError: unhashable argument, which __compile_cached_condition() does not cache
+        condition = __compile_cached_condition(test, a, key)
+    return condition(b)
 
-    # Return false by default
-    result = False
 
-    # Equality tests
-    if test == 'equal':
-        a = str(a)
-        b = str(b)
-        result = (a == b)
-    elif test == 'notEqual':
-        result = (not pass_condition(b, 'equal', a))
-
-    # More/Less tests
-    elif test == 'lessThan':
-        result = (int(b) < int(a))
-    elif test == 'lessOrEqual':
-        result = (int(b) <= int(a))
-    elif test == 'moreThan':
-        result = (int(b) > int(a))
-    elif test == 'moreOrEqual':
-        result = (int(b) >= int(a))
-
-    # Empty tests
-    elif test == 'empty':
-        result = ((type(b) == dict and b == {}) or (type(b) == list and b == []) or (type(b) == list and b == [None]))
-    elif test == 'notEmpty':
-        result = (not pass_condition(b, 'empty', 'a'))
-    elif test == 'null':
-        result = ((b == None) or (type(b) == str and b == 'None'))
-    elif test == 'notNull':
-        result = (not pass_condition(b, 'null', a))
-
-    # Boolean tests
-    elif test == 'true':
-        result = (str(b).lower() == 'true')
-    elif test == 'notTrue' or test == 'false':
-        result = (str(b).lower() == 'false')
-
-    # Object length tests
-    elif test == 'lengthLessThan':
-        result = (len(b) < int(a))
-    elif test == 'lengthMoreThan':
-        result = (len(b) > int(a))
-    elif test == 'lengthEqual':
-        result = (len(b) == int(a))
-
-    # Dictionary keys tests
-    elif test == 'withKey':
-        result = (a in b)
-    elif test == 'withoutKey':
-        result = (not a in b)
-
-    # List tests
-    elif test == 'containAtLeastOneOf':
-        result = False
-        if not type(b) == list:
-            b = [ b ]
-        if not type(a) == list:
-            a = [ a ]
-        for c in b:
-            if type(c):
-                c = str(c)
-            if c in a:
-                result = True
-                break
-    elif test == 'containAtLeastOneDifferentFrom':
-        result = False
-        if not type(b) == list:
-            b = [ b ]
-        if not type(a) == list:
-            a = [ a ]
-        for c in b:
-            if c != None and c != '' and c not in a:
-                result = True
-                break
-    elif test == 'containNoneOf':
-        result = True
-        if not type(b) == list:
-            b = [ b ]
-        if not type(a) == list:
-            a = [ a ]
-        for c in b:
-            if c in a:
-                result = False
-                break
-
-    # Regex tests
-    elif test == 'match':
-        if type(a) != list:
-            a = [ a ]
-        b = str(b)
-        for c in a:
-            if re.match(c, b) != None:
-                result = True
-                break
-    elif test == 'notMatch':
-        result = (not pass_condition(b, 'match', a))
-
-    # Date tests
-    elif test == 'priorToDate':
-        b = dateutil.parser.parse(str(b)).replace(tzinfo=None)
-        a = dateutil.parser.parse(str(a)).replace(tzinfo=None)
-        result = (b < a)
-    elif test == 'olderThan':
-        age, threshold = __prepare_age_test(a, b)
-        result = (age > threshold)
-    elif test == 'newerThan':
-        age, threshold = __prepare_age_test(a, b)
-        result = (age < threshold)
-
-    # CIDR tests
-    elif test == 'inSubnets':
-        result = False
-        grant = netaddr.IPNetwork(b)
-        if type(a) != list:
-            a = [ a ]
-        for c in a:
-            known_subnet = netaddr.IPNetwork(c)
-            if grant in known_subnet:
-                result = True
-                break
-    elif test == 'notInSubnets':
-        result = (not pass_condition(b, 'inSubnets', a))
-
-    # Policy statement tests
-    elif test == 'containAction':
-        result = False
-        if type(b) != dict:
-            b = json.loads(b)
-        statement_actions = get_actions_from_statement(b)
-        rule_actions = _expand_wildcard_action(a)
-        for action in rule_actions:
-            if action.lower() in statement_actions:
-                result = True
-                break
-    elif test == 'notContainAction':
-        result = (not pass_condition(b, 'containAction', a))
-    elif test == 'containAtLeastOneAction':
-        result = False
-        if type(b) != dict:
-            b = json.loads(b)
-        if type(a) != list:
-            a = [ a ]
-        actions = get_actions_from_statement(b)
-        for c in a:
-            if c.lower() in actions:
-                result = True
-                break
-
-    # Policy principal tests
-    elif test == 'isCrossAccount':
-        result = False
-        if type(b) != list:
-            b = [b]
-        for c in b:
-            if c != a and not re.match(r'arn:aws:iam:.*?:%s:.*' % a, c):
-                result = True
-                break
-    elif test == 'isSameAccount':
-        result = False
-        if type(b) != list:
-            b = [b]
-        for c in b:
-            if c == a or re.match(r'arn:aws:iam:.*?:%s:.*' % a, c):
-                result = True
-                break
-
-    # Unknown test case
+def __compile_cached_condition(test, a, key):
+    # Age tests depend on the current time and are never cached, nor are arguments other than scalars and lists of
+    # strings (e.g. dictionaries, or objects that may be hashable but are compared by value)
+    if type(a) == list:
+        cacheable = all(isinstance(c, string_types) for c in a)
     else:
+        cacheable = isinstance(a, scalar_types)
+    if test in clock_tests or test not in condition_compilers or not cacheable:
+        return compile_condition(test, a)
+    conditions = compiled_conditions.setdefault(test, {})
+    if len(conditions) >= compiled_conditions_max_size:
+        conditions.clear()
+    # Copy lists so that the cached condition does not change if the caller modifies the argument
+    conditions[key] = compile_condition(test, list(a) if type(a) == list else a)
+    return conditions[key]
+
+
+def pass_condition_batch(values, test, a, now = None):
+    """
+    Evaluate a test case against a column of values. Numeric, date, and equality tests are vectorized with NumPy
+    when it is installed; other tests, and values NumPy cannot convert, are evaluated one by one.
+                                        .
+    :param values:                      List of values to be tested against
+    :param test:                        Name of the test case to run
+    :param a:                           Value to be tested
+    :param now:                         Reference time of age tests, defaults to a single snapshot for the batch
+
+    :return:                            Boolean mask: NumPy array if NumPy is installed, list otherwise
+    """
+    now = now or datetime.datetime.today()
+    condition = compile_condition(test, a, now)
+    if numpy is not None and test in batch_evaluators and len(values):
+        try:
+            if test in clock_tests:
+                return batch_evaluators[test](values, a, now)
+            return batch_evaluators[test](values, a)
+        except (ValueError, TypeError, OverflowError):
+            # Let the scalar path raise the same errors as pass_condition
+            pass
+    mask = [ condition(b) for b in values ]
+    return numpy.array(mask, dtype = bool) if numpy is not None else mask
+
+
+def compile_condition(test, a, now = None):
+    """
+    Compile a test case and its argument into a function that takes the value to be tested. Regexes, subnets, dates,
+    and expanded IAM actions are computed once, so the returned function can be evaluated against many values.
+                                        .
+    :param test:                        Name of the test case to run
+    :param a:                           Value to be tested
+    :param now:                         Reference time of age tests, defaults to the time of compilation
+
+    :return:                            Function that returns True if the condition is met for b, False otherwise
+    """
+    if test in condition_evaluators:
+        evaluate = condition_evaluators[test]
+        return lambda b: evaluate(b, a)
+    if test not in condition_compilers:
         printError('Error: unknown test case %s' % test)
         raise Exception
+    if test in clock_tests:
+        return condition_compilers[test](a, now or datetime.datetime.today())
+    return condition_compilers[test](a)
+
+
+def __negate(evaluate):
+    return lambda b, a: not evaluate(b, a)
+
+
+def __negate_compiler(compiler):
+    def compile_negation(a):
+        condition = compiler(a)
+        return lambda b: not condition(b)
+    return compile_negation
+
+
+# Equality tests
+def __equal(b, a):
+    return str(b) == str(a)
+
+
+# More/Less tests
+def __less_than(b, a):
+    return int(b) < int(a)
+
+
+def __less_or_equal(b, a):
+    return int(b) <= int(a)
+
+
+def __more_than(b, a):
+    return int(b) > int(a)
+
+
+def __more_or_equal(b, a):
+    return int(b) >= int(a)
+
+
+# Empty tests
+def __empty(b, a):
+    return ((type(b) == dict and b == {}) or (type(b) == list and b == []) or (type(b) == list and b == [None]))
+
+
+def __null(b, a):
+    return ((b == None) or (type(b) == str and b == 'None'))
+
+
+# Boolean tests
+def __true(b, a):
+    return str(b).lower() == 'true'
+
+
+def __false(b, a):
+    return str(b).lower() == 'false'
+
+
+# Object length tests
+def __length_less_than(b, a):
+    return len(b) < int(a)
+
+
+def __length_more_than(b, a):
+    return len(b) > int(a)
+
+
+def __length_equal(b, a):
+    return len(b) == int(a)
+
+
+# Dictionary keys tests
+def __with_key(b, a):
+    return a in b
+
+
+# List tests
+def __contain_at_least_one_of(b, a):
+    a = __listify(a)
+    for c in __listify(b):
+        if str(c) in a:
+            return True
+    return False
+
+
+def __contain_at_least_one_different_from(b, a):
+    a = __listify(a)
+    for c in __listify(b):
+        if c != None and c != '' and c not in a:
+            return True
+    return False
+
+
+def __contain_none_of(b, a):
+    a = __listify(a)
+    for c in __listify(b):
+        if c in a:
+            return False
+    return True
+
+
+# Regex tests
+def __compile_match(a):
+    regexes = [ re.compile(c) for c in __listify(a) ]
+    def condition(b):
+        b = str(b)
+        for regex in regexes:
+            if regex.match(b) != None:
+                return True
+        return False
+    return condition
+
+
+# Date tests
+def __compile_prior_to_date(a):
+    a = parse_date(a)
+    return lambda b: parse_date(b) < a
+
+
+def __compile_older_than(a, now):
+    threshold, unit = __prepare_age_test(a)
+    return lambda b: __get_age(b, unit, now) > threshold
+
+
+def __compile_newer_than(a, now):
+    threshold, unit = __prepare_age_test(a)
+    return lambda b: __get_age(b, unit, now) < threshold
+
+
+# CIDR tests
+def __compile_in_subnets(a):
+    return get_subnet_index(__listify(a)).contains
+
+
+# Policy statement tests
+def __compile_contain_action(a):
+    rule_actions = expand_actions(a)
+    return lambda b: (get_statement_actions(b) & rule_actions) != 0
+
+
+def __compile_contain_at_least_one_action(a):
+    rule_actions = [ c.lower() for c in __listify(a) ]
+    def condition(b):
+        actions = get_statement_actions(b)
+        for c in rule_actions:
+            if action_index.has_action(actions, c):
+                return True
+        return False
+    return condition
+
+
+# Policy principal tests
+def __is_account_principal(principal, account_id):
+    if principal == account_id:
+        return True
+    if not isinstance(principal, string_types):
+        # Same error as matching a regex against a non-string principal
+        raise TypeError('expected string or bytes-like object, got %s' % type(principal).__name__)
+    arn = parse_arn(principal)
+    return arn is not None and arn['partition'] == 'aws' and arn['service'] == 'iam' and arn['account'] == str(account_id)
+
+
+def __is_cross_account(b, a):
+    for c in __listify(b):
+        if not __is_account_principal(c, a):
+            return True
+    return False
+
+
+def __is_same_account(b, a):
+    for c in __listify(b):
+        if __is_account_principal(c, a):
+            return True
+    return False
+
+
+# Test cases that are cheap to evaluate from scratch, called with the value to be tested and the test's argument
+condition_evaluators = {
+    'equal': __equal,
+    'notEqual': __negate(__equal),
+    'lessThan': __less_than,
+    'lessOrEqual': __less_or_equal,
+    'moreThan': __more_than,
+    'moreOrEqual': __more_or_equal,
+    'empty': __empty,
+    'notEmpty': __negate(__empty),
+    'null': __null,
+    'notNull': __negate(__null),
+    'true': __true,
+    'notTrue': __false,
+    'false': __false,
+    'lengthLessThan': __length_less_than,
+    'lengthMoreThan': __length_more_than,
+    'lengthEqual': __length_equal,
+    'withKey': __with_key,
+    'withoutKey': __negate(__with_key),
+    'containAtLeastOneOf': __contain_at_least_one_of,
+    'containAtLeastOneDifferentFrom': __contain_at_least_one_different_from,
+    'containNoneOf': __contain_none_of,
+    'isCrossAccount': __is_cross_account,
+    'isSameAccount': __is_same_account
+}
+
+# Test cases whose argument is worth preparing once (regexes, dates, subnets, IAM actions), called with the test's
+# argument and returning a function of the value to be tested
+condition_compilers = {
+    'match': __compile_match,
+    'notMatch': __negate_compiler(__compile_match),
+    'priorToDate': __compile_prior_to_date,
+    'olderThan': __compile_older_than,
+    'newerThan': __compile_newer_than,
+    'inSubnets': __compile_in_subnets,
+    'notInSubnets': __negate_compiler(__compile_in_subnets),
+    'containAction': __compile_contain_action,
+    'notContainAction': __negate_compiler(__compile_contain_action),
+    'containAtLeastOneAction': __compile_contain_at_least_one_action
+}
+
+
+########################################
+# Vectorized test cases
+########################################
+
+__microseconds_per_day = 86400 * 1000000
+
+
+def __batch_compare(compare):
+    def evaluate(values, a):
+        values = numpy.asarray(values)
+        # Only integers are compared in bulk: casting other arrays to integers accepts values that int() rejects (NaN,
+        # infinities, strings with trailing NUL characters) and wraps around values that do not fit in 64 bits
+        if values.dtype.kind not in 'biu':
+            raise ValueError('Values are not all integers')
+        return compare(values, int(a))
+    return evaluate
+
+
+def __batch_equal(values, a):
+    # NumPy strings drop trailing NUL characters, so both sides are object arrays that compare the strings themselves
+    strings = numpy.array([ str(b) for b in values ], dtype = object)
+    a = numpy.array(str(a), dtype = object)
+    return strings == a
+
+
+def __batch_not_equal(values, a):
+    return ~__batch_equal(values, a)
+
+
+def __batch_dates(values):
+    return numpy.array([ parse_date(b) for b in values ], dtype = 'datetime64[us]')
+
+
+def __batch_ages(values, a, now):
+    threshold, unit = __prepare_age_test(a)
+    now = numpy.datetime64(now, 'us')
+    delta = (now - __batch_dates(values)).astype(numpy.int64)
+    # Same semantics as timedelta.days and timedelta.seconds
+    if unit == 'days':
+        return delta // __microseconds_per_day, threshold
+    return (delta % __microseconds_per_day) // 1000000, threshold
+
+
+def __batch_prior_to_date(values, a):
+    return __batch_dates(values) < numpy.datetime64(parse_date(a), 'us')
+
+
+def __batch_older_than(values, a, now):
+    ages, threshold = __batch_ages(values, a, now)
+    return ages > threshold
+
+
+def __batch_newer_than(values, a, now):
+    ages, threshold = __batch_ages(values, a, now)
+    return ages < threshold
+
 
-    return result
+batch_evaluators = {
+    'equal': __batch_equal,
+    'notEqual': __batch_not_equal,
+    'lessThan': __batch_compare(operator.lt),
+    'lessOrEqual': __batch_compare(operator.le),
+    'moreThan': __batch_compare(operator.gt),
+    'moreOrEqual': __batch_compare(operator.ge),
+    'priorToDate': __batch_prior_to_date,
+    'olderThan': __batch_older_than,
+    'newerThan': __batch_newer_than
+}
@@ -4,17 +4,20 @@ from __future__ import print_function
 import boto3
 import datetime
 import dateutil.parser
-import json
 import fileinput
 import os
 import re
 import requests # TODO: get rid of that and make sure urllib2 validates certs ?
 import string
+from threading import Condition, current_thread
 
 from opinel.utils.console import printException, printError, printInfo
 from opinel.utils.console import prompt_4_mfa_code
 from opinel.utils.fs import save_blob_as_json
+from opinel.utils.json_backend import json_load
 from opinel.utils.aws import connect_service
+from opinel.utils.aws_config import get_aws_config_file, invalidate_aws_config_file
+from opinel.utils.threads import thread_map
 
 
 ########################################
@@ -117,12 +120,7 @@ def get_profiles_from_aws_credentials_file(credentials_files = [aws_credentials_
     profiles = []
     for filename in credentials_files:
         if os.path.isfile(filename):
-            with open(filename) as f:
-                lines = f.readlines()
-                for line in lines:
-                    groups = re_profile_name.match(line)
-                    if groups:
-                        profiles.append(groups.groups()[0])
+            profiles += [section.header for section in get_aws_config_file(filename).sections]
     return sorted(profiles)
 
 
@@ -196,30 +194,22 @@ def read_creds_from_aws_credentials_file(profile_name, credentials_file = aws_cr
     :return:
     """
     credentials = init_creds()
-    profile_found = False
     try:
         # Make sure the ~.aws folder exists
         if not os.path.exists(aws_config_dir):
             os.makedirs(aws_config_dir)
-        with open(credentials_file, 'rt') as cf:
-            for line in cf:
-                profile_line = re_profile_name.match(line)
-                if profile_line:
-                    if profile_line.groups()[0] == profile_name:
-                        profile_found = True
-                    else:
-                        profile_found = False
-                if profile_found:
-                    if re_access_key.match(line):
-                        credentials['AccessKeyId'] = line.split("=")[1].strip()
-                    elif re_secret_key.match(line):
-                        credentials['SecretAccessKey'] = line.split("=")[1].strip()
-                    elif re_mfa_serial.match(line):
-                        credentials['SerialNumber'] = (line.split('=')[1]).strip()
-                    elif re_session_token.match(line) or re_security_token.match(line):
-                        credentials['SessionToken'] = ('='.join(x for x in line.split('=')[1:])).strip()
-                    elif re_expiration.match(line):
-                        credentials['Expiration'] = ('='.join(x for x in line.split('=')[1:])).strip()
+        for section in get_aws_config_file(credentials_file).get_sections(profile_name):
+            for attribute, value in section.attributes.items():
+                if re_access_key.match(attribute):
+                    credentials['AccessKeyId'] = value
+                elif re_secret_key.match(attribute):
+                    credentials['SecretAccessKey'] = value
+                elif re_mfa_serial.match(attribute):
+                    credentials['SerialNumber'] = value
+                elif re_session_token.match(attribute) or re_security_token.match(attribute):
+                    credentials['SessionToken'] = value
+                elif re_expiration.match(attribute):
+                    credentials['Expiration'] = value
     except Exception as e:
         # Silent if error is due to no ~/.aws/credentials file
         if not hasattr(e, 'errno') or e.errno != 2:
@@ -330,27 +320,18 @@ def read_profile_from_aws_config_file(profile_name, config_file = aws_config_fil
     role_arn = None
     source_profile = 'default'
     mfa_serial = None
-    profile_found = False
     external_id = None
     try:
-        with open(config_file, 'rt') as config:
-            for line in config:
-                profile_line = re_profile_name.match(line)
-                if profile_line:
-                    role_profile_name = profile_line.groups()[0].split()[-1]
-                    if role_profile_name == profile_name:
-                        profile_found = True
-                    else:
-                        profile_found = False
-                if profile_found:
-                    if re_role_arn.match(line):
-                        role_arn = line.split('=')[1].strip()
-                    elif re_source_profile.match(line):
-                        source_profile = line.split('=')[1].strip()
-                    elif re_mfa_serial.match(line):
-                        mfa_serial = line.split('=')[1].strip()
-                    elif re_external_id.match(line):
-                        external_id = line.split('=')[1].strip()
+        for section in get_aws_config_file(config_file).get_profile_sections(profile_name):
+            for attribute, value in section.attributes.items():
+                if re_role_arn.match(attribute):
+                    role_arn = value
+                elif re_source_profile.match(attribute):
+                    source_profile = value
+                elif re_mfa_serial.match(attribute):
+                    mfa_serial = value
+                elif re_external_id.match(attribute):
+                    external_id = value
     except Exception as e:
         # Silent if error is due to no .aws/config file
         if not hasattr(e, 'errno') or e.errno != 2:
@@ -435,6 +416,7 @@ def write_creds_to_aws_credentials_file(profile_name, credentials, credentials_f
             f.write('aws_access_key_id = %s\n' % credentials['AccessKeyId'])
             f.write('aws_secret_access_key = %s\n' % credentials['SecretAccessKey'])
             complete_profile(f, credentials, session_token_written, mfa_serial_written)
+    invalidate_aws_config_file(credentials_file)
 
 
 def complete_profile(f, credentials, session_token_written, mfa_serial_written):
@@ -460,7 +442,7 @@ def complete_profile(f, credentials, session_token_written, mfa_serial_written):
 
 
 def read_creds(profile_name, csv_file = None, mfa_serial_arg = None, mfa_code = None, force_init = False,
-               role_session_name = 'opinel'):
+               role_session_name = 'opinel', credentials_memo = None):
     """
     Read credentials from anywhere (CSV, Environment, Instance metadata, config/credentials)
 
@@ -470,6 +452,7 @@ def read_creds(profile_name, csv_file = None, mfa_serial_arg = None, mfa_code =
     :param mfa_code:
     :param force_init:
     :param role_session_name:
+    :param credentials_memo:            CredentialsMemo that source profiles are read from, if any
 
     :return:
     """
@@ -509,7 +492,7 @@ def read_creds(profile_name, csv_file = None, mfa_serial_arg = None, mfa_code =
             try:
                 cached_credentials_filename = get_cached_credentials_filename(profile_name, role_arn)
                 with open(cached_credentials_filename, 'rt') as f:
-                    assume_role_data = json.load(f)
+                    assume_role_data = json_load(f)
                     oldcred = credentials
                     credentials = assume_role_data['Credentials']
                     expiration = dateutil.parser.parse(credentials['Expiration'])
@@ -522,7 +505,8 @@ def read_creds(profile_name, csv_file = None, mfa_serial_arg = None, mfa_code =
                 pass
             if not expiration or expiration < current or credentials['AccessKeyId'] == None:
                 if source_profile:
-                    credentials = read_creds(source_profile)
+                    credentials = credentials_memo.get(source_profile) if credentials_memo else \
+                        read_creds(source_profile)
                 if role_mfa_serial:
                     credentials['SerialNumber'] = role_mfa_serial
                     # Auto prompt for a code...
@@ -567,3 +551,100 @@ def read_creds(profile_name, csv_file = None, mfa_serial_arg = None, mfa_code =
     if not 'AccessKeyId' in credentials:
         credentials = { 'AccessKeyId': None }
     return credentials
+
+
+########################################
+# Multiple profiles
+########################################
+
+class CredentialsMemo(object):
+    """
+    Credentials read once per profile and shared between threads, so that profiles assuming roles from the same
+    source profile load its credentials (and assume its own role, if any) only once
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.credentials = {}
+        # Profile name to the thread reading it, thread to the profiles it is reading (each one the source profile of
+        # the previous one), and thread to the profile it waits for
+        self.readers = {}
+        self.reading = {}
+        self.waiting = {}
+
+
+    def get(self, profile_name):
+        """
+        Return a copy of a profile's credentials, reading them with read_creds() on first use. Concurrent callers
+        wait for the first one to finish. Raises an exception if profiles are one another's source profile.
+
+        :param profile_name:            Name of the profile
+
+        :return:                        Credentials dictionary
+        """
+        thread = current_thread()
+        with self.condition:
+            while profile_name in self.readers:
+                self.__check_cycle(profile_name, thread)
+                self.waiting[thread] = profile_name
+                self.condition.wait()
+                del self.waiting[thread]
+            credentials = self.credentials.get(profile_name)
+            if credentials is None:
+                self.readers[profile_name] = thread
+                self.reading.setdefault(thread, []).append(profile_name)
+        if credentials is None:
+            try:
+                credentials = read_creds(profile_name, credentials_memo = self)
+            finally:
+                with self.condition:
+                    del self.readers[profile_name]
+                    self.reading[thread].pop()
+                    if not self.reading[thread]:
+                        del self.reading[thread]
+                    if credentials is not None:
+                        self.credentials[profile_name] = credentials
+                    self.condition.notify_all()
+        # Callers add the MFA serial, token code, or external ID of their role
+        return dict(credentials)
+
+
+    def __check_cycle(self, profile_name, thread):
+        # Follow the source profiles from profile_name, across the threads reading them: waiting would deadlock if
+        # they lead back to a profile read by this thread
+        chain = []
+        source_profile = profile_name
+        while source_profile in self.readers:
+            reader = self.readers[source_profile]
+            profiles = self.reading[reader]
+            chain += profiles[profiles.index(source_profile):]
+            if reader == thread:
+                raise Exception('Error: cyclic source_profile, %s' % ' -> '.join(chain + [ profile_name ]))
+            source_profile = self.waiting.get(reader)
+
+
+def read_creds_for_profiles(profile_names, max_workers = 10, timeout = None, **kwargs):
+    """
+    Read credentials for several profiles concurrently. Source profiles shared by several roles are read once.
+    Roles that require MFA prompt for a code unless mfa_code is set, so interactive use should keep max_workers at 1.
+
+    :param profile_names:               List of profile names
+    :param max_workers:                 Maximum number of profiles resolved at once
+    :param timeout:                     Maximum number of seconds to wait
+    :param kwargs:                      Other arguments of read_creds(), passed for every profile
+
+    :return:                            Dictionary of profile name to credentials. Profiles that failed or timed out
+                                        map to { 'AccessKeyId': None }.
+    """
+    memo = CredentialsMemo()
+    def worker(profile_name, params):
+        if params:
+            return read_creds(profile_name, credentials_memo = memo, **params)
+        # Profiles read with default arguments may also be the source of another one
+        return memo.get(profile_name)
+    credentials = {}
+    for task in thread_map(sorted(set(profile_names)), worker, kwargs, max_workers, timeout):
+        if task.exception:
+            printException(task.exception)
+        credentials[task.target] = task.result if task.status == 'done' else { 'AccessKeyId': None }
+    return credentials
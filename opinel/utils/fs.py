@@ -1,53 +1,104 @@
 # -*- coding: utf-8 -*-
 from __future__ import print_function
 
+from contextlib import contextmanager
+import csv
 import datetime
-import json
+import errno
+import mmap
+import netaddr
 import os
+from threading import Lock
+import uuid
 import yaml
 
+from opinel.utils.cache import LRUCache, copy_tree
+from opinel.utils.cidr import SubnetIndex, encode_cidr
+from opinel.utils.columns import columnar_extensions, get_columnar_format, get_default_columnar_format, \
+    read_columns, write_columns
 from opinel.utils.console import printError, printException, prompt_4_overwrite
-from opinel.utils.conditions import pass_condition
+from opinel.utils.compression import CompressedWriter, compression_extensions, get_compression, is_ndjson_file, \
+    open_compressed
+from opinel.utils.conditions import compile_condition
+from opinel.utils.json_backend import CustomJSONEncoder, get_json_backend, get_key_separator, json_dumps, json_load, \
+    json_loads
+from opinel.utils.json_stream import iter_json_items
 
 
+data_cache = LRUCache(max_size = 256)
 
-class CustomJSONEncoder(json.JSONEncoder):
-    """
-    JSON encoder class
-    """
-    def default(self, o):
-        if type(o) == datetime.datetime:
-            return str(o)
-        else:
-            return o.__dict__
+ip_ranges_stores = LRUCache(max_size = 32)
+
+__data_dir = None
+
+json_write_buffer_size = 1024 * 1024
 
 
-def load_data(data_file, key_name = None, local_file = False, format = 'json'):
+
+def load_data(data_file, key_name = None, local_file = False, format = 'json', streaming = False):
     """
-    Load a JSON data file
+    Load a JSON data file. Opinel's own data files (local_file = False) are loaded once per process and each call
+    returns a copy, see invalidate_data_cache(). Files with a .gz or .zst extension are decompressed, and .ndjson or
+    .jsonl files are loaded as the list of their lines' values.
 
     :param data_file:
     :param key_name:
     :param local_file:
+    :param format:
+    :param streaming:                   True to return a generator over the array (or the object's items) found at
+                                        key_name instead of loading the whole file, see stream_data()
     :return:
     """
+    if streaming and format == 'json':
+        return stream_data(data_file, key_name, local_file)
+    src_file = get_data_file_path(data_file, local_file)
     if local_file:
-        if data_file.startswith('/'):
-            src_file = data_file
-        else:
-            src_dir = os.getcwd()
-            src_file = os.path.join(src_dir, data_file)
-    else:
-        src_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data')
-        if not os.path.isdir(src_dir):
-            src_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data')
-        src_file = os.path.join(src_dir, data_file)
-    with open(src_file) as f:
+        return __load_data_file(src_file, key_name, format)
+    stat = os.stat(src_file)
+    key = (src_file, key_name, format, getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size)
+    data = data_cache.get(key)
+    if data is None:
+        data = __load_data_file(src_file, key_name, format)
+        if data is not None:
+            data_cache.set(key, data)
+    # Callers may modify the data they load
+    return copy_tree(data)
+
+
+def invalidate_data_cache(data_file = None):
+    """
+    Drop cached data files
+
+    :param data_file:                   Name of one of opinel's data files, defaults to all files
+
+    :return:                            Number of cache entries dropped
+    """
+    if data_file is None:
+        return data_cache.invalidate()
+    src_file = get_data_file_path(data_file)
+    return data_cache.invalidate(lambda key: key[0] == src_file)
+
+
+def __load_data_file(src_file, key_name, format):
+    if format == 'json' and is_ndjson_file(src_file):
+        format = 'ndjson'
+    if format == 'json' and get_json_backend() == 'orjson' and not get_compression(src_file):
+        # orjson parses the mapped file in place, without reading it into a string first
+        with map_file(src_file) as buffer:
+            view = memoryview(buffer)
+            try:
+                data = json_loads(view)
+            finally:
+                view.release()
+        return data[key_name] if key_name else data
+    with open_compressed(src_file) as f:
         if format == 'json':
-            data = json.load(f)
+            data = json_load(f)
+        elif format == 'ndjson' and not key_name:
+            data = [ json_loads(line) for line in f if line.strip() ]
         elif format == 'yaml':
             data = yaml.load(f)
-        elif format not in ['json', 'yaml'] and not key_name:
+        elif format not in ['json', 'ndjson', 'yaml'] and not key_name:
             data = f.read()
         else:
             printError('Error, argument \'key_name\' may not be used with data in %s format.' % format)
@@ -57,6 +108,172 @@ def load_data(data_file, key_name = None, local_file = False, format = 'json'):
     return data
 
 
+def stream_data(data_file, key_name = None, local_file = False, chunk_size = 65536):
+    """
+    Lazily load the elements of an array, or the (key, value) pairs of an object, from a JSON data file. Values that
+    are not on the key path are skipped without being decoded, so memory use does not grow with the size of the file.
+    Compressed files are decompressed on the fly, and NDJSON files yield the value of each line.
+
+    :param data_file:                   Name of the data file
+    :param key_name:                    Key, or list of keys, leading to the array or object from the document's root
+    :param local_file:                  True if the file is relative to the working directory
+    :param chunk_size:                  Number of characters read at a time
+
+    :return:                            Generator
+    """
+    if key_name is None:
+        key_path = []
+    else:
+        key_path = key_name if type(key_name) == list else [ key_name ]
+    src_file = get_data_file_path(data_file, local_file)
+    with open_compressed(src_file) as f:
+        if is_ndjson_file(src_file):
+            for line in f:
+                if line.strip():
+                    yield json_loads(line)
+        else:
+            for item in iter_json_items(f, key_path, chunk_size):
+                yield item
+
+
+def get_data_file_path(data_file, local_file = False):
+    """
+    Resolve the path of a data file
+
+    :param data_file:                   Name of the data file
+    :param local_file:                  True if the file is relative to the working directory, False if it is one of
+                                        opinel's data files
+
+    :return:                            Path of the data file
+    """
+    if local_file:
+        if data_file.startswith('/'):
+            return data_file
+        return os.path.join(os.getcwd(), data_file)
+    global __data_dir
+    if __data_dir is None:
+        src_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'data')
+        if not os.path.isdir(src_dir):
+            src_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../data')
+        __data_dir = src_dir
+    return os.path.join(__data_dir, data_file)
+
+
+class IPRangesStore(object):
+    """
+    In-memory copy of an ip-ranges file. Prefixes are indexed by the value of their attributes for equality
+    conditions, filtered views are computed once per set of conditions, and a subnet index answers which prefixes
+    contain an IP address. Indexes are built on first use.
+    """
+
+    def __init__(self, data, stat_key = None):
+        self.stat_key = stat_key
+        self.source = data.get('source')
+        self.source_local_file = data['local_file'] if 'local_file' in data else False
+        self.conditions = data.get('conditions', [])
+        self.prefixes = data['prefixes'] if self.source is None else []
+        self.indexes = {}
+        self.views = LRUCache(max_size = 64)
+        self.subnet_index = None
+        self.lock = Lock()
+
+
+    def filter(self, conditions = [], ip_only = False):
+        """
+        Return the prefixes that meet all conditions, in file order
+
+        :param conditions:              List of [ attribute, test, value ] conditions
+        :param ip_only:                 True to return the list of IP prefixes only
+
+        :return:                        List of copies of the matching prefixes, or of IP prefix strings
+        """
+        try:
+            key = json_dumps(conditions)
+        except TypeError:
+            key = None
+        positions = self.views.get(key) if key else None
+        if positions is None:
+            positions = self.__filter(conditions)
+            if key:
+                self.views.set(key, positions)
+        if ip_only:
+            return [ self.prefixes[i]['ip_prefix'] for i in positions ]
+        return [ dict(self.prefixes[i]) for i in positions ]
+
+
+    def lookup(self, ip):
+        """
+        Return the prefixes that contain an IP address or CIDR
+
+        :param ip:                      IP address or CIDR string
+
+        :return:                        List of copies of the matching prefixes, most specific first
+        """
+        with self.lock:
+            if self.subnet_index is None:
+                self.subnet_index = SubnetIndex([ prefix['ip_prefix'] for prefix in self.prefixes ],
+                                                range(len(self.prefixes)))
+        return [ dict(self.prefixes[i]) for i in self.subnet_index.lookup(ip) ]
+
+
+    def __filter(self, conditions):
+        # Conditions are evaluated in order and the first failed one skips the others, so that prefixes that lack an
+        # attribute raise a KeyError in the same cases as a scan
+        candidates = None
+        for condition in conditions:
+            if type(condition) != list or len(condition) < 3:
+                continue
+            index = self.__get_index(condition[0]) if condition[1] == 'equal' else None
+            if index is not None:
+                matches = index.get(str(condition[2]), [])
+                if candidates is None:
+                    candidates = matches
+                else:
+                    matches = set(matches)
+                    candidates = [ i for i in candidates if i in matches ]
+            else:
+                test = compile_condition(condition[1], condition[2])
+                if candidates is None:
+                    candidates = range(len(self.prefixes))
+                candidates = [ i for i in candidates if test(self.prefixes[i][condition[0]]) ]
+        return list(range(len(self.prefixes))) if candidates is None else list(candidates)
+
+
+    def __get_index(self, attribute):
+        with self.lock:
+            if attribute not in self.indexes:
+                index = {}
+                for i, prefix in enumerate(self.prefixes):
+                    if attribute not in prefix:
+                        index = None
+                        break
+                    index.setdefault(str(prefix[attribute]), []).append(i)
+                self.indexes[attribute] = index
+            return self.indexes[attribute]
+
+
+def get_ip_ranges_store(filename, local_file = True):
+    """
+    Return the in-memory store of an ip-ranges file, (re)loading it when the file is new or its modification time or
+    size changed
+
+    :param filename:                    Name of the ip-ranges file
+    :param local_file:                  True if the file is relative to the working directory
+
+    :return:                            IPRangesStore
+    """
+    src_file = get_data_file_path(filename, local_file)
+    stat = os.stat(src_file)
+    stat_key = (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size)
+    store = ip_ranges_stores.get(src_file)
+    if store is None or store.stat_key != stat_key:
+        data = load_data(src_file, local_file = True)
+        # NDJSON files list the prefixes, one per line
+        store = IPRangesStore(data if type(data) == dict else {'prefixes': data}, stat_key)
+        ip_ranges_stores.set(src_file, store)
+    return store
+
+
 def read_ip_ranges(filename, local_file = True, ip_only = False, conditions = []):
     """
     Returns the list of IP prefixes from an ip-ranges file
@@ -67,33 +284,12 @@ def read_ip_ranges(filename, local_file = True, ip_only = False, conditions = []
     :param ip_only:
     :return:
     """
-    targets = []
-    data = load_data(filename, local_file = local_file)
-    if 'source' in data:
+    store = get_ip_ranges_store(filename, local_file)
+    if store.source:
         # Filtered IP ranges
-        conditions = data['conditions']
-        local_file = data['local_file'] if 'local_file' in data else False
-        data = load_data(data['source'], local_file = local_file, key_name = 'prefixes')
-    else:
-        # Plain IP ranges
-        data = data['prefixes']
-    for d in data:
-        condition_passed = True
-        for condition in conditions:
-            if type(condition) != list or len(condition) < 3:
-                continue
-            condition_passed = pass_condition(d[condition[0]], condition[1], condition[2])
-            if not condition_passed:
-                break
-        if condition_passed:
-            targets.append(d)
-    if ip_only:
-        ips = []
-        for t in targets:
-            ips.append(t['ip_prefix'])
-        return ips
-    else:
-        return targets
+        conditions = store.conditions
+        store = get_ip_ranges_store(store.source, store.source_local_file)
+    return store.filter(conditions, ip_only)
 
 
 def read_file(file_path, mode = 'rt'):
@@ -110,27 +306,256 @@ def read_file(file_path, mode = 'rt'):
     return contents
 
 
-def save_blob_as_json(filename, blob, force_write, debug):
+@contextmanager
+def map_file(file_path):
+    """
+    Memory-map a file for reading. The mapping is a read-only, bytes-like buffer backed by the page cache, so it is
+    shared by all the processes that map the same file; regexes with bytes patterns and orjson (through a memoryview)
+    consume it without copying it. Memoryviews of the mapping must be released before the block ends.
+
+    :param file_path:                   Path of the file to be mapped
+
+    :return:                            mmap.mmap, or b'' for empty files, which cannot be mapped
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            yield buffer
+        finally:
+            buffer.close()
+
+
+def save_blob_as_json(filename, blob, force_write, debug, output_format = 'json', compression = None):
     """
-    Creates/Modifies file and saves python object as JSON
+    Creates/Modifies file and saves python object as JSON. Compact output comes from the selected JSON library (see
+    set_json_backend()), so the data is the same with every library but whitespace and the escaping of non-ASCII
+    characters are not: compare parsed files rather than their bytes.
 
     :param filename:
     :param blob:
     :param force_write:
     :param debug:
+    :param output_format:               json, or ndjson to write one value per line (see write_ndjson())
+    :param compression:                 None, gzip, or zstd. The matching extension is appended to the file name.
 
-    :return:
+    :return:                            Name of the file
     """
+    filename = get_output_filename(filename, output_format, compression)
     try:
         if prompt_4_overwrite(filename, force_write):
-            with open(filename, 'wt') as f:
-                print('%s' % json.dumps(blob, indent=4 if debug else None, separators=(',', ': '), sort_keys=True, cls=CustomJSONEncoder), file=f)
+            with open_output_file(filename, compression) as f:
+                if output_format == 'ndjson':
+                    write_ndjson(f, blob)
+                else:
+                    write_json(f, blob, indent = 4 if debug else None)
+                    f.write('\n')
     except Exception as e:
         printException(e)
         pass
+    return filename
+
+
+def save_blob_as_columns(filename, records, force_write, format = None, columns = None):
+    """
+    Creates/Modifies a columnar file (Arrow IPC or Parquet with pyarrow, a directory of .npy files with NumPy only)
+    that can be memory-mapped with load_columns()
+
+    :param filename:                    Name of the file, the format's extension is appended if missing
+    :param records:                     Iterable of dictionaries, one per row
+    :param force_write:                 Skip confirmation prompt if the file exists
+    :param format:                      arrow, parquet, or npy. Defaults to the best format supported.
+    :param columns:                     Names of the columns to keep, defaults to all keys
+
+    :return:                            Name of the file
+    """
+    format = format or get_columnar_format(filename) or get_default_columnar_format()
+    if not filename.endswith(columnar_extensions[format]):
+        filename += columnar_extensions[format]
+    try:
+        if prompt_4_overwrite(filename, force_write):
+            write_columns(filename, records, format, columns)
+    except Exception as e:
+        printException(e)
+        pass
+    return filename
+
+
+def load_columns(data_file, local_file = True, columns = None):
+    """
+    Memory-map a columnar file written by save_blob_as_columns()
+
+    :param data_file:                   Name of the file
+    :param local_file:                  True if the file is relative to the working directory
+    :param columns:                     Names of the columns to load, defaults to all columns
+
+    :return:                            pyarrow.Table for Arrow and Parquet files, OrderedDict of column name to NumPy
+                                        array for .npy directories
+    """
+    return read_columns(get_data_file_path(data_file, local_file), columns)
+
+
+def get_output_filename(filename, output_format = 'json', compression = None):
+    """
+    Adjust the extension of an output file to its format and compression
+
+    :param filename:                    Name of the file
+    :param output_format:               json, ndjson, or csv
+    :param compression:                 None, gzip, or zstd
+
+    :return:                            Name of the file
+    """
+    if output_format == 'ndjson' and filename.endswith('.json'):
+        filename = '%s.ndjson' % filename[:-len('.json')]
+    if compression and not filename.endswith(compression_extensions[compression]):
+        filename += compression_extensions[compression]
+    return filename
 
 
-def save_ip_ranges(profile_name, prefixes, force_write, debug, output_format = 'json'):
+@contextmanager
+def open_output_file(filename, compression = None):
+    """
+    Open an output file for writing text atomically (see atomic_write()), compressing it on a background thread
+
+    :param filename:                    Path of the file
+    :param compression:                 None, gzip, or zstd
+
+    :return:                            File object
+    """
+    if not compression:
+        with atomic_write(filename) as f:
+            yield f
+        return
+    with atomic_write(filename, 'wb') as f:
+        writer = CompressedWriter(f, compression)
+        try:
+            yield writer
+        finally:
+            writer.close()
+
+
+def write_ndjson(f, blob):
+    """
+    Write a python object as line-delimited JSON: one line per element of a list or iterator, or one single-key
+    object per item of a dictionary
+
+    :param f:                           File object opened in text mode
+    :param blob:                        List, iterator, or dictionary
+
+    :return:                            None
+    """
+    records = ({key: value} for key, value in sorted(blob.items())) if type(blob) == dict else blob
+    for record in records:
+        f.write(json_dumps(record))
+        f.write('\n')
+
+
+def write_json(f, blob, indent = None, max_depth = 4):
+    """
+    Write a python object as JSON to a file, in chunks, with the same output as json_dumps(blob, indent = indent).
+    Without indentation, the top levels of nested dictionaries and lists are walked here and each value below is
+    serialized on its own with the selected JSON library, so that the whole document never has to be held in memory
+    as a single string.
+
+    :param f:                           File object opened in text mode
+    :param blob:                        Object to serialize
+    :param indent:                      Indentation, None for compact output
+    :param max_depth:                   Number of nesting levels walked before handing values to the encoder
+
+    :return:                            None
+    """
+    if indent is not None:
+        chunks = CustomJSONEncoder(indent = indent, separators = (',', ': '), sort_keys = True).iterencode(blob)
+    else:
+        if get_json_backend() == 'json':
+            encode = CustomJSONEncoder(separators = (',', ': '), sort_keys = True).encode
+        else:
+            encode = json_dumps
+        chunks = __iterencode(encode, get_key_separator(), blob, max_depth)
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= json_write_buffer_size:
+            f.write(''.join(buffer))
+            buffer = []
+            size = 0
+    f.write(''.join(buffer))
+
+
+def __iterencode(encode, key_separator, o, depth):
+    if depth and type(o) == dict and o and all(type(key) == str for key in o):
+        separator = '{'
+        for key, value in sorted(o.items()):
+            yield separator + encode(key) + key_separator
+            for chunk in __iterencode(encode, key_separator, value, depth - 1):
+                yield chunk
+            separator = ','
+        yield '}'
+    elif depth and type(o) == list and o:
+        separator = '['
+        for value in o:
+            yield separator
+            for chunk in __iterencode(encode, key_separator, value, depth - 1):
+                yield chunk
+            separator = ','
+        yield ']'
+    else:
+        yield encode(o)
+
+
+@contextmanager
+def atomic_write(filename, mode = 'wt'):
+    """
+    Open a temporary file next to the destination and move it over the destination once it has been written, so that
+    readers never see a partially written file. The temporary file is removed if an exception is raised.
+
+    :param filename:                    Path of the destination file
+    :param mode:                        Write mode, text or binary
+
+    :return:                            File object
+    """
+    fd, tmp_filename = __open_temp_file(filename)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        file_mode = __get_file_mode(filename)
+        if file_mode is not None:
+            os.chmod(tmp_filename, file_mode)
+        getattr(os, 'replace', os.rename)(tmp_filename, filename)
+    except:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+def __open_temp_file(filename):
+    # Create the file with the same default mode as open(), letting the kernel apply the umask
+    directory, basename = os.path.split(os.path.abspath(filename))
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmp_filename = os.path.join(directory, '.%s.%s.tmp' % (basename, uuid.uuid4().hex[:8]))
+        try:
+            return os.open(tmp_filename, flags, 0o666), tmp_filename
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def __get_file_mode(filename):
+    # Permissions of the file being replaced, None if it does not exist
+    try:
+        return os.stat(filename).st_mode & 0o777
+    except OSError:
+        return None
+
+
+def save_ip_ranges(profile_name, prefixes, force_write, debug, output_format = 'json', compression = None):
     """
     Creates/Modifies an ip-range-XXX.json file
 
@@ -138,27 +563,61 @@ def save_ip_ranges(profile_name, prefixes, force_write, debug, output_format = '
     :param prefixes:
     :param force_write:
     :param debug:
+    :param output_format:               json, ndjson (one prefix per line), csv, or one of the columnar formats of
+                                        save_blob_as_columns(): arrow, parquet, or npy
+    :param compression:                 None, gzip, or zstd. Not applicable to columnar formats.
 
     :return:
     """
     filename = 'ip-ranges-%s.json' % profile_name
-    ip_ranges = {}
-    ip_ranges['createDate'] = datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
-    # Unique prefixes
-    unique_prefixes = {}
-    for prefix in prefixes:
-        if type(prefix) == dict:
-            unique_prefixes[prefix['ip_prefix']] = prefix
-        else:
-            unique_prefixes[prefix] = {'ip_prefix': prefix}
-    unique_prefixes = list(unique_prefixes.values())
-    ip_ranges['prefixes'] = unique_prefixes
+    unique_prefixes = iter_unique_prefixes(prefixes)
     if output_format == 'json':
-        save_blob_as_json(filename, ip_ranges, force_write, debug)
+        ip_ranges = {}
+        ip_ranges['createDate'] = datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+        ip_ranges['prefixes'] = list(unique_prefixes)
+        save_blob_as_json(filename, ip_ranges, force_write, debug, compression = compression)
+    elif output_format == 'ndjson':
+        save_blob_as_json(filename, unique_prefixes, force_write, debug, 'ndjson', compression)
+    elif output_format in columnar_extensions:
+        save_blob_as_columns('ip-ranges-%s' % profile_name, unique_prefixes, force_write, output_format)
     else:
-        # Write as CSV
-        output = 'account_id, region, ip, instance_id, instance_name\n'
-        for prefix in unique_prefixes:
-            output += '%s, %s, %s, %s, %s\n' % (prefix['account_id'], prefix['region'], prefix['ip_prefix'], prefix['instance_id'], prefix['name'])
-        with open('ip-ranges-%s.csv' % profile_name, 'wt') as f:
-            f.write(output)
+        with open_output_file(get_output_filename('ip-ranges-%s.csv' % profile_name, 'csv', compression), compression) as f:
+            write_ip_ranges_csv(f, unique_prefixes)
+
+
+def iter_unique_prefixes(prefixes):
+    """
+    Deduplicate IP prefixes as they are consumed; the first occurrence of each prefix is kept
+
+    :param prefixes:                    Iterable of IP prefix strings or of dictionaries with an ip_prefix key
+
+    :return:                            Generator of dictionaries with an ip_prefix key
+    """
+    seen = set()
+    for prefix in prefixes:
+        if not isinstance(prefix, dict):
+            prefix = {'ip_prefix': prefix}
+        try:
+            key = encode_cidr(prefix['ip_prefix'])
+        except (netaddr.AddrFormatError, ValueError, TypeError):
+            key = prefix['ip_prefix']
+        if key not in seen:
+            seen.add(key)
+            yield prefix
+
+
+def write_ip_ranges_csv(f, prefixes):
+    """
+    Write IP prefixes as CSV, one row at a time
+
+    :param f:                           File object opened in text mode
+    :param prefixes:                    Iterable of dictionaries with an ip_prefix key and, optionally, account_id,
+                                        region, instance_id, and name keys
+
+    :return:                            None
+    """
+    writer = csv.writer(f, lineterminator = '\n')
+    writer.writerow(['account_id', 'region', 'ip', 'instance_id', 'instance_name'])
+    for prefix in prefixes:
+        writer.writerow([prefix.get('account_id', ''), prefix.get('region', ''), prefix['ip_prefix'],
+                         prefix.get('instance_id', ''), prefix.get('name', '')])
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+json_backends = ['orjson', 'ujson', 'json']
+
+__backend = None
+
+
+
+class CustomJSONEncoder(json.JSONEncoder):
+    """
+    JSON encoder class
+    """
+    def default(self, o):
+        return json_default(o)
+
+
+def json_default(o):
+    """
+    Serialize objects that JSON does not support: datetimes as str(datetime), other objects as their attributes
+
+    :param o:                           Object to serialize
+
+    :return:                            JSON-serializable value
+    """
+    if type(o) == datetime.datetime:
+        return str(o)
+    else:
+        return o.__dict__
+
+
+########################################
+# Backend selection
+########################################
+
+def get_json_backend():
+    """
+    Return the name of the JSON library in use
+
+    :return:                            orjson, ujson, or json
+    """
+    if __backend is None:
+        set_json_backend()
+    return __backend
+
+
+def set_json_backend(name = None):
+    """
+    Select the JSON library used by opinel
+
+    :param name:                        orjson, ujson, or json. Defaults to the fastest installed library.
+
+    :return:                            Name of the selected library
+    """
+    global __backend
+    modules = {'orjson': orjson, 'ujson': ujson, 'json': json}
+    if name is None:
+        name = [backend for backend in json_backends if modules[backend] is not None][0]
+    elif name not in modules:
+        raise Exception('Unknown JSON backend %s' % name)
+    elif modules[name] is None:
+        raise Exception('JSON backend %s is not installed' % name)
+    __backend = name
+    return name
+
+
+def get_key_separator():
+    """
+    Return the separator between keys and values in the compact output of json_dumps()
+
+    :return:                            ': ' with the json library, ':' with faster libraries
+    """
+    return ': ' if get_json_backend() == 'json' else ':'
+
+
+########################################
+# Serialization
+########################################
+
+def json_dumps(o, indent = None, sort_keys = True):
+    """
+    Serialize an object to a JSON string with the selected library. All libraries produce the same data, with
+    datetimes and objects serialized by json_default(); only whitespace and the escaping of non-ASCII characters differ.
+    Indented output, and objects holding NaN or infinite floats (which orjson writes as null), always come from the
+    json library, so that they do not depend on the installed libraries.
+
+    :param o:                           Object to serialize
+    :param indent:                      Indentation, None for compact output
+    :param sort_keys:                   True to sort the keys of dictionaries
+
+    :return:                            JSON string
+    """
+    backend = get_json_backend()
+    if indent is None and backend != 'json':
+        try:
+            if backend == 'orjson':
+                options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                if sort_keys:
+                    options |= orjson.OPT_SORT_KEYS
+                s = orjson.dumps(o, default = json_default, option = options).decode('utf-8')
+            else:
+                s = ujson.dumps(o, sort_keys = sort_keys, default = json_default, escape_forward_slashes = False)
+            # Only look for non-finite floats when the output may hold one
+            if not ('null' in s or 'NaN' in s or 'Inf' in s) or not __has_non_finite_float(o):
+                return s
+        except (TypeError, ValueError, OverflowError):
+            # Out-of-range integers and other values the library rejects
+            pass
+    return json.dumps(o, indent = indent, separators = (',', ': '), sort_keys = sort_keys, cls = CustomJSONEncoder)
+
+
+def __has_non_finite_float(o):
+    # Walk the values that json_dumps() serializes, including the attributes of objects (see json_default())
+    if isinstance(o, float):
+        return math.isnan(o) or math.isinf(o)
+    elif isinstance(o, dict):
+        return any(__has_non_finite_float(value) for value in o.values())
+    elif isinstance(o, (list, tuple)):
+        return any(__has_non_finite_float(value) for value in o)
+    elif hasattr(o, '__dict__') and type(o) != datetime.datetime:
+        return __has_non_finite_float(o.__dict__)
+    return False
+
+
+def json_loads(s):
+    """
+    Parse a JSON string with the selected library
+
+    :param s:                           JSON string, bytes, or memoryview (e.g. of a memory-mapped file, which orjson
+                                        parses without copying it)
+
+    :return:                            Parsed object
+    """
+    backend = get_json_backend()
+    if type(s) == memoryview and backend != 'orjson':
+        s = s.tobytes()
+    try:
+        if backend == 'orjson':
+            return orjson.loads(s)
+        elif backend == 'ujson':
+            return ujson.loads(s)
+    except ValueError:
+        # Out-of-range numbers; invalid documents raise again below
+        pass
+    if type(s) == memoryview:
+        s = s.tobytes()
+    if type(s) == bytes:
+        s = s.decode('utf-8')
+    return json.loads(s)
+
+
+def json_load(f):
+    """
+    Parse a JSON file with the selected library
+
+    :param f:                           File object
+
+    :return:                            Parsed object
+    """
+    return json_loads(f.read())
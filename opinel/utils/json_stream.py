@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import json
+import re
+
+
+whitespace_regex = re.compile(r'[ \t\n\r]*')
+
+container_regex = re.compile(r'[\[\]{}"]')
+
+string_regex = re.compile(r'["\\]')
+
+try:
+    # Python2
+    number_types = (int, long, float)
+except NameError:
+    # Python3
+    number_types = (int, float)
+
+
+
+class JSONStreamReader(object):
+    """
+    Incremental JSON reader that walks down a key path and decodes the values it finds there one at a time. The file
+    is read in chunks and values outside of the key path are skipped without being decoded, so memory use depends on
+    the size of the largest value returned rather than on the size of the file.
+    """
+
+    def __init__(self, f, chunk_size = 65536):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+
+    def iter_items(self, key_path = []):
+        """
+        Yield the elements of the array, or the (key, value) pairs of the object, found at a key path
+
+        :param key_path:                List of keys leading to the value, from the document's root
+
+        :return:                        Generator
+        """
+        for key in key_path:
+            self.__find_key(key)
+        c = self.__peek()
+        if c not in ['[', '{']:
+            raise ValueError('Expected an array or an object at %s' % '/'.join(key_path))
+        self.position += 1
+        end = ']' if c == '[' else '}'
+        if self.__peek() == end:
+            self.position += 1
+            return
+        while True:
+            if c == '[':
+                yield self.__decode_value()
+            else:
+                key = self.__decode_value()
+                self.__expect(':')
+                yield key, self.__decode_value()
+            if self.__next_separator(end) == end:
+                return
+
+
+    def load(self, key_path = []):
+        """
+        Decode the value found at a key path
+
+        :param key_path:                List of keys leading to the value, from the document's root
+
+        :return:                        Decoded value
+        """
+        for key in key_path:
+            self.__find_key(key)
+        return self.__decode_value()
+
+
+    def __find_key(self, key):
+        self.__expect('{')
+        if self.__peek() != '}':
+            while True:
+                if self.__decode_value() == key:
+                    self.__expect(':')
+                    return
+                self.__expect(':')
+                self.__skip_value()
+                if self.__next_separator('}') == '}':
+                    break
+        raise KeyError(key)
+
+
+    def __fill(self):
+        # Drop the consumed part of the buffer before reading the next chunk
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+
+    def __peek(self):
+        while True:
+            self.position = whitespace_regex.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.__fill():
+                raise ValueError('Unexpected end of JSON data')
+
+
+    def __expect(self, c):
+        if self.__peek() != c:
+            raise ValueError('Expected \'%s\' at offset %d' % (c, self.position))
+        self.position += 1
+
+
+    def __next_separator(self, end):
+        c = self.__peek()
+        if c not in [',', end]:
+            raise ValueError('Expected \',\' or \'%s\' at offset %d' % (end, self.position))
+        self.position += 1
+        return c
+
+
+    def __decode_value(self):
+        self.__peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # A number split across chunks (1.|25, 3e|10) is decoded partially: read more when it runs to the end
+                # of the buffer or when the next character could continue it
+                if self.eof or type(value) not in number_types or \
+                        (end < len(self.buffer) and self.buffer[end] not in '.eE+-0123456789'):
+                    self.position = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.__fill()
+
+
+    def __skip_value(self):
+        c = self.__peek()
+        if c == '"':
+            self.position += 1
+            self.__skip_string()
+        elif c in ['[', '{']:
+            self.position += 1
+            depth = 1
+            while depth:
+                match = container_regex.search(self.buffer, self.position)
+                if not match:
+                    self.position = len(self.buffer)
+                    if not self.__fill():
+                        raise ValueError('Unexpected end of JSON data')
+                    continue
+                self.position = match.end()
+                c = match.group()
+                if c == '"':
+                    self.__skip_string()
+                elif c in ['[', '{']:
+                    depth += 1
+                else:
+                    depth -= 1
+        else:
+            self.__decode_value()
+
+
+    def __skip_string(self):
+        while True:
+            match = string_regex.search(self.buffer, self.position)
+            if not match or (match.group() == '\\' and match.end() == len(self.buffer)):
+                # Keep a trailing backslash so that the escaped character is seen with it
+                self.position = match.start() if match else len(self.buffer)
+                if not self.__fill():
+                    raise ValueError('Unterminated string')
+                continue
+            if match.group() == '\\':
+                self.position = match.end() + 1
+            else:
+                self.position = match.end()
+                return
+
+
+
+def iter_json_items(f, key_path = [], chunk_size = 65536):
+    """
+    Yield the elements of the array, or the (key, value) pairs of the object, found at a key path of a JSON file
+
+    :param f:                           File object opened in text mode
+    :param key_path:                    List of keys leading to the value, from the document's root
+    :param chunk_size:                  Number of characters read at a time
+
+    :return:                            Generator
+    """
+    return JSONStreamReader(f, chunk_size).iter_items(key_path)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import time
+import zlib
+
+from opinel.utils.aws import invalidate_client_cache
+from opinel.utils.cli_parser import execution_modes
+from opinel.utils.json_backend import json_dumps, json_loads
+from opinel.utils.threads import TaskResult, thread_map
+from opinel.utils.throttling import get_throttling_controller
+
+
+class RemoteException(Exception):
+    """
+    Exception raised by a task that ran in a worker process
+    """
+
+    def __init__(self, type_name, message):
+        super(RemoteException, self).__init__('%s: %s' % (type_name, message))
+        self.type_name = type_name
+
+
+def execute(targets, function, params = {}, mode = 'threads', max_workers = 10, num_processes = None, timeout = None):
+    """
+    Run function(target, params) for each target with the selected execution mode
+
+    :param targets:                     List of targets (e.g. accounts or regions)
+    :param function:                    Function called with a target and a private copy of params. It must be defined
+                                        at module level when running in processes.
+    :param params:                      Parameters passed to each call
+    :param mode:                        threads, processes, or hybrid (threads within each process)
+    :param max_workers:                 Number of threads (per process in hybrid mode)
+    :param num_processes:               Number of processes, defaults to the number of CPUs
+    :param timeout:                     Maximum number of seconds to wait
+
+    :return:                            List of TaskResult, in the same order as the targets
+    """
+    if mode == 'threads':
+        return thread_map(targets, function, params, max_workers, timeout)
+    elif mode == 'processes':
+        return process_map(targets, function, params, num_processes, 1, timeout)
+    elif mode == 'hybrid':
+        return process_map(targets, function, params, num_processes, max_workers, timeout)
+    else:
+        raise Exception('Invalid execution mode %s' % mode)
+
+
+def process_map(targets, function, params = {}, num_processes = None, threads_per_process = 1, timeout = None):
+    """
+    Shard targets across worker processes and merge their results. Each worker process builds its own API client
+    cache and throttling state. Results are sent back to the parent as compressed JSON, so they must be serializable
+    with json_dumps() (datetimes come back as strings).
+
+    :param targets:                     List of targets (e.g. accounts or regions)
+    :param function:                    Module-level function called with a target and a private copy of params
+    :param params:                      Parameters passed to each call
+    :param num_processes:               Number of processes, defaults to the number of CPUs
+    :param threads_per_process:         Number of threads in each worker process
+    :param timeout:                     Maximum number of seconds to wait. Targets of the shards that have not completed
+                                        by then are reported with the timeout status.
+
+    :return:                            List of TaskResult, in the same order as the targets
+    """
+    if not len(targets):
+        return []
+    num_processes = min(num_processes or multiprocessing.cpu_count(), len(targets))
+    shards = shard_targets(targets, num_processes)
+    deadline = time.time() + timeout if timeout is not None else None
+    pool = multiprocessing.Pool(num_processes, initializer = init_worker_process)
+    try:
+        pending = [(shard, pool.apply_async(run_shard, ((shard, function, params, threads_per_process),)))
+                   for shard in shards]
+        outputs = []
+        unfinished = []
+        for shard, async_result in pending:
+            async_result.wait(max(0, deadline - time.time()) if deadline is not None else None)
+            if not async_result.ready():
+                unfinished.append((shard, 'timeout', None))
+            elif async_result.successful():
+                outputs.append(async_result.get())
+            else:
+                try:
+                    async_result.get()
+                except Exception as e:
+                    unfinished.append((shard, 'failed', e))
+    finally:
+        pool.terminate()
+        pool.join()
+    # Shards that did not complete are reported per target, like tasks in thread_map()
+    results = merge_shard_outputs(targets, outputs)
+    for shard, status, exception in unfinished:
+        for index, target in shard:
+            results[index].status = status
+            results[index].exception = exception
+    return results
+
+
+def shard_targets(targets, num_shards):
+    """
+    Split targets into interleaved shards so that each shard gets a mix of accounts and regions
+
+    :param targets:                     List of targets
+    :param num_shards:                  Number of shards
+
+    :return:                            List of shards, each a list of (index, target) tuples
+    """
+    shards = [ [] for i in range(num_shards) ]
+    for i, target in enumerate(targets):
+        shards[i % num_shards].append((i, target))
+    return [shard for shard in shards if len(shard)]
+
+
+def init_worker_process():
+    """
+    Drop the state inherited from the parent process: API clients and their connections must not be shared
+
+    :return:                            None
+    """
+    invalidate_client_cache()
+    get_throttling_controller().reset()
+
+
+def run_shard(args):
+    """
+    Run a shard's tasks in a worker process
+
+    :param args:                        (shard, function, params, threads_per_process) tuple
+
+    :return:                            Compressed JSON list of [index, status, result, error] entries
+    """
+    shard, function, params, threads_per_process = args
+    indices = [index for index, target in shard]
+    shard_targets = [target for index, target in shard]
+    results = thread_map(shard_targets, function, params, max(1, threads_per_process))
+    output = []
+    for index, task in zip(indices, results):
+        error = [type(task.exception).__name__, str(task.exception)] if task.exception else None
+        output.append([index, task.status, task.result, error])
+    return zlib.compress(json_dumps(output, sort_keys = False).encode('utf-8'))
+
+
+def merge_shard_outputs(targets, outputs):
+    """
+    Merge the serialized outputs of worker processes
+
+    :param targets:                     List of targets, in their original order
+    :param outputs:                     List of outputs returned by run_shard()
+
+    :return:                            List of TaskResult, in the same order as the targets
+    """
+    results = [TaskResult(target) for target in targets]
+    for output in outputs:
+        for index, status, result, error in json_loads(zlib.decompress(output)):
+            task = results[index]
+            task.status = status
+            task.result = result
+            if error:
+                task.exception = RemoteException(error[0], error[1])
+    return results
@@ -5,14 +5,19 @@ import os
 import re
 
 from opinel.utils.aws import get_aws_account_id
+from opinel.utils.aws_config import get_aws_config_file, invalidate_aws_config_file
+from opinel.utils.cache import LRUCache
 from opinel.utils.console import printDebug
-from opinel.utils.credentials import read_creds
+from opinel.utils.credentials import read_creds, read_creds_for_profiles
+from opinel.utils.threads import thread_map
 
 aws_dir = os.path.join(os.path.expanduser('~'), '.aws')
 aws_credentials_file = os.path.join(aws_dir, 'credentials')
 aws_config_file = os.path.join(aws_dir, 'config')
 
-re_profile_name = re.compile(r'(\[(profile\s+)?(.*?)\])')
+re_profile_prefix = re.compile(r'^profile\s+')
+
+name_filters = LRUCache(max_size = 128)
 
 class AWSProfile(object):
 
@@ -67,6 +72,7 @@ class AWSProfile(object):
                 new_raw_profile += '\n%s=%s' % (attribute, self.attributes[attribute])
             with open(self.filename, 'a') as f:
                 f.write(new_raw_profile)
+            invalidate_aws_config_file(self.filename)
         else:
             new_raw_profile = ''
             for line in self.raw_profile.splitlines():
@@ -83,6 +89,7 @@ class AWSProfile(object):
             contents = contents.replace(self.raw_profile, new_raw_profile)
             with open(self.filename, 'wt') as f:
                 f.write(contents)
+            invalidate_aws_config_file(self.filename)
 
 
 
@@ -108,6 +115,43 @@ class AWSProfiles(object):
         return profiles
 
 
+    @staticmethod
+    def get_credentials(profiles, max_workers = 10):
+        """
+        Resolve the credentials and account ID of several profiles concurrently, reading shared source profiles once
+
+        :param profiles:                List of AWSProfile
+        :param max_workers:             Maximum number of profiles resolved at once
+
+        :return:                        Dictionary of profile name to credentials
+        """
+        credentials = read_creds_for_profiles([profile.name for profile in profiles], max_workers)
+        def worker(profile, params):
+            profile.credentials = credentials[profile.name]
+            try:
+                profile.account_id = get_aws_account_id(profile.credentials)
+            except:
+                pass
+        thread_map(profiles, worker, max_workers = max_workers)
+        return credentials
+
+
+    @staticmethod
+    def get_name_filter(names):
+        """
+        Compile profile name patterns into a single regex, cached between calls
+
+        :param names:                   List of regexes, each matched against the whole profile name
+
+        :return:                        Compiled regex, or None if there are no patterns
+        """
+        if not names:
+            return None
+        # Each alternative keeps its own anchors, so that patterns match exactly as they would one by one
+        return name_filters.get_or_create(tuple(names),
+                                          lambda: re.compile('|'.join('(?:^%s$)' % name for name in names)))
+
+
     @staticmethod
     def find_profiles_in_file(filename, names = [], quiet = True):
         profiles = []
@@ -115,27 +159,15 @@ class AWSProfiles(object):
             names = [ names ]
         if not quiet:
             printDebug('Searching for profiles matching %s in %s ... ' % (str(names), filename))
-        name_filters = []
-        for name in names:
-            name_filters.append(re.compile('^%s$' % name))
+        name_filter = AWSProfiles.get_name_filter(names)
         if os.path.isfile(filename):
-            with open(filename, 'rt') as f:
-                aws_credentials = f.read()
-                existing_profiles = re_profile_name.findall(aws_credentials)
-                profile_count = len(existing_profiles) - 1
-                for i, profile in enumerate(existing_profiles):
-                    matching_profile = False
-                    raw_profile = None
-                    for name_filter in name_filters:
-                        if name_filter.match(profile[2]):
-                            matching_profile = True
-                            i1 = aws_credentials.index(profile[0])
-                            if i < profile_count:
-                                i2 = aws_credentials.index(existing_profiles[i+1][0])
-                                raw_profile = aws_credentials[i1:i2]
-                            else:
-                                raw_profile = aws_credentials[i1:]
-                    if len(name_filters) == 0 or matching_profile:
-                        profiles.append(AWSProfile(filename = filename, raw_profile = raw_profile, name = profile[2]))
+            config_file = get_aws_config_file(filename)
+            for section in config_file.sections:
+                name = re_profile_prefix.sub('', section.header)
+                if name_filter is None:
+                    profiles.append(AWSProfile(filename = filename, name = name))
+                elif name_filter.match(name):
+                    raw_profile = config_file.get_raw_section(section)
+                    profiles.append(AWSProfile(filename = filename, raw_profile = raw_profile, name = name))
         return profiles
 
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from threading import Thread
+import copy
+import os
+from threading import Condition, Lock, Thread, local
+import time
 try:
     # Python2
     from Queue import Queue
@@ -46,10 +49,224 @@ def threaded_per_region(q, params):
     """
     while True:
         try:
-            params['region'] = q.get()
-            method = params['method']
-            method(params)
+            # Each region gets its own copy of params so that threads do not overwrite each other's region
+            region_params = copy.copy(params)
+            region_params['region'] = q.get()
+            method = region_params['method']
+            method(region_params)
         except Exception as e:
             printException(e)
         finally:
             q.task_done()
+
+
+########################################
+# Worker pool
+########################################
+
+class TaskResult(object):
+    """
+    Outcome of a task run by a WorkerPool. Status is one of pending, running, done, failed, cancelled, or timeout.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.result = None
+        self.exception = None
+        self.status = 'pending'
+
+
+    def __repr__(self):
+        return '<TaskResult %s: %s>' % (self.target, self.status)
+
+
+class TaskBatch(object):
+    """
+    Set of tasks submitted to a WorkerPool at once
+    """
+
+    def __init__(self, targets, function, params):
+        self.function = function
+        self.params = params
+        self.results = [TaskResult(target) for target in targets]
+        self.pending = len(self.results)
+        self.cancelled = False
+        self.condition = Condition()
+
+
+    def cancel(self):
+        """
+        Cancel the tasks that have not started yet
+
+        :return:                        None
+        """
+        with self.condition:
+            self.cancelled = True
+
+
+    def run(self, index):
+        task = self.results[index]
+        with self.condition:
+            if self.cancelled:
+                task.status = 'cancelled'
+                self.__task_done()
+                return
+            task.status = 'running'
+        task_params = copy.copy(self.params)
+        result = exception = None
+        try:
+            result = self.function(task.target, task_params)
+            status = 'done'
+        except Exception as e:
+            exception = e
+            status = 'failed'
+        with self.condition:
+            if task.status == 'running':
+                task.result = result
+                task.exception = exception
+                task.status = status
+            self.__task_done()
+
+
+    def wait(self, timeout = None):
+        """
+        Wait for all tasks to complete. When the timeout expires, tasks that have not started are cancelled and
+        running tasks are reported with the timeout status (their outcome is discarded).
+
+        :param timeout:                 Maximum number of seconds to wait
+
+        :return:                        List of TaskResult, in the same order as the targets
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.condition:
+            while self.pending > 0:
+                if deadline is None:
+                    self.condition.wait(1)
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.cancelled = True
+                    for task in self.results:
+                        if task.status == 'running':
+                            task.status = 'timeout'
+                        elif task.status == 'pending':
+                            task.status = 'cancelled'
+                    break
+                self.condition.wait(remaining)
+        return self.results
+
+
+    def __task_done(self):
+        self.pending -= 1
+        if self.pending == 0:
+            self.condition.notify_all()
+
+
+class WorkerPool(object):
+    """
+    Bounded pool of worker threads. Threads are started on demand and reused by successive batches of tasks.
+    """
+
+    def __init__(self, max_workers = 10):
+        self.max_workers = max_workers
+        self.queue = Queue(maxsize = 0)
+        self.workers = []
+        self.pid = os.getpid()
+        self.lock = Lock()
+        self.local = local()
+
+
+    def map(self, targets, function, params = {}, timeout = None):
+        """
+        Run function(target, params) for each target and wait for the results
+
+        :param targets:                 List of targets (e.g. regions or accounts)
+        :param function:                Function called with a target and a private copy of params
+        :param params:                  Parameters passed to each call
+        :param timeout:                 Maximum number of seconds to wait
+
+        :return:                        List of TaskResult, in the same order as the targets
+        """
+        return self.submit(targets, function, params).wait(timeout)
+
+
+    def submit(self, targets, function, params = {}):
+        """
+        Queue function(target, params) for each target without waiting
+
+        :param targets:                 List of targets (e.g. regions or accounts)
+        :param function:                Function called with a target and a private copy of params
+        :param params:                  Parameters passed to each call
+
+        :return:                        TaskBatch
+        """
+        batch = TaskBatch(targets, function, params)
+        if getattr(self.local, 'is_worker', False):
+            # Tasks submitted from one of this pool's workers run inline, waiting on them could deadlock the pool
+            for i in range(len(batch.results)):
+                batch.run(i)
+            return batch
+        self.__start_workers(len(batch.results))
+        for i in range(len(batch.results)):
+            self.queue.put((batch, i))
+        return batch
+
+
+    def __start_workers(self, task_count):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Threads do not survive a fork, start over in the child process
+                self.queue = Queue(maxsize = 0)
+                self.workers = []
+                self.pid = os.getpid()
+            self.workers = [worker for worker in self.workers if worker.is_alive()]
+            while len(self.workers) < min(self.max_workers, task_count):
+                worker = Thread(target = self.__work, args = (self.queue,))
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+
+
+    def __work(self, q):
+        self.local.is_worker = True
+        while True:
+            batch, index = q.get()
+            try:
+                batch.run(index)
+            except Exception as e:
+                printException(e)
+            finally:
+                q.task_done()
+
+
+__worker_pools = {}
+__worker_pools_lock = Lock()
+
+
+def get_worker_pool(max_workers = 10):
+    """
+    Return the process-wide worker pool of a given size, so that threads are reused across scans
+
+    :param max_workers:                 Maximum number of concurrent tasks
+
+    :return:                            WorkerPool
+    """
+    with __worker_pools_lock:
+        if max_workers not in __worker_pools:
+            __worker_pools[max_workers] = WorkerPool(max_workers)
+        return __worker_pools[max_workers]
+
+
+def thread_map(targets, function, params = {}, max_workers = 10, timeout = None):
+    """
+    Run function(target, params) for each target on a shared, bounded worker pool
+
+    :param targets:                     List of targets (e.g. regions or accounts)
+    :param function:                    Function called with a target and a private copy of params
+    :param params:                      Parameters passed to each call
+    :param max_workers:                 Maximum number of concurrent tasks
+    :param timeout:                     Maximum number of seconds to wait
+
+    :return:                            List of TaskResult, in the same order as the targets
+    """
+    return get_worker_pool(max_workers).map(targets, function, params, timeout)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+import random
+from threading import Lock
+import time
+
+
+
+########################################
+# Token bucket
+########################################
+
+class TokenBucket(object):
+    """
+    Token bucket whose refill rate is adjusted with AIMD (additive increase on success, multiplicative decrease on
+    throttling)
+    """
+
+    def __init__(self, rate = 25.0, min_rate = 1.0, max_rate = 500.0, increase = 0.5, decrease = 0.5):
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = 1.0
+        self.last_refill = time.time()
+        self._lock = Lock()
+
+
+    def acquire(self):
+        """
+        Reserve a token, sleeping until it is available
+
+        :return:                        Number of seconds spent waiting
+        """
+        with self._lock:
+            now = time.time()
+            capacity = max(1.0, self.rate)
+            self.tokens = min(capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1.0
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+    def on_throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+
+
+
+########################################
+# Throttling controller
+########################################
+
+class ThrottlingController(object):
+    """
+    Rate controller shared by all threads, keyed by (account, region, service). Each key gets its own token bucket,
+    retry budget, and metrics. Throttled calls are retried with jittered exponential backoff until either the
+    per-call retry limit or the key's retry budget is exhausted.
+    """
+
+    def __init__(self, rate = 25.0, min_rate = 1.0, max_rate = 500.0, base_delay = 0.5, max_delay = 30.0,
+                 max_retries = 10, retry_budget = 100.0, retry_refund = 0.1):
+        self.bucket_params = {'rate': rate, 'min_rate': min_rate, 'max_rate': max_rate}
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget
+        self.retry_refund = retry_refund
+        self._keys = {}
+        self._lock = Lock()
+
+
+    def call(self, key, callback, params, is_throttled):
+        """
+        Call callback(**params) under the key's rate limit, retrying throttled calls
+
+        :param key:                     (account, region, service) tuple
+        :param callback:                Function to call
+        :param params:                  Keyword arguments passed to callback
+        :param is_throttled:            Function that tells whether an exception is due to throttling
+
+        :return:                        Return value of callback
+        """
+        state = self.__get_state(key)
+        attempt = 0
+        while True:
+            waited = state['bucket'].acquire()
+            with self._lock:
+                state['requests'] += 1
+                state['time_slept'] += waited
+            try:
+                response = callback(**params)
+            except Exception as e:
+                if not is_throttled(e):
+                    raise
+                state['bucket'].on_throttle()
+                with self._lock:
+                    state['throttles'] += 1
+                    can_retry = attempt < self.max_retries and state['budget'] >= 1
+                    if can_retry:
+                        state['budget'] -= 1
+                        state['retries'] += 1
+                if not can_retry:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+                with self._lock:
+                    state['time_slept'] += delay
+                time.sleep(delay)
+                attempt += 1
+                continue
+            state['bucket'].on_success()
+            with self._lock:
+                state['budget'] = min(self.retry_budget, state['budget'] + self.retry_refund)
+            return response
+
+
+    def get_metrics(self, key = None):
+        """
+        Return throttling metrics
+
+        :param key:                     Only return metrics for this key when set
+
+        :return:                        Dictionary of key to metrics (requests, throttles, retries, time_slept,
+                                        effective_rps, rate, retry_budget), or the metrics of a single key
+        """
+        with self._lock:
+            metrics = {}
+            now = time.time()
+            for k, state in self._keys.items():
+                elapsed = now - state['start']
+                metrics[k] = {
+                    'requests': state['requests'],
+                    'throttles': state['throttles'],
+                    'retries': state['retries'],
+                    'time_slept': state['time_slept'],
+                    'effective_rps': state['requests'] / elapsed if elapsed > 0 else 0.0,
+                    'rate': state['bucket'].rate,
+                    'retry_budget': state['budget']
+                }
+        if key is not None:
+            return metrics.get(key)
+        return metrics
+
+
+    def reset(self):
+        """
+        Drop all per-key state and metrics
+
+        :return:                        None
+        """
+        with self._lock:
+            self._keys = {}
+
+
+    def __get_state(self, key):
+        with self._lock:
+            if key not in self._keys:
+                self._keys[key] = {
+                    'bucket': TokenBucket(**self.bucket_params),
+                    'budget': self.retry_budget,
+                    'requests': 0,
+                    'throttles': 0,
+                    'retries': 0,
+                    'time_slept': 0.0,
+                    'start': time.time()
+                }
+            return self._keys[key]
+
+
+
+########################################
+# Shared controller
+########################################
+
+throttling_controller = ThrottlingController()
+
+
+def get_throttling_controller():
+    """
+    Return the controller shared by all threads of this process
+
+    :return:                            ThrottlingController
+    """
+    return throttling_controller
+
+
+def set_throttling_controller(controller):
+    """
+    Replace the controller shared by all threads of this process (e.g. to tune rates or retries)
+
+    :param controller:                  ThrottlingController
+
+    :return:                            None
+    """
+    global throttling_controller
+    throttling_controller = controller
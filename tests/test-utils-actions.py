@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from iampoliciesgonewild import get_actions_from_statement, _expand_wildcard_action
+
+from opinel.utils.actions import *
+
+class TestOpinelUtilsActions:
+
+    def test_expand_actions(self):
+        for actions in ['iam:Get*', 's3:*', 'ec2:describeinstances', ['iam:Put*', 'iam:Delete*']]:
+            assert (action_index.get_actions(expand_actions(actions)) == set(_expand_wildcard_action(actions)))
+        hits = expanded_actions_cache.stats()['hits']
+        expand_actions('iam:Get*')
+        assert (expanded_actions_cache.stats()['hits'] == hits + 1)
+
+
+    def test_get_statement_actions(self):
+        statements = [
+            {'Effect': 'Allow', 'Action': 'iam:PassRole', 'Resource': '*'},
+            {'Effect': 'Allow', 'Action': ['s3:Get*', 'iam:List*'], 'Resource': '*'},
+            {'Effect': 'Allow', 'NotAction': 'iam:*', 'Resource': '*'},
+            {'Effect': 'Allow', 'Action': 'sts:AssumeRole', 'NotAction': ['s3:*', 'ec2:*'], 'Resource': '*'},
+        ]
+        for statement in statements:
+            expected = get_actions_from_statement(dict(statement))
+            assert (action_index.get_actions(get_statement_actions(dict(statement))) == expected)
+            assert (action_index.get_actions(get_statement_actions(json.dumps(statement))) == expected)
+        mask = get_statement_actions(statements[2])
+        assert (not action_index.has_action(mask, 'iam:passrole'))
+        assert (action_index.has_action(mask, 's3:getobject'))
+        assert (not action_index.has_action(mask, 'foo:unknownaction'))
+        hits = statement_actions_cache.stats()['hits']
+        get_statement_actions(json.dumps(statements[0]))
+        assert (statement_actions_cache.stats()['hits'] == hits + 1)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from threading import Lock
+import time
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+from opinel.utils.aio import *
+
+class TestOpinelUtilsAio:
+
+    def square(self, target, params):
+        params['target'] = target
+        if target == 3:
+            raise ValueError('3')
+        return target * target
+
+    def sleep(self, target, params):
+        time.sleep(target)
+        return target
+
+
+    def test_async_map(self):
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            # asyncio.sleep(delay, result) is a coroutine function that returns each task's copy of params
+            params = {'foo': 'bar'}
+            future = async_map([0, 0.01], asyncio.sleep, params)
+            assert (isinstance(future, asyncio.Future))
+            results = loop.run_until_complete(future)
+            assert ([r.status for r in results] == ['done', 'done'])
+            assert (results[0].result == params and results[0].result is not params)
+            results = loop.run_until_complete(async_map([0, 5, 5], asyncio.sleep, max_per_host = 1,
+                                                        host_key = lambda target: 'host', timeout = 0.1))
+            assert ([r.status for r in results] == ['done', 'timeout', 'cancelled'])
+            assert (loop.run_until_complete(async_map([], asyncio.sleep)) == [])
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+    def test_cancelled_task(self):
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            future = async_map([0, 0.01, 5], asyncio.sleep)
+            # Tasks cancelled from outside the batch, here the last one running, do not keep the batch waiting
+            def cancel():
+                for task in asyncio.all_tasks(loop):
+                    if task.get_coro().__name__ == 'sleep' and not task.done():
+                        task.cancel()
+            loop.call_later(0.1, cancel)
+            results = loop.run_until_complete(asyncio.wait_for(future, 10))
+            assert ([r.status for r in results] == ['done', 'done', 'cancelled'])
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+    def test_get_executor(self):
+        executor = get_executor(4)
+        assert (get_executor(4) is executor)
+        assert (get_executor(5) is not executor)
+        assert (executor.submit(self.square, 2, {}).result() == 4)
+
+
+    def test_run_async_map(self):
+        params = {'foo': 'bar'}
+        results = run_async_map(list(range(5)), self.square, params)
+        assert ([r.result for r in results] == [0, 1, 4, None, 16])
+        assert (results[3].status == 'failed' and type(results[3].exception) == ValueError)
+        assert (params == {'foo': 'bar'})
+        results = run_async_map([0, 0, 0], asyncio.sleep, max_concurrency = 2, max_per_host = 1)
+        assert ([r.status for r in results] == ['done', 'done', 'done'])
+        assert (run_async_map([], self.square) == [])
+
+
+    def test_host_limits_and_timeout(self):
+        in_flight = {'current': 0, 'max': 0}
+        lock = Lock()
+        def count(target, params):
+            with lock:
+                in_flight['current'] += 1
+                in_flight['max'] = max(in_flight['max'], in_flight['current'])
+            time.sleep(0.01)
+            with lock:
+                in_flight['current'] -= 1
+        run_async_map(list(range(20)), count, max_concurrency = 10, max_per_host = 3, host_key = lambda target: 'us-east-1')
+        assert (in_flight['max'] == 3)
+        in_flight['max'] = 0
+        run_async_map(list(range(20)), count, max_concurrency = 4, max_per_host = 3, host_key = lambda target: target % 2)
+        assert (in_flight['max'] == 4)
+        results = run_async_map([0.5, 0.5, 0], self.sleep, max_concurrency = 1, max_per_host = 1, host_key = lambda target: 'host', timeout = 0.1)
+        assert ([r.status for r in results] == ['timeout', 'cancelled', 'cancelled'])
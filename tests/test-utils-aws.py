@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from botocore.config import Config
+from threading import Thread
+
+import opinel.utils.aws
 
 from opinel.utils.aws import *
 from opinel.utils.credentials import read_creds, read_creds_from_environment_variables
@@ -46,6 +49,100 @@ class TestOpinelAWS:
             pass
 
 
+    def test_connect_service_cache(self):
+        invalidate_client_cache()
+        creds = {'AccessKeyId': 'AKIAOPINELUNITTEST', 'SecretAccessKey': 'secret', 'SessionToken': None}
+        client1 = connect_service('iam', creds, silent=True)
+        client2 = connect_service('iam', creds, silent=True)
+        assert (client1 is client2)
+        assert (connect_service('ec2', creds, region_name = 'us-east-1', silent=True) is not client1)
+        assert (connect_service('iam', creds, silent=True, use_cache=False) is not client1)
+        stats = get_client_cache_stats()
+        assert (stats['hits'] >= 1)
+        assert (stats['size'] == 2)
+        config1 = Config(region_name = 'us-east-1')
+        config2 = Config(region_name = 'us-east-1')
+        assert (connect_service('ec2', creds, config = config1, silent=True) is connect_service('ec2', creds, config = config2, silent=True))
+        # Rotated credentials drop clients built with the old secret
+        rotated_creds = {'AccessKeyId': 'AKIAOPINELUNITTEST', 'SecretAccessKey': 'rotated', 'SessionToken': None}
+        assert (connect_service('iam', rotated_creds, silent=True) is not client1)
+        assert (get_client_cache_stats()['size'] == 1)
+        assert (invalidate_client_cache(rotated_creds) == 1)
+        assert (invalidate_client_cache() == 0)
+
+
+    def test___create_client(self):
+        create_client = getattr(opinel.utils.aws, '__create_client')
+        client_params = {'service_name': 'iam', 'aws_access_key_id': 'AKIAOPINELUNITTEST',
+                         'aws_secret_access_key': 'secret', 'aws_session_token': None}
+        client1 = create_client(client_params)
+        client2 = create_client(client_params)
+        assert (client1.meta.service_model.service_name == 'iam')
+        assert (client1 is not client2)
+
+
+    def test___invalidate_rotated_credentials(self):
+        invalidate_rotated_credentials = getattr(opinel.utils.aws, '__invalidate_rotated_credentials')
+        invalidate_client_cache()
+        client_cache.set(('fingerprint1', 'iam', None, None), 'client1')
+        client_cache.set(('fingerprint3', 'iam', None, None), 'client3')
+        invalidate_rotated_credentials('AKIAOPINELUNITTEST', 'fingerprint1')
+        assert (len(client_cache) == 2)
+        invalidate_rotated_credentials('AKIAOPINELUNITTEST', 'fingerprint1')
+        assert (len(client_cache) == 2)
+        invalidate_rotated_credentials('AKIAOPINELUNITTEST', 'fingerprint2')
+        assert (('fingerprint1', 'iam', None, None) not in client_cache)
+        assert (('fingerprint3', 'iam', None, None) in client_cache)
+        # Concurrent rotations never lose an update
+        threads = [Thread(target = invalidate_rotated_credentials, args = ('AKIA%d' % i, 'fingerprint')) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert (len(getattr(opinel.utils.aws, '__credentials_fingerprints')) == 21)
+        invalidate_client_cache()
+
+
+    def test_get_client_cache_stats(self):
+        invalidate_client_cache()
+        stats = get_client_cache_stats()
+        assert (stats['size'] == 0)
+        assert (stats['max_size'] == client_cache.max_size)
+        for key in ['hits', 'misses', 'evictions']:
+            assert (key in stats)
+
+
+    def test_get_config_fingerprint(self):
+        assert (get_config_fingerprint(None) == None)
+        assert (get_config_fingerprint(Config(region_name = 'us-east-1')) ==
+                get_config_fingerprint(Config(region_name = 'us-east-1')))
+        assert (get_config_fingerprint(Config(region_name = 'us-east-1')) !=
+                get_config_fingerprint(Config(region_name = 'us-west-2')))
+        assert (get_config_fingerprint('config') == repr('config'))
+
+
+    def test_get_credentials_fingerprint(self):
+        creds = {'AccessKeyId': 'AKIAOPINELUNITTEST', 'SecretAccessKey': 'secret', 'SessionToken': None}
+        fingerprint = get_credentials_fingerprint(creds)
+        assert (len(fingerprint) == 64)
+        assert ('secret' not in fingerprint)
+        assert (fingerprint == get_credentials_fingerprint(dict(creds)))
+        assert (fingerprint != get_credentials_fingerprint(dict(creds, SessionToken = 'token')))
+
+
+    def test_invalidate_client_cache(self):
+        invalidate_client_cache()
+        creds1 = {'AccessKeyId': 'AKIAOPINELUNITTEST1', 'SecretAccessKey': 'secret', 'SessionToken': None}
+        creds2 = {'AccessKeyId': 'AKIAOPINELUNITTEST2', 'SecretAccessKey': 'secret', 'SessionToken': None}
+        connect_service('iam', creds1, silent = True)
+        connect_service('sts', creds1, silent = True)
+        connect_service('iam', creds2, silent = True)
+        assert (invalidate_client_cache(creds1) == 2)
+        assert (invalidate_client_cache(creds1) == 0)
+        assert (invalidate_client_cache() == 1)
+        assert (len(getattr(opinel.utils.aws, '__credentials_fingerprints')) == 0)
+
+
     def test_get_aws_account_id(self):
         account_id = get_aws_account_id(self.creds)
         assert (account_id == '179374595322')
@@ -80,6 +177,18 @@ class TestOpinelAWS:
         assert (partition_name == 'aws')
 
 
+    def test_get_throttling_key(self):
+        creds = {'AccessKeyId': 'AKIAOPINELUNITTEST', 'SecretAccessKey': 'secret', 'SessionToken': None}
+        client = connect_service('ec2', creds, region_name = 'us-west-2', silent = True)
+        assert (get_throttling_key(client.describe_instances) == ('AKIAOPINELUNITTEST', 'us-west-2', 'ec2'))
+        # Clients whose credentials cannot be read are not keyed by account
+        unsigned_client = type('UnsignedClient', (object,), {'meta': client.meta, 'call': lambda self: None})()
+        assert (get_throttling_key(unsigned_client.call) == (None, 'us-west-2', 'ec2'))
+        # Callbacks that are not API client methods are keyed by name only
+        assert (get_throttling_key(self.list_items) == (None, None, 'list_items'))
+        assert (get_throttling_key(lambda **params: params) == (None, None, '<lambda>'))
+
+
     def test_get_username(self):
         username = get_username(self.creds)
         assert (username == 'CI-local' or username == 'CI-travis-opinel')
@@ -90,5 +199,52 @@ class TestOpinelAWS:
         users = handle_truncated_response(iam_client.list_users, {'MaxItems': 5}, ['Users'])['Users']
         assert (len(users) > 5)
 
+    def list_items(self, **params):
+        # Fake paginated API call: 3 pages of 2 items, offset by Prefix
+        page = int(params['Marker']) if 'Marker' in params else 0
+        offset = params['Prefix'] if 'Prefix' in params else 0
+        response = {'Items': [offset + page * 2, offset + page * 2 + 1]}
+        if page < 2:
+            response['Marker'] = str(page + 1)
+        return response
+
+
+    def test_iterate_truncated_response_pages(self):
+        results = handle_truncated_response(self.list_items, {}, ['Items', 'Missing'])
+        assert (results == {'Items': [0, 1, 2, 3, 4, 5], 'Missing': []})
+        pages = list(iterate_truncated_response_pages(self.list_items, {}, ['Items']))
+        assert (pages == [{'Items': [0, 1]}, {'Items': [2, 3]}, {'Items': [4, 5]}])
+        # Pages are fetched lazily
+        calls = []
+        def list_items(**params):
+            calls.append(params)
+            return self.list_items(**params)
+        pages = iterate_truncated_response_pages(list_items, {}, ['Items', 'Missing'])
+        assert (next(pages) == {'Items': [0, 1]})
+        assert (len(calls) == 1)
+
+
+    def test_iterate_truncated_response(self):
+        assert (list(iterate_truncated_response(self.list_items, {}, 'Items')) == [0, 1, 2, 3, 4, 5])
+        iterator = iterate_truncated_response(self.list_items, {}, 'Items')
+        assert ([next(iterator) for i in range(3)] == [0, 1, 2])
+        token = iterator.token
+        assert (token == {'markers': {'Marker': '1'}, 'offset': 1})
+        assert (list(iterate_truncated_response(self.list_items, {}, 'Items', token)) == [3, 4, 5])
+        next(iterator)
+        assert (list(iterate_truncated_response(self.list_items, {}, 'Items', iterator.token)) == [4, 5])
+        assert (list(iterator) == [4, 5])
+        assert (iterator.token == None)
+        assert (list(iterate_truncated_response(self.list_items, {}, 'Missing')) == [])
+
+
+    def test_handle_truncated_responses(self):
+        calls = [(self.list_items, {'Prefix': prefix}) for prefix in [100, 200, 300]]
+        results = handle_truncated_responses(calls, ['Items'], num_threads = 2)
+        assert ([r['Items'][0] for r in results] == [100, 200, 300])
+        assert (len(results[2]['Items']) == 6)
+        assert (handle_truncated_responses([], ['Items']) == [])
+
+
     def test_is_throttled(self):
         pass
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+from opinel.utils.aws_config import *
+
+class TestOpinelUtilsAWSConfig:
+
+    def test_aws_config_file(self):
+        contents = '[default]\nregion = us-east-1\n[profile role]\nrole_arn = arn\ns3 =\n  max_concurrent_requests = 20\n[default]\nregion = us-west-2'
+        config_file = AWSConfigFile('config', contents)
+        assert ([section.header for section in config_file.sections] == ['default', 'profile role', 'default'])
+        sections = config_file.get_sections('default')
+        assert (len(sections) == 2)
+        assert (config_file.get_raw_section(sections[0]) == '[default]\nregion = us-east-1\n')
+        assert (config_file.get_raw_section(sections[1]) == '[default]\nregion = us-west-2')
+        assert (sections[1].attributes['region'] == 'us-west-2')
+        assert (config_file.get_sections('role') == [])
+        section = config_file.get_profile_sections('role')[0]
+        assert (section.header == 'profile role')
+        assert (list(section.attributes.items()) == [('role_arn', 'arn'), ('s3', '')])
+        assert (config_file.get_profile_sections('missing') == [])
+
+
+    def test_get_aws_config_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'credentials')
+            with open(filename, 'wt') as f:
+                f.write('[a]\naws_access_key_id = 1\n')
+            config_file = get_aws_config_file(filename)
+            assert (get_aws_config_file(filename) is config_file)
+            with open(filename, 'at') as f:
+                f.write('[b]\naws_access_key_id = 2\n')
+            config_file = get_aws_config_file(filename)
+            assert ([section.name for section in config_file.sections] == ['a', 'b'])
+            assert (get_aws_config_file(filename) is config_file)
+            os.remove(filename)
+            try:
+                get_aws_config_file(filename)
+                assert (False)
+            except OSError as e:
+                assert (e.errno == 2)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+    def test_iter_lines(self):
+        assert (list(iter_lines('')) == [])
+        assert (list(iter_lines('a')) == ['a'])
+        assert (list(iter_lines('a\nb\n')) == ['a\n', 'b\n'])
+        assert (list(iter_lines('\n\na')) == ['\n', '\n', 'a'])
+        # Only newlines split lines, like iterating over a text file (unlike str.splitlines())
+        contents = 'a\r\nb\x0bc\x1cd\u2028e\n'
+        assert (list(iter_lines(contents)) == ['a\r\n', 'b\x0bc\x1cd\u2028e\n'])
+        assert (''.join(iter_lines(contents)) == contents)
+
+
+    def test_invalidate_aws_config_file(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filenames = [os.path.join(tmp_dir, name) for name in ['config', 'credentials']]
+            for filename in filenames:
+                with open(filename, 'wt') as f:
+                    f.write('[default]\n')
+            config_files = [get_aws_config_file(filename) for filename in filenames]
+            # Relative and absolute paths name the same file
+            cwd = os.getcwd()
+            os.chdir(tmp_dir)
+            try:
+                assert (invalidate_aws_config_file('config') == 1)
+                assert (invalidate_aws_config_file('config') == 0)
+            finally:
+                os.chdir(cwd)
+            assert (get_aws_config_file(filenames[0]) is not config_files[0])
+            assert (get_aws_config_file(filenames[1]) is config_files[1])
+            assert (invalidate_aws_config_file() >= 2)
+            assert (get_aws_config_file(filenames[1]) is not config_files[1])
+        finally:
+            shutil.rmtree(tmp_dir)
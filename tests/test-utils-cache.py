@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+import datetime
+
+from opinel.utils.cache import *
+
+class TestOpinelUtilsCache:
+
+    def test_lru_cache(self):
+        cache = LRUCache(max_size = 2)
+        assert (cache.get('a') == None)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert (cache.get('a') == 1)
+        cache.set('c', 3)
+        assert ('b' not in cache)
+        assert ('a' in cache and 'c' in cache)
+        assert (len(cache) == 2)
+        stats = cache.stats()
+        assert (stats['hits'] == 1)
+        assert (stats['misses'] == 1)
+        assert (stats['evictions'] == 1)
+        assert (stats['size'] == 2)
+
+
+    def test_get_or_create(self):
+        cache = LRUCache()
+        calls = []
+        factory = lambda: calls.append(1) or len(calls)
+        assert (cache.get_or_create('a', factory) == 1)
+        assert (cache.get_or_create('a', factory) == 1)
+        assert (len(calls) == 1)
+        assert (cache.stats()['misses'] == 1)
+        assert (cache.stats()['hits'] == 1)
+
+
+    def test_set_if_absent(self):
+        cache = LRUCache()
+        assert (cache.set_if_absent('a', 1) == 1)
+        assert (cache.set_if_absent('a', 2) == 1)
+        assert (cache.get('a') == 1)
+
+
+    def test_invalidate(self):
+        cache = LRUCache()
+        for key in ['a1', 'a2', 'b1']:
+            cache.set(key, key)
+        assert (cache.invalidate(lambda key: key.startswith('a')) == 2)
+        assert ('b1' in cache)
+        assert (cache.invalidate() == 1)
+        assert (len(cache) == 0)
+
+
+    def test_copy_tree(self):
+        date = datetime.datetime(2017, 4, 11)
+        data = {'a': [1, {'b': 2}], 'c': 'd', 'e': OrderedDict([('f', [])]), 'g': date, 'h': (1, [2])}
+        copy = copy_tree(data)
+        assert (copy == data)
+        assert (type(copy) == dict and type(copy['a']) == list and type(copy['e']) == OrderedDict)
+        copy['a'][1]['b'] = 3
+        copy['e']['f'].append(1)
+        copy['h'][1].append(3)
+        assert (data == {'a': [1, {'b': 2}], 'c': 'd', 'e': OrderedDict([('f', [])]), 'g': date, 'h': (1, [2])})
+        assert (copy['c'] is data['c'])
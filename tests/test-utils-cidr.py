@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+import netaddr
+
+from opinel.utils.cidr import *
+
+class TestOpinelUtilsCidr:
+
+    def test_contains(self):
+        known_subnets = ['10.0.0.0/8', '10.1.0.0/16', '192.168.0.0/24', '192.168.2.0/24', '2001:db8::/32', '0.0.0.0/32']
+        index = SubnetIndex(known_subnets)
+        assert (len(index) == 6)
+        for cidr in ['10.0.0.0/8', '10.255.0.1', '10.1.2.0/24', '192.168.0.0/24', '192.168.2.128/25', '2001:db8::1', '0.0.0.0']:
+            assert (index.contains(cidr) == True)
+        for cidr in ['0.0.0.0/0', '11.0.0.1', '192.168.1.1', '192.168.0.0/23', '2001:db9::1', '1.2.3.4', '::1', '0.0.0.1']:
+            assert (index.contains(cidr) == False)
+        # Same results as a linear scan with netaddr
+        for cidr in ['10.0.0.0/7', '192.168.2.0/24', '172.16.0.1', '2001:db8:1::/48']:
+            expected = any(netaddr.IPNetwork(cidr) in netaddr.IPNetwork(subnet) for subnet in known_subnets)
+            assert (index.contains(netaddr.IPNetwork(cidr)) == expected)
+        assert (SubnetIndex([]).contains('1.2.3.4') == False)
+
+
+    def test_lookup(self):
+        index = SubnetIndex()
+        index.add('10.0.0.0/8', 'corporate')
+        index.add('10.1.0.0/16', 'datacenter')
+        index.add('10.1.0.0/16', 'vpn')
+        index.add('2001:db8::/32', 'ipv6')
+        assert (index.lookup('10.1.2.3') == ['datacenter', 'vpn', 'corporate'])
+        assert (index.lookup('10.2.0.0/16') == ['corporate'])
+        assert (index.lookup('10.0.0.0/7') == [])
+        assert (index.lookup('2001:db8::1') == ['ipv6'])
+        assert (index.contains('10.1.2.3') == True)
+        index.add('11.0.0.0/8', 'other')
+        assert (index.contains('11.1.2.3') == True)
+
+
+    def test_get_subnet_index(self):
+        index = get_subnet_index(['10.0.0.0/8'])
+        assert (get_subnet_index(['10.0.0.0/8']) is index)
+        assert (get_subnet_index(['10.0.0.0/16']) is not index)
+
+    def test_encode_cidr(self):
+        assert (encode_cidr('1.2.3.4') == encode_cidr('1.2.3.4/32'))
+        assert (encode_cidr('1.2.3.4/24') != encode_cidr('1.2.3.4/32'))
+        assert (encode_cidr('::1.2.3.4') != encode_cidr('1.2.3.4'))
+        assert (encode_cidr('2001:db8::/32') == encode_cidr('2001:0db8::/32'))
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+import opinel.utils.columns
+from opinel.utils.columns import *
+from opinel.utils.json_backend import get_json_backend
+
+class TestOpinelUtilsColumns:
+
+    records = [
+        {'ip_prefix': '1.2.3.4/32', 'count': 1, 'ratio': 0.5, 'enabled': True, 'tags': {'a': 'b'},
+         'created': datetime.datetime(2017, 6, 12)},
+        {'ip_prefix': '5.6.7.8/32', 'count': 2, 'ratio': 1, 'enabled': False, 'region': 'us-east-1'},
+        {'ip_prefix': u'résumé', 'count': None, 'ratio': None, 'enabled': None, 'region': 3}
+    ]
+
+    def get_formats(self):
+        return ['arrow', 'parquet', 'npy'] if pyarrow else ['npy']
+
+    def test_get_columnar_format(self):
+        assert (get_columnar_format('results.arrow') == 'arrow')
+        assert (get_columnar_format('results.parquet') == 'parquet')
+        assert (get_columnar_format('results.columns') == 'npy')
+        assert (get_columnar_format('results.json') == None)
+
+    def test_get_default_columnar_format(self):
+        modules = (opinel.utils.columns.pyarrow, opinel.utils.columns.numpy)
+        try:
+            assert (get_default_columnar_format() == ('arrow' if pyarrow else 'npy'))
+            opinel.utils.columns.pyarrow = None
+            assert (get_default_columnar_format() == 'npy')
+            opinel.utils.columns.numpy = None
+            try:
+                get_default_columnar_format()
+                assert False
+            except Exception as e:
+                assert ('requires pyarrow or numpy' in str(e))
+        finally:
+            opinel.utils.columns.pyarrow, opinel.utils.columns.numpy = modules
+
+    def test___normalize_column(self):
+        normalize_column = getattr(opinel.utils.columns, '__normalize_column')
+        date = datetime.datetime(2017, 6, 12, tzinfo = datetime.timezone.utc) if hasattr(datetime, 'timezone') else \
+            datetime.datetime(2017, 6, 12)
+        assert (normalize_column([True, None]) == ('bool', [True, None]))
+        assert (normalize_column([1, 2 ** 70, None]) == ('int', [1, 2 ** 70, None]))
+        assert (normalize_column([1, 0.5, None]) == ('float', [1.0, 0.5, None]))
+        assert (normalize_column([date, None]) == ('datetime', [datetime.datetime(2017, 6, 12), None]))
+        assert (normalize_column([True, 1]) == ('string', ['True', '1']))
+        assert (normalize_column([None, None]) == ('string', [None, None]))
+        assert (normalize_column([]) == ('string', []))
+
+    def test___to_string(self):
+        to_string = getattr(opinel.utils.columns, '__to_string')
+        assert (to_string(None) == None)
+        assert (to_string(u'r\xe9sum\xe9') == u'r\xe9sum\xe9')
+        assert (to_string(u'r\xe9sum\xe9'.encode('utf-8')) == u'r\xe9sum\xe9')
+        assert (to_string(1.5) == u'1.5')
+        assert (json.loads(to_string({'a': [1, 'b']})) == {'a': [1, 'b']})
+        assert (json.loads(to_string([None])) == [None])
+
+    def test___to_arrow_array(self):
+        if pyarrow is None:
+            return
+        to_arrow_array = getattr(opinel.utils.columns, '__to_arrow_array')
+        array = to_arrow_array('int', [1, None])
+        assert (array.type == pyarrow.int64() and array.to_pylist() == [1, None])
+        array = to_arrow_array('datetime', [datetime.datetime(2017, 6, 12), None])
+        assert (array.type == pyarrow.timestamp('us') and array.null_count == 1)
+        for kind, values in [('bool', [True]), ('float', [0.5]), ('string', [u'a'])]:
+            assert (to_arrow_array(kind, values).to_pylist() == values)
+
+    def test___to_numpy_array(self):
+        if numpy is None:
+            return
+        to_numpy_array = getattr(opinel.utils.columns, '__to_numpy_array')
+        assert (to_numpy_array('int', [1, None]).tolist() == [1, 0])
+        assert (to_numpy_array('bool', [True, None]).tolist() == [True, False])
+        assert (numpy.isnan(to_numpy_array('float', [0.5, None])[1]))
+        assert (numpy.isnat(to_numpy_array('datetime', [datetime.datetime(2017, 6, 12), None])[1]))
+        array = to_numpy_array('string', [u'r\xe9sum\xe9', None])
+        assert (array.dtype.kind == 'U' and array.tolist() == [u'r\xe9sum\xe9', u''])
+
+    def test___write_npy_columns(self):
+        if numpy is None:
+            return
+        write_npy_columns = getattr(opinel.utils.columns, '__write_npy_columns')
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            write_npy_columns(tmp_dir, records_to_columns(self.records, ['count', 'ip_prefix']))
+            with open(os.path.join(tmp_dir, npy_metadata_file), 'rt') as f:
+                metadata = json.load(f)
+            assert (metadata['rows'] == 3)
+            assert (metadata['columns'] == [
+                {'name': 'count', 'type': 'int', 'file': 'column-0.npy', 'mask': 'column-0.mask.npy'},
+                {'name': 'ip_prefix', 'type': 'string', 'file': 'column-1.npy', 'mask': None}])
+            assert (sorted(os.listdir(tmp_dir)) == ['column-0.mask.npy', 'column-0.npy', 'column-1.npy', npy_metadata_file])
+            assert (numpy.load(os.path.join(tmp_dir, 'column-0.mask.npy')).tolist() == [False, False, True])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_read_columns(self):
+        for format in self.get_formats():
+            path = 'tmp1%s' % columnar_extensions[format]
+            write_columns(path, self.records, columns = ['ip_prefix', 'ratio'])
+            try:
+                data = read_columns(path, ['ratio'])
+                if format == 'npy':
+                    assert (list(data) == ['ratio'])
+                    assert (data['ratio'].tolist() == [0.5, 1.0, None])
+                else:
+                    assert (data.column_names == ['ratio'])
+                    assert (data.column('ratio').to_pylist() == [0.5, 1.0, None])
+            finally:
+                if format == 'npy':
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+        try:
+            read_columns('tmp1.json')
+            assert False
+        except Exception as e:
+            assert ('tmp1.json' in str(e) or 'pyarrow' in str(e))
+
+    def test___read_npy_columns(self):
+        if numpy is None:
+            return
+        read_npy_columns = getattr(opinel.utils.columns, '__read_npy_columns')
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'tmp1')
+            write_columns(path, self.records, 'npy')
+            data = read_npy_columns(path, None)
+            assert (list(data) == ['ip_prefix', 'count', 'ratio', 'enabled', 'tags', 'created', 'region'])
+            # Columns are memory-mapped, and masked when values are missing
+            assert (type(data['ip_prefix']) == numpy.memmap)
+            assert (type(data['count']) == numpy.ma.MaskedArray and data['count'].mask.tolist() == [False, False, True])
+            assert (list(read_npy_columns(path, ['region', 'missing'])) == ['region'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_records_to_columns(self):
+        columns = records_to_columns(self.records)
+        assert (list(columns) == ['ip_prefix', 'count', 'ratio', 'enabled', 'tags', 'created', 'region'])
+        assert (columns['count'] == ('int', [1, 2, None]))
+        assert (columns['ratio'] == ('float', [0.5, 1.0, None]))
+        assert (columns['enabled'] == ('bool', [True, False, None]))
+        assert (columns['tags'] == ('string', ['{"a":"b"}' if get_json_backend() != 'json' else '{"a": "b"}', None, None]))
+        assert (columns['created'][0] == 'datetime')
+        assert (columns['region'] == ('string', [None, 'us-east-1', '3']))
+        assert (list(records_to_columns(self.records, ['region', 'count'])) == ['region', 'count'])
+
+    def test_write_columns(self):
+        for format in self.get_formats():
+            path = 'tmp1%s' % columnar_extensions[format]
+            write_columns(path, iter(self.records))
+            data = read_columns(path)
+            if format == 'npy':
+                assert (list(data['ip_prefix']) == ['1.2.3.4/32', '5.6.7.8/32', u'résumé'])
+                assert (data['count'].tolist() == [1, 2, None])
+                assert (data['enabled'].tolist() == [True, False, None])
+                assert (str(data['created'][0]) == '2017-06-12T00:00:00.000000')
+                assert (data['region'].tolist() == [None, 'us-east-1', '3'])
+                assert (list(read_columns(path, ['count'])) == ['count'])
+                shutil.rmtree(path)
+            else:
+                assert (data.column('ip_prefix').to_pylist() == ['1.2.3.4/32', '5.6.7.8/32', u'résumé'])
+                assert (data.column('count').to_pylist() == [1, 2, None])
+                assert (data.column('created').to_pylist()[0] == datetime.datetime(2017, 6, 12))
+                assert (read_columns(path, ['count']).column_names == ['count'])
+                os.remove(path)
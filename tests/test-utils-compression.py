@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import os
+
+import opinel.utils.compression
+from opinel.utils.compression import *
+
+class TestOpinelUtilsCompression:
+
+    def get_compressions(self):
+        return ['gzip', 'zstd'] if zstandard else ['gzip']
+
+    def test_get_compression(self):
+        assert (get_compression('results.json.gz') == 'gzip')
+        assert (get_compression('results.ndjson.zst') == 'zstd')
+        assert (get_compression('results.json') == None)
+        assert (is_ndjson_file('results.ndjson.gz'))
+        assert (is_ndjson_file('results.jsonl'))
+        assert (not is_ndjson_file('results.json.gz'))
+
+    def test_is_ndjson_file(self):
+        for filename in ['results.ndjson', 'results.jsonl', 'results.ndjson.gz', 'results.jsonl.zst']:
+            assert (is_ndjson_file(filename))
+        for filename in ['results.json', 'results.json.gz', 'results.ndjson.bz2', 'ndjson', 'results.gz']:
+            assert (not is_ndjson_file(filename))
+
+    def test_open_compressed(self):
+        text = u'{"a": "\xe9"}\n{"a": 2}\n'
+        try:
+            with open('tmp1.txt', 'wb') as f:
+                f.write(text.encode('utf-8'))
+            with open_compressed('tmp1.txt') as f:
+                assert (f.read() == text)
+            for compression in self.get_compressions():
+                filename = 'tmp1.txt%s' % compression_extensions[compression]
+                compressor = get_compressor(compression)
+                with open(filename, 'wb') as f:
+                    f.write(compressor.compress(text.encode('utf-8')) + compressor.flush())
+                with open_compressed(filename) as f:
+                    assert ([line for line in f] == [u'{"a": "\xe9"}\n', u'{"a": 2}\n'])
+                os.remove(filename)
+        finally:
+            os.remove('tmp1.txt')
+
+    def test_get_compressor(self):
+        data = b'abc' * 10000
+        compressor = get_compressor('gzip', 9)
+        compressed = compressor.compress(data) + compressor.flush()
+        assert (len(compressed) < len(data))
+        assert (gzip.GzipFile(fileobj = io.BytesIO(compressed)).read() == data)
+        if zstandard:
+            compressor = get_compressor('zstd')
+            compressed = compressor.compress(data) + compressor.flush()
+            assert (zstandard.ZstdDecompressor().decompressobj().decompress(compressed) == data)
+        try:
+            get_compressor('bz2')
+            assert False
+        except Exception as e:
+            assert ('Unsupported compression bz2' in str(e))
+
+    def test___check_zstandard(self):
+        check_zstandard = getattr(opinel.utils.compression, '__check_zstandard')
+        zstandard_module = opinel.utils.compression.zstandard
+        try:
+            opinel.utils.compression.zstandard = None
+            for function in [check_zstandard, lambda: get_compressor('zstd'), lambda: open_compressed('tmp1.zst')]:
+                try:
+                    function()
+                    assert False
+                except Exception as e:
+                    assert ('zstandard' in str(e))
+            # Other compressions do not need zstandard
+            get_compressor('gzip')
+        finally:
+            opinel.utils.compression.zstandard = zstandard_module
+        if zstandard:
+            check_zstandard()
+
+    def test_compressed_writer(self):
+        text = u''.join(u'line %d é\n' % i for i in range(100000))
+        for compression in self.get_compressions():
+            filename = 'tmp1.txt%s' % compression_extensions[compression]
+            with open(filename, 'wb') as f:
+                writer = CompressedWriter(f, compression)
+                for i in range(0, len(text), 1000):
+                    writer.write(text[i:i + 1000])
+                writer.close()
+            with open_compressed(filename) as f:
+                assert (f.read() == text)
+            os.remove(filename)
+
+    def test_compressed_writer_error(self):
+        writer = CompressedWriter(io.StringIO(), 'gzip')
+        try:
+            for i in range(100):
+                writer.write(u'x' * 100000)
+            writer.close()
+            assert False
+        except TypeError:
+            pass
@@ -1,5 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import dateutil.tz
+import json
+import netaddr
+import operator
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from opinel.utils import conditions
 from opinel.utils.conditions import *
 
 class TestOpinelConditionClass:
@@ -10,6 +20,194 @@ class TestOpinelConditionClass:
     def test___prepare_age_test(self):
         pass
 
+    def test_compile_condition(self):
+        condition = compile_condition('match', ['.*xyx.*', '.*cde.*'])
+        assert [condition(b) for b in ['abcdefg', 'xyz', 'cde']] == [True, False, True]
+        condition = compile_condition('notInSubnets', ['10.0.0.0/8', '192.168.0.0/16'])
+        assert [condition(b) for b in ['10.1.2.3', '172.16.0.1', '192.168.1.0/24']] == [False, True, False]
+        condition = compile_condition('olderThan', [90, 'days'])
+        assert condition(datetime.datetime.now() - datetime.timedelta(days=100)) == True
+        assert condition(datetime.datetime.now() - datetime.timedelta(days=1)) == False
+        condition = compile_condition('containAtLeastOneOf', [1, 'a', ['unhashable']])
+        assert condition(['b', 'a']) == True
+        try:
+            compile_condition('olderThan', '90')
+            assert False
+        except:
+            pass
+        try:
+            compile_condition('opinelunittest', 'a')
+            assert False
+        except:
+            pass
+
+    def test_parse_date(self):
+        for value in ['2016-04-11 12:20:26.996000+00:00', '2016-04-11T12:20:26Z', '2016-04-11T12:20:26.1234567-07:00',
+                      '2017-04-11', 'Apr 11 2016', datetime.datetime(2020, 1, 2, 3, 4, 5, 6)]:
+            assert parse_date(value) == dateutil.parser.parse(str(value)).replace(tzinfo=None)
+        assert parse_date('2017-04-11') is parse_date('2017-04-11')
+        try:
+            parse_date('2016-02-30')
+            assert False
+        except ValueError:
+            pass
+        now = datetime.datetime(2017, 4, 11)
+        assert compile_condition('olderThan', [90, 'days'], now)('2017-01-01') == True
+        assert compile_condition('newerThan', [90, 'days'], now)('2017-01-01') == False
+        assert list(pass_condition_batch(['2017-01-01', '2017-04-01'], 'olderThan', [30, 'days'], now)) == [True, False]
+
+    def test___parse_iso_date(self):
+        parse_iso_date = getattr(conditions, '__parse_iso_date')
+        for value in ['2016-04-11', '2016-04-11T12:20', '2016-04-11 12:20:26', '2016-04-11T12:20:26.5Z',
+                      '2016-04-11T12:20:26.1234567-07:00', '2016-04-11T12:20:26+0530', '2016-04-11 12:20:26.996000+00:00']:
+            assert parse_iso_date(value) == dateutil.parser.parse(value).replace(tzinfo=None)
+        # Not ISO 8601: left to dateutil
+        for value in ['Apr 11 2016', '2016/04/11', '20160411', '2016-04-11T12', '2016-04-11T12:20:26 UTC', '']:
+            assert parse_iso_date(value) == None
+        try:
+            parse_iso_date('2016-02-30T12:00:00Z')
+            assert False
+        except ValueError:
+            pass
+
+    def test___get_age(self):
+        get_age = getattr(conditions, '__get_age')
+        now = datetime.datetime(2017, 4, 11, 12)
+        naive = datetime.datetime(2017, 4, 10, 6)
+        assert get_age(naive, 'days', now) == 1
+        assert get_age(naive, 'seconds', now) == 6 * 3600
+        # Timezones are ignored, like dateutil.parser.parse(...).replace(tzinfo=None)
+        aware = datetime.datetime(2017, 4, 10, 6, tzinfo = dateutil.tz.tzoffset(None, -7 * 3600))
+        assert get_age(aware, 'seconds', now) == 6 * 3600
+        assert get_age('2017-04-10T06:00:00+05:00', 'seconds', now) == 6 * 3600
+        assert get_age('2017-04-10T06:00:00Z', 'days', now) == 1
+        # Dates in the future have negative ages
+        assert get_age('2017-04-12', 'days', now) == -1
+
+    def test_pass_condition_batch(self):
+        dates = [datetime.datetime.now() - datetime.timedelta(days=d, hours=5) for d in [1, 89, 91, 100]]
+        test_cases = [
+            ([1, '2', 3, True], 'lessThan', 2),
+            ([1, 2, 3], 'moreOrEqual', '2'),
+            (['a', 'b', 1], 'equal', 'a'),
+            (['a', 'b', 1], 'notEqual', 1),
+            (dates, 'olderThan', [90, 'days']),
+            (dates, 'newerThan', [6, 'hours']),
+            (dates + ['2016-04-11 12:20:26.996000+00:00'], 'priorToDate', '2017-04-11'),
+            (['abc', 'xyz'], 'match', 'a.*'),
+            ([], 'equal', 'a')
+        ]
+        numpy_module = conditions.numpy
+        try:
+            for numpy in [numpy_module, None]:
+                conditions.numpy = numpy
+                for values, test, a in test_cases:
+                    mask = pass_condition_batch(values, test, a)
+                    assert list(mask) == [pass_condition(b, test, a) for b in values]
+                    if numpy is None:
+                        assert type(mask) == list
+        finally:
+            conditions.numpy = numpy_module
+        try:
+            pass_condition_batch(['1.5'], 'lessThan', 2)
+            assert False
+        except ValueError:
+            pass
+
+    def assert_batch_matches_scalar(self, values, test, a, now = None):
+        now = now or datetime.datetime.now()
+        try:
+            expected = [compile_condition(test, a, now)(b) for b in values]
+        except Exception as e:
+            try:
+                pass_condition_batch(values, test, a, now)
+                assert False
+            except Exception as f:
+                assert type(f) == type(e)
+            return
+        assert list(pass_condition_batch(values, test, a, now)) == expected
+
+    def test_batch_matches_scalar(self):
+        columns = [[1, 2, 3], [True, False], [1.5, -1.5, 2.0], [float('nan')], [float('inf')], [1e20], [2 ** 70],
+                   ['1', '2'], ['1\x00'], [' 2 '], [None]]
+        if numpy is not None:
+            columns.append(numpy.array([1, 2], dtype = numpy.uint64))
+        for values in columns:
+            for test in ['lessThan', 'lessOrEqual', 'moreThan', 'moreOrEqual']:
+                for a in [2, '2', 2 ** 70]:
+                    self.assert_batch_matches_scalar(values, test, a)
+        for values in [['a', 'a\x00', 'a ', 1, None, True], ['\x00']]:
+            for a in ['a', 'a\x00', '\x00', '', 1, True]:
+                self.assert_batch_matches_scalar(values, 'equal', a)
+                self.assert_batch_matches_scalar(values, 'notEqual', a)
+        now = datetime.datetime(2017, 4, 11, 12)
+        dates = ['2017-04-11T11:59:59.999999Z', '2017-04-10T12:00:00+02:00', '2017-01-01', datetime.datetime(2017, 4, 12)]
+        for a in [[1, 'days'], ['12', 'hours'], [90, 'minutes'], [60, 'seconds'], [1, 'weeks'], '1']:
+            self.assert_batch_matches_scalar(dates, 'olderThan', a, now)
+            self.assert_batch_matches_scalar(dates, 'newerThan', a, now)
+        self.assert_batch_matches_scalar(dates, 'priorToDate', '2017-04-10')
+        self.assert_batch_matches_scalar(dates + ['not a date'], 'priorToDate', '2017-04-10')
+
+    def test___batch_compare(self):
+        if numpy is None:
+            return
+        less_than = getattr(conditions, '__batch_compare')(operator.lt)
+        assert list(less_than([1, 2, 3], '2')) == [True, False, False]
+        for values in [[1.5], [float('nan')], ['1'], [None]]:
+            try:
+                less_than(values, 2)
+                assert False
+            except ValueError:
+                pass
+
+    def test___batch_equal(self):
+        if numpy is None:
+            return
+        assert list(getattr(conditions, '__batch_equal')(['a', 'a\x00', 1], 'a')) == [True, False, False]
+        assert list(getattr(conditions, '__batch_equal')([1, True], 1)) == [True, False]
+
+    def test___batch_not_equal(self):
+        if numpy is None:
+            return
+        assert list(getattr(conditions, '__batch_not_equal')(['a', 'a\x00', 1], 'a')) == [False, True, True]
+
+    def test___batch_dates(self):
+        if numpy is None:
+            return
+        dates = getattr(conditions, '__batch_dates')(['2017-04-11T12:00:00.5Z', datetime.datetime(2017, 4, 11)])
+        assert dates.dtype == numpy.dtype('datetime64[us]')
+        assert list(dates.astype(datetime.datetime)) == [datetime.datetime(2017, 4, 11, 12, 0, 0, 500000),
+                                                         datetime.datetime(2017, 4, 11)]
+
+    def test___batch_ages(self):
+        if numpy is None:
+            return
+        now = datetime.datetime(2017, 4, 11, 12)
+        ages, threshold = getattr(conditions, '__batch_ages')(['2017-04-09T11:00:00', '2017-04-11T11:59:00'], [2, 'hours'], now)
+        assert list(ages) == [3600, 60] and threshold == 7200
+        ages, threshold = getattr(conditions, '__batch_ages')(['2017-04-09T11:00:00', '2017-04-11T11:59:00'], [2, 'days'], now)
+        assert list(ages) == [2, 0] and threshold == 2
+
+    def test___batch_prior_to_date(self):
+        if numpy is None:
+            return
+        mask = getattr(conditions, '__batch_prior_to_date')(['2017-04-10', '2017-04-11T00:00:00+05:00'], '2017-04-11')
+        assert list(mask) == [True, False]
+
+    def test___batch_older_than(self):
+        if numpy is None:
+            return
+        now = datetime.datetime(2017, 4, 11, 12)
+        mask = getattr(conditions, '__batch_older_than')(['2017-04-11T05:59:00', '2017-04-11T06:00:00'], [6, 'hours'], now)
+        assert list(mask) == [True, False]
+
+    def test___batch_newer_than(self):
+        if numpy is None:
+            return
+        now = datetime.datetime(2017, 4, 11, 12)
+        mask = getattr(conditions, '__batch_newer_than')(['2017-04-10', '2017-04-09'], [2, 'days'], now)
+        assert list(mask) == [True, False]
+
     def test_pass_condition(self):
 
         assert pass_condition('a', 'equal', 'a') == True
@@ -191,3 +389,204 @@ class TestOpinelConditionClass:
             pass
 
         return
+
+
+    def test_parse_arn(self):
+        arn = parse_arn('arn:aws:iam::123456789012:role/path/name')
+        assert (arn['partition'] == 'aws')
+        assert (arn['service'] == 'iam')
+        assert (arn['region'] == '')
+        assert (arn['account'] == '123456789012')
+        assert (arn['resource'] == 'role/path/name')
+        assert (parse_arn('arn:aws:s3:::bucket/key:with:colons')['resource'] == 'bucket/key:with:colons')
+        assert (parse_arn('123456789012') == None)
+        assert (parse_arn('*') == None)
+        assert pass_condition('arn:aws:sts::123456789012:assumed-role/name', 'isSameAccount', '123456789012') == False
+        assert pass_condition('arn:aws:iam::123456789012:root', 'isSameAccount', 123456789012) == True
+
+
+    def test___listify(self):
+        listify = getattr(conditions, '__listify')
+        assert listify('a') == ['a']
+        test_list = ['a', 'b']
+        assert listify(test_list) is test_list
+
+    def test___compile_cached_condition(self):
+        conditions.compiled_conditions.clear()
+        condition = pass_condition('abc', 'match', ['a.*'])
+        assert conditions.compiled_conditions['match'][(list, ('a.*',))]('abc') == True
+        # Clock tests, cheap tests, and arguments compared by value are not cached
+        assert pass_condition(datetime.datetime.now(), 'olderThan', [1, 'days']) == False
+        assert pass_condition('a', 'equal', 'a') == True
+        assert pass_condition('10.0.0.1', 'inSubnets', [netaddr.IPNetwork('10.0.0.0/8')]) == True
+        assert list(conditions.compiled_conditions) == ['match']
+        # 1 and True are equal keys, but not the same argument
+        assert pass_condition('2016-04-11', 'priorToDate', 2017) == True
+        try:
+            pass_condition('2016-04-11', 'priorToDate', True)
+            assert False
+        except ValueError:
+            pass
+        # Cached lists are copies of the argument
+        regexes = ['x.*']
+        assert pass_condition('xyz', 'match', regexes) == True
+        regexes.append('a.*')
+        assert pass_condition('abc', 'match', regexes) == True
+        assert pass_condition('abc', 'match', ['x.*']) == False
+        max_size = conditions.compiled_conditions_max_size
+        try:
+            conditions.compiled_conditions_max_size = 2
+            pass_condition('abc', 'match', 'b.*')
+            assert len(conditions.compiled_conditions['match']) == 1
+        finally:
+            conditions.compiled_conditions_max_size = max_size
+            conditions.compiled_conditions.clear()
+
+    def test___negate(self):
+        not_equal = getattr(conditions, '__negate')(getattr(conditions, '__equal'))
+        assert not_equal('a', 'a') == False
+        assert not_equal('a', 'b') == True
+
+    def test___negate_compiler(self):
+        compile_not_match = getattr(conditions, '__negate_compiler')(getattr(conditions, '__compile_match'))
+        condition = compile_not_match('a.*')
+        assert [condition(b) for b in ['abc', 'xyz']] == [False, True]
+
+    def test___equal(self):
+        equal = getattr(conditions, '__equal')
+        assert equal(1, '1') == True
+        assert equal(True, 1) == False
+
+    def test___less_than(self):
+        assert getattr(conditions, '__less_than')('1', 2) == True
+        assert getattr(conditions, '__less_than')(2, '2') == False
+
+    def test___less_or_equal(self):
+        assert getattr(conditions, '__less_or_equal')('2', 2) == True
+        assert getattr(conditions, '__less_or_equal')(3, '2') == False
+
+    def test___more_than(self):
+        assert getattr(conditions, '__more_than')('3', 2) == True
+        assert getattr(conditions, '__more_than')(2, '2') == False
+
+    def test___more_or_equal(self):
+        assert getattr(conditions, '__more_or_equal')('2', 2) == True
+        assert getattr(conditions, '__more_or_equal')(1, '2') == False
+
+    def test___empty(self):
+        empty = getattr(conditions, '__empty')
+        assert [empty(b, '') for b in [{}, [], [None], '', None, [None, None]]] == [True, True, True, False, False, False]
+
+    def test___null(self):
+        null = getattr(conditions, '__null')
+        assert [null(b, '') for b in [None, 'None', '', 'none', []]] == [True, True, False, False, False]
+
+    def test___true(self):
+        true = getattr(conditions, '__true')
+        assert [true(b, '') for b in [True, 'TRUE', 1, 'yes']] == [True, True, False, False]
+
+    def test___false(self):
+        false = getattr(conditions, '__false')
+        assert [false(b, '') for b in [False, 'False', 0, None]] == [True, True, False, False]
+
+    def test___length_less_than(self):
+        assert getattr(conditions, '__length_less_than')('ab', '3') == True
+        assert getattr(conditions, '__length_less_than')(['a', 'b'], 2) == False
+
+    def test___length_more_than(self):
+        assert getattr(conditions, '__length_more_than')('abcd', '3') == True
+        assert getattr(conditions, '__length_more_than')({'a': 'b'}, 1) == False
+
+    def test___length_equal(self):
+        assert getattr(conditions, '__length_equal')('abc', '3') == True
+        assert getattr(conditions, '__length_equal')([], 1) == False
+
+    def test___with_key(self):
+        assert getattr(conditions, '__with_key')({'a': 'b'}, 'a') == True
+        assert getattr(conditions, '__with_key')({'a': 'b'}, 'b') == False
+
+    def test___contain_at_least_one_of(self):
+        contain_at_least_one_of = getattr(conditions, '__contain_at_least_one_of')
+        assert contain_at_least_one_of([1, 'b'], ['1']) == True
+        assert contain_at_least_one_of(1, [1]) == False
+        assert contain_at_least_one_of(['b', 'a'], [1, 'a', ['unhashable']]) == True
+
+    def test___contain_at_least_one_different_from(self):
+        contain_at_least_one_different_from = getattr(conditions, '__contain_at_least_one_different_from')
+        assert contain_at_least_one_different_from([None, '', 'a'], 'a') == False
+        assert contain_at_least_one_different_from([None, 'b'], ['a']) == True
+
+    def test___contain_none_of(self):
+        contain_none_of = getattr(conditions, '__contain_none_of')
+        assert contain_none_of(['a', 'b'], 'c') == True
+        assert contain_none_of('b', ['a', 'b']) == False
+
+    def test___compile_match(self):
+        condition = getattr(conditions, '__compile_match')(['x.*', 'a.*'])
+        assert [condition(b) for b in ['abc', 'bxa', 1]] == [True, False, False]
+
+    def test___compile_prior_to_date(self):
+        condition = getattr(conditions, '__compile_prior_to_date')('2017-04-11')
+        assert condition('2016-04-11T12:20:26Z') == True
+        assert condition(datetime.datetime(2017, 4, 11)) == False
+
+    def test___compile_older_than(self):
+        now = datetime.datetime(2017, 4, 11, 12)
+        condition = getattr(conditions, '__compile_older_than')([6, 'hours'], now)
+        assert condition('2017-04-11T05:59:00Z') == True
+        assert condition('2017-04-11T06:00:00Z') == False
+
+    def test___compile_newer_than(self):
+        now = datetime.datetime(2017, 4, 11, 12)
+        condition = getattr(conditions, '__compile_newer_than')(['2', 'days'], now)
+        assert condition('2017-04-10') == True
+        assert condition('2017-04-09') == False
+
+    def test___compile_in_subnets(self):
+        condition = getattr(conditions, '__compile_in_subnets')('10.0.0.0/8')
+        assert [condition(b) for b in ['10.1.2.3', '10.0.0.0/7', '11.0.0.1']] == [True, False, False]
+
+    def test___compile_contain_action(self):
+        condition = getattr(conditions, '__compile_contain_action')('iam:Get*')
+        assert condition({'Effect': 'Allow', 'Action': 'iam:GetUser', 'Resource': '*'}) == True
+        assert condition({'Effect': 'Allow', 'Action': ['s3:GetObject'], 'Resource': '*'}) == False
+
+    def test___compile_contain_at_least_one_action(self):
+        condition = getattr(conditions, '__compile_contain_at_least_one_action')(['iam:CreateUser', 'IAM:GetUser'])
+        assert condition({'Effect': 'Allow', 'Action': 'iam:getuser', 'Resource': '*'}) == True
+        assert condition({'Effect': 'Allow', 'Action': 'iam:DeleteUser', 'Resource': '*'}) == False
+
+    def test___is_account_principal(self):
+        is_account_principal = getattr(conditions, '__is_account_principal')
+        assert is_account_principal(123456789012, 123456789012) == True
+        assert is_account_principal('arn:aws:iam::123456789012:root', 123456789012) == True
+        assert is_account_principal('arn:aws:iam::123456789013:root', '123456789012') == False
+        # Malformed ARNs, other partitions and services, and accounts in other fields never match
+        for principal in ['arn:aws:iam::123456789012', 'arn:aws:iam:123456789012:root', 'arn:aws:iam:::123456789012:root',
+                          'arn:aws-cn:iam::123456789012:root', 'arn:aws:sts::123456789012:root',
+                          'xarn:aws:iam::123456789012:root', 'arn:aws:iam::1234567890123:root', '', '*']:
+            assert is_account_principal(principal, '123456789012') == False
+        for principal in [123456789012, None, {'AWS': '123456789012'}]:
+            try:
+                is_account_principal(principal, '123456789012')
+                assert False
+            except TypeError:
+                pass
+
+    def test___is_cross_account(self):
+        is_cross_account = getattr(conditions, '__is_cross_account')
+        assert is_cross_account(['123456789012', 'arn:aws:iam::123456789012:root'], '123456789012') == False
+        assert is_cross_account(['123456789012', '123456789013'], '123456789012') == True
+        # Principals that are not strings raise the same error as before test cases were compiled
+        for test in ['isCrossAccount', 'isSameAccount']:
+            for principal in [123456789013, [None], {'AWS': '123456789012'}]:
+                try:
+                    pass_condition(principal, test, '123456789012')
+                    assert False
+                except TypeError:
+                    pass
+
+    def test___is_same_account(self):
+        is_same_account = getattr(conditions, '__is_same_account')
+        assert is_same_account(['123456789013', 'arn:aws:iam::123456789012:user/name'], '123456789012') == True
+        assert is_same_account('arn:aws:sts::123456789012:assumed-role/name', '123456789012') == False
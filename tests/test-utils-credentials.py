@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import copy
+import json
 import shutil
+import time
+from opinel.utils.console import configPrintException
 from opinel.utils.credentials import *
 
 class TestOpinelCredentialsClass:
@@ -126,6 +129,36 @@ class TestOpinelCredentialsClass:
         creds = read_creds_from_aws_credentials_file('test')
 
 
+    def test_read_creds_for_profiles(self):
+        credentials = read_creds_for_profiles(['l01cd3v-1', 'l01cd3v-2', 'l01cd3v-1'], max_workers = 2)
+        assert sorted(credentials.keys()) == ['l01cd3v-1', 'l01cd3v-2']
+        assert credentials['l01cd3v-1']['AccessKeyId'] == 'AKIAXXXXXXXXXXXXXXX1'
+        assert credentials['l01cd3v-2']['SecretAccessKey'] == 'deadbeefdeadbeefdeadbeefdeadbeef22222222'
+        memo = CredentialsMemo()
+        creds1 = memo.get('l01cd3v-2')
+        creds2 = memo.get('l01cd3v-2')
+        assert creds1 == creds2 and creds1 is not creds2
+        assert len(memo.credentials) == 1
+        # Profiles that are one another's source profile fail instead of deadlocking
+        with open(aws_config_file, 'at') as f:
+            f.write('\n[profile cycle-a]\nrole_arn = arn:aws:iam::123456789012:role/a\nsource_profile = cycle-b\n'
+                    '[profile cycle-b]\nrole_arn = arn:aws:iam::123456789012:role/b\nsource_profile = cycle-a\n'
+                    '[profile cycle-self]\nrole_arn = arn:aws:iam::123456789012:role/self\nsource_profile = cycle-self\n')
+        for profile_name, chain in [('cycle-a', 'cycle-a -> cycle-b -> cycle-a'), ('cycle-self', 'cycle-self -> cycle-self')]:
+            try:
+                CredentialsMemo().get(profile_name)
+                assert False
+            except Exception as e:
+                assert str(e) == 'Error: cyclic source_profile, %s' % chain
+        configPrintException(False)
+        for i in range(5):
+            start = time.time()
+            credentials = read_creds_for_profiles(['cycle-a', 'cycle-b', 'cycle-self'], max_workers = 2, timeout = 30)
+            assert time.time() - start < 10
+            assert credentials == {'cycle-a': {'AccessKeyId': None}, 'cycle-b': {'AccessKeyId': None},
+                                   'cycle-self': {'AccessKeyId': None}}
+
+
     def test_read_creds_from_csv(self):
         creds = read_creds_from_csv('tests/data/accessKeys1.csv')
         assert creds != None
@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import csv
 import datetime
+import io
+import json
+import re
+import shutil
+import tempfile
+from collections import OrderedDict
 
+import opinel.utils.fs
 from opinel.utils.fs import *
+from opinel.utils.compression import zstandard
+from opinel.utils.json_backend import set_json_backend
 from opinel.utils.console import configPrintException, printError
 
 class TestOpinelFsClass:
@@ -48,6 +58,57 @@ class TestOpinelFsClass:
         assert test == None
 
 
+    def test_load_data_cache(self):
+        invalidate_data_cache()
+        test = load_data('protocols.json', 'protocols')
+        assert (data_cache.stats()['size'] == 1)
+        # Each call returns a copy, which callers may modify
+        test['1'] = 'modified'
+        assert (load_data('protocols.json', 'protocols')['1'] == 'ICMP')
+        prefixes = load_data('ip-ranges/aws.json', 'prefixes')
+        assert (type(prefixes) == list and type(prefixes[0]) == dict)
+        prefixes[0]['region'] = 'modified'
+        prefixes.append({})
+        assert (load_data('ip-ranges/aws.json', 'prefixes')[0]['region'] != 'modified')
+        assert (len(load_data('ip-ranges/aws.json', 'prefixes')) == len(prefixes) - 1)
+        assert (data_cache.stats()['size'] == 2)
+        # Local files are not cached
+        load_data('tests/data/protocols.json', 'protocols', True)
+        assert (data_cache.stats()['size'] == 2)
+
+    def test_invalidate_data_cache(self):
+        invalidate_data_cache()
+        load_data('protocols.json', 'protocols')
+        load_data('protocols.json')
+        load_data('ip-ranges/aws.json', 'prefixes')
+        assert (invalidate_data_cache('protocols.json') == 2)
+        assert (invalidate_data_cache('protocols.json') == 0)
+        assert (invalidate_data_cache() == 1)
+        assert (len(data_cache) == 0)
+
+    def test___load_data_file(self):
+        load_data_file = getattr(opinel.utils.fs, '__load_data_file')
+        assert (load_data_file('tests/data/protocols.json', 'protocols', 'json')['-2'] == 'TEST')
+        assert (load_data_file('tests/data/protocols.txt', None, 'txt').rstrip() == 'some text here')
+        assert (load_data_file('tests/data/protocols.txt', 'protocols', 'txt') == None)
+        try:
+            save_blob_as_json('tmp1.ndjson', [{'a': 1}, {'a': 2}], True, False, output_format = 'ndjson')
+            assert (load_data_file('tmp1.ndjson', None, 'json') == [{'a': 1}, {'a': 2}])
+            assert (load_data_file('tmp1.ndjson', 'a', 'json') == None)
+        finally:
+            os.remove('tmp1.ndjson')
+        backend = get_json_backend()
+        for name in ['json', 'orjson']:
+            try:
+                set_json_backend(name)
+            except Exception:
+                continue
+            try:
+                assert (load_data_file('tests/data/protocols.json', 'protocols', 'json')['-2'] == 'TEST')
+            finally:
+                set_json_backend(backend)
+
+
     def test_read_default_args(self):
         pass
 
@@ -117,13 +178,329 @@ class TestOpinelFsClass:
         save_blob_as_json('tmp1.json', {'foo': 'bar','date': date}, True, False)
         save_blob_as_json('tmp1.json', {'foo': 'bar'}, True, True)
         save_blob_as_json('/root/tmp1.json', {'foo': 'bar'}, True, True)
+        # Files written with each JSON library differ in whitespace only
+        blob = {'foo': [u'caf\xe9', 1.5, None, float('inf')], 'date': date, 'bar': {'baz': 2 ** 70}}
+        contents = {}
+        try:
+            for backend in ['json', 'ujson', 'orjson']:
+                try:
+                    set_json_backend(backend)
+                except Exception:
+                    continue
+                save_blob_as_json('tmp1.json', blob, True, False)
+                contents[backend] = load_data('tmp1.json', local_file = True)
+        finally:
+            set_json_backend()
+            os.remove('tmp1.json')
+        assert (all(data == contents['json'] for data in contents.values()))
+        assert (contents['json']['foo'][3] == float('inf'))
+
+    def test_write_json(self):
+        blob = {'services': {'ec2': {'regions': {'us-east-1': {'vpcs': {'vpc-%d' % i: {'id': i, 'tags': [1, 2.5, None, True]}
+                for i in range(10)}}}}}, 'date': datetime.datetime(2017, 6, 12), 'empty': {}, 'ints': {2: 'b', 1: 'a'}}
+        backend = get_json_backend()
+        try:
+            set_json_backend('json')
+            for indent in [None, 4]:
+                f = io.StringIO()
+                write_json(f, blob, indent)
+                assert (f.getvalue() == json.dumps(blob, indent=indent, separators=(',', ': '), sort_keys=True, cls=CustomJSONEncoder))
+            save_blob_as_json('tmp1.json', blob, True, False)
+            with open('tmp1.json', 'rt') as f:
+                assert (f.read() == json.dumps(blob, separators=(',', ': '), sort_keys=True, cls=CustomJSONEncoder) + '\n')
+        finally:
+            set_json_backend(backend)
+        f = io.StringIO()
+        write_json(f, blob)
+        assert (json.loads(f.getvalue()) == json.loads(json.dumps(blob, sort_keys=True, cls=CustomJSONEncoder)))
+        # Failed writes leave the previous file untouched
+        configPrintException(True)
+        save_blob_as_json('tmp1.json', {'foo': object()}, True, False)
+        assert (load_data('tmp1.json', 'date', local_file = True) == '2017-06-12 00:00:00')
+        assert ([f for f in os.listdir('.') if f.startswith('.tmp1.json.')] == [])
+        os.remove('tmp1.json')
+
+    def test_save_compressed(self):
+        blob = {'foo': 'bar', 'date': datetime.datetime(2017, 6, 12), 'list': list(range(1000))}
+        expected = json.loads(json.dumps(blob, cls=CustomJSONEncoder))
+        for compression in ['gzip', 'zstd'] if zstandard else ['gzip']:
+            filename = save_blob_as_json('tmp1.json', blob, True, False, compression = compression)
+            assert (filename == 'tmp1.json%s' % compression_extensions[compression])
+            assert (load_data(filename, local_file = True) == expected)
+            assert (list(stream_data(filename, 'list', local_file = True)) == expected['list'])
+            os.remove(filename)
+            filename = save_blob_as_json('tmp1.json', blob, True, False, 'ndjson', compression)
+            assert (filename == 'tmp1.ndjson%s' % compression_extensions[compression])
+            assert (load_data(filename, local_file = True) == [{k: expected[k]} for k in sorted(expected)])
+            assert (list(stream_data(filename, local_file = True)) == [{k: expected[k]} for k in sorted(expected)])
+            os.remove(filename)
+        save_ip_ranges('default', [{'ip_prefix': '5.6.7.8/32'}, {'ip_prefix': '1.2.3.4/32'}], True, False, 'ndjson', 'gzip')
+        assert (read_ip_ranges('ip-ranges-default.ndjson.gz', ip_only = True) == ['5.6.7.8/32', '1.2.3.4/32'])
+        os.remove('ip-ranges-default.ndjson.gz')
+
+    def test_save_blob_as_columns(self):
+        prefixes = [{'ip_prefix': '1.2.3.4/32', 'region': 'us-east-1'}, {'ip_prefix': '5.6.7.8/32'}]
+        filename = save_blob_as_columns('tmp1', prefixes, True, 'npy')
+        assert (filename == 'tmp1.columns')
+        assert (load_columns(filename)['region'].tolist() == ['us-east-1', None])
+        shutil.rmtree(filename)
+        save_ip_ranges('default', prefixes, True, False, 'npy')
+        assert (load_columns('ip-ranges-default.columns')['ip_prefix'].tolist() == ['1.2.3.4/32', '5.6.7.8/32'])
+        shutil.rmtree('ip-ranges-default.columns')
+
+    def test_get_output_filename(self):
+        assert (get_output_filename('results.json') == 'results.json')
+        assert (get_output_filename('results.json', 'ndjson') == 'results.ndjson')
+        assert (get_output_filename('results.json', 'ndjson', 'gzip') == 'results.ndjson.gz')
+        assert (get_output_filename('results.json.zst', 'json', 'zstd') == 'results.json.zst')
+        assert (get_output_filename('results.csv', 'csv', 'gzip') == 'results.csv.gz')
+
+    def test_open_output_file(self):
+        text = u'{"a": "\xe9"}\n'
+        compressions = [None, 'gzip', 'zstd'] if zstandard else [None, 'gzip']
+        for compression in compressions:
+            filename = get_output_filename('tmp1.json', compression = compression)
+            try:
+                with open_output_file(filename, compression) as f:
+                    f.write(text)
+                with open_compressed(filename) as f:
+                    assert (f.read() == text)
+                # Failed writes leave the previous file in place
+                try:
+                    with open_output_file(filename, compression) as f:
+                        f.write(u'{"a": ')
+                        raise ValueError('unittest')
+                except ValueError:
+                    pass
+                with open_compressed(filename) as f:
+                    assert (f.read() == text)
+            finally:
+                os.remove(filename)
+
+    def test_write_ndjson(self):
+        for blob in [[{'a': 1}, 'b', None], iter([{'a': 1}, 'b', None])]:
+            f = io.StringIO()
+            write_ndjson(f, blob)
+            assert (f.getvalue().splitlines() == [json_dumps({'a': 1}), '"b"', 'null'])
+        f = io.StringIO()
+        write_ndjson(f, {'b': [1], 'a': {'c': datetime.datetime(2017, 6, 12)}})
+        assert ([json.loads(line) for line in f.getvalue().splitlines()] == [{'a': {'c': '2017-06-12 00:00:00'}},
+                                                                              {'b': [1]}])
+        f = io.StringIO()
+        write_ndjson(f, [])
+        assert (f.getvalue() == '')
+
+    def test_iter_unique_prefixes(self):
+        prefixes = load_data('ip-ranges/aws.json', 'prefixes')
+        unique_prefixes = list(iter_unique_prefixes(prefixes + prefixes))
+        assert (unique_prefixes[:3] == prefixes[:3])
+        assert (len(unique_prefixes) == len(set(p['ip_prefix'] for p in prefixes)))
+        # Equivalent notations of a prefix are duplicates, the first one is kept
+        prefixes = iter_unique_prefixes(['1.2.3.4', {'ip_prefix': '1.2.3.4/32', 'region': 'a'}, '10.0.0.0/8',
+                                         OrderedDict([('ip_prefix', '10.0.0.0/8')]), 'not an ip', 'not an ip'])
+        assert (list(prefixes) == [{'ip_prefix': '1.2.3.4'}, {'ip_prefix': '10.0.0.0/8'}, {'ip_prefix': 'not an ip'}])
+        # Prefixes are consumed lazily
+        consumed = []
+        def generate():
+            for prefix in ['1.2.3.4', '5.6.7.8']:
+                consumed.append(prefix)
+                yield prefix
+        prefixes = iter_unique_prefixes(generate())
+        assert (next(prefixes) == {'ip_prefix': '1.2.3.4'})
+        assert (consumed == ['1.2.3.4'])
+
+    def test_write_ip_ranges_csv(self):
+        f = io.StringIO()
+        prefixes = load_data('ip-ranges/aws.json', 'prefixes')[:2]
+        write_ip_ranges_csv(f, [{'ip_prefix': '1.2.3.4/32', 'account_id': '123456789012', 'region': 'us-east-1',
+                                 'instance_id': 'i-1', 'name': 'a,b'}] + prefixes)
+        rows = list(csv.reader(io.StringIO(f.getvalue())))
+        assert (rows[0] == ['account_id', 'region', 'ip', 'instance_id', 'instance_name'])
+        assert (rows[1] == ['123456789012', 'us-east-1', '1.2.3.4/32', 'i-1', 'a,b'])
+        assert (rows[2:] == [['', p['region'], p['ip_prefix'], '', ''] for p in prefixes])
+        try:
+            write_ip_ranges_csv(io.StringIO(), [{'region': 'us-east-1'}])
+            assert False
+        except KeyError:
+            pass
+
+    def test_atomic_write(self):
+        tmp_dir = tempfile.mkdtemp()
+        umask = os.umask(0o027)
+        try:
+            filename = os.path.join(tmp_dir, 'tmp1.json')
+            with atomic_write(filename) as f:
+                f.write('a')
+                # Readers never see a partially written file
+                assert (not os.path.exists(filename))
+            assert (read_file(filename) == 'a')
+            # New files get the same mode as with open()
+            assert (os.stat(filename).st_mode & 0o777 == 0o640)
+            os.chmod(filename, 0o600)
+            with atomic_write(filename, 'wb') as f:
+                f.write(b'b')
+            assert (read_file(filename) == 'b')
+            assert (os.stat(filename).st_mode & 0o777 == 0o600)
+            # The destination is untouched and the temporary file is removed on failure
+            try:
+                with atomic_write(filename) as f:
+                    f.write('c')
+                    raise ValueError('unittest')
+            except ValueError:
+                pass
+            assert (read_file(filename) == 'b')
+            assert (os.listdir(tmp_dir) == ['tmp1.json'])
+        finally:
+            os.umask(umask)
+            shutil.rmtree(tmp_dir)
+
+    def test___open_temp_file(self):
+        open_temp_file = getattr(opinel.utils.fs, '__open_temp_file')
+        tmp_dir = tempfile.mkdtemp()
+        umask = os.umask(0o027)
+        try:
+            filename = os.path.join(tmp_dir, 'tmp1.json')
+            fd1, tmp_filename1 = open_temp_file(filename)
+            fd2, tmp_filename2 = open_temp_file(filename)
+            os.close(fd1)
+            os.close(fd2)
+            assert (tmp_filename1 != tmp_filename2)
+            assert (os.path.dirname(tmp_filename1) == tmp_dir)
+            assert (os.path.basename(tmp_filename1).startswith('.tmp1.json.'))
+            assert (os.stat(tmp_filename1).st_mode & 0o777 == 0o640)
+            assert (not os.path.exists(filename))
+        finally:
+            os.umask(umask)
+            shutil.rmtree(tmp_dir)
+
+    def test___get_file_mode(self):
+        get_file_mode = getattr(opinel.utils.fs, '__get_file_mode')
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, 'tmp1.json')
+            assert (get_file_mode(filename) is None)
+            with open(filename, 'wt') as f:
+                f.write('a')
+            os.chmod(filename, 0o604)
+            assert (get_file_mode(filename) == 0o604)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test___iterencode(self):
+        iterencode = getattr(opinel.utils.fs, '__iterencode')
+        encode = CustomJSONEncoder(separators = (',', ': '), sort_keys = True).encode
+        blob = {'b': [1, {'c': {'d': [2]}}, []], 'a': {}, 'e': {1: 'f'}, 'g': 'h', 'i': datetime.datetime(2017, 6, 12)}
+        for depth in range(5):
+            assert (''.join(iterencode(encode, ': ', blob, depth)) == encode(blob))
+        assert (list(iterencode(encode, ': ', {'a': [1, 2]}, 1)) == ['{"a": ', '[1,2]', '}'])
+        assert (list(iterencode(encode, ': ', {'a': [1, 2]}, 2)) == ['{"a": ', '[', '1', ',', '2', ']', '}'])
+        # Dictionaries with keys that are not strings are encoded as a whole, so that keys are converted and sorted
+        # by the encoder
+        assert (list(iterencode(encode, ': ', {1: 'a'}, 4)) == ['{"1": "a"}'])
+
+    def test_load_columns(self):
+        records = [{'ip_prefix': '1.2.3.4/32', 'region': 'us-east-1'}, {'ip_prefix': '5.6.7.8/32', 'region': None}]
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = save_blob_as_columns(os.path.join(tmp_dir, 'tmp1'), records, True, 'npy')
+            data = load_columns(filename)
+            assert (list(data) == ['ip_prefix', 'region'])
+            assert (data['region'].tolist() == ['us-east-1', None])
+            assert (list(load_columns(filename, columns = ['region'])) == ['region'])
+            if get_default_columnar_format() == 'arrow':
+                for format in ['arrow', 'parquet']:
+                    filename = save_blob_as_columns(os.path.join(tmp_dir, 'tmp1'), records, True, format)
+                    table = load_columns(filename, columns = ['ip_prefix'])
+                    assert (table.column_names == ['ip_prefix'])
+                    assert (table.column('ip_prefix').to_pylist() == ['1.2.3.4/32', '5.6.7.8/32'])
+        finally:
+            shutil.rmtree(tmp_dir)
 
     def test_save_ip_ranges(self):
         if os.path.isfile('ip-ranges-default.json'):
             os.remove('ip-ranges-default.json')
         save_ip_ranges('default', ['1.2.3.4'], False, False)
         save_ip_ranges('default', [{'ip_prefix': '5.6.7.8'}], True, True)
+        prefixes = [{'ip_prefix': '1.2.3.4/32', 'account_id': '123456789012', 'region': 'us-east-1',
+                     'instance_id': 'i-1', 'name': 'a, "quoted" name'}, '1.2.3.4', '5.6.7.8/32', 'not an ip', 'not an ip']
+        assert (list(iter_unique_prefixes(prefixes)) == [prefixes[0], {'ip_prefix': '5.6.7.8/32'}, {'ip_prefix': 'not an ip'}])
+        save_ip_ranges('default', iter(prefixes), True, False, 'csv')
+        with open('ip-ranges-default.csv', 'rt') as f:
+            rows = list(csv.reader(f))
+        assert (rows == [['account_id', 'region', 'ip', 'instance_id', 'instance_name'],
+                         ['123456789012', 'us-east-1', '1.2.3.4/32', 'i-1', 'a, "quoted" name'],
+                         ['', '', '5.6.7.8/32', '', ''], ['', '', 'not an ip', '', '']])
+        os.remove('ip-ranges-default.csv')
+
+    def test_map_file(self):
+        with map_file('tests/data/protocols.json') as buffer:
+            assert (re.search(b'"-2": *"TEST"', buffer) != None)
+            view = memoryview(buffer)
+            assert (json_loads(view)['protocols']['-2'] == 'TEST')
+            view.release()
+        with open('tmp1.json', 'wt') as f:
+            pass
+        with map_file('tmp1.json') as buffer:
+            assert (len(buffer) == 0)
+        os.remove('tmp1.json')
+        backend = get_json_backend()
+        try:
+            for json_backend in ['orjson', 'json']:
+                try:
+                    set_json_backend(json_backend)
+                except Exception:
+                    continue
+                assert (load_data('tests/data/protocols.json', 'protocols', local_file = True)['-2'] == 'TEST')
+        finally:
+            set_json_backend(backend)
 
     def test_read_file(self):
         test = read_file('tests/data/protocols.txt')
         assert (test.rstrip() == 'some text here')
+
+    def test_get_data_file_path(self):
+        assert (get_data_file_path('/tmp/foo.json', True) == '/tmp/foo.json')
+        assert (get_data_file_path('foo.json', True) == os.path.join(os.getcwd(), 'foo.json'))
+        src_file = get_data_file_path('protocols.json')
+        assert (os.path.isfile(src_file))
+        assert (os.path.dirname(src_file) == os.path.dirname(get_data_file_path('ip-ranges')))
+
+    def test_get_ip_ranges_store(self):
+        store = get_ip_ranges_store('ip-ranges/aws.json', local_file = False)
+        assert (get_ip_ranges_store('ip-ranges/aws.json', local_file = False) is store)
+        conditions = [ [ 'region', 'equal', 'us-east-1' ], [ 'service', 'match', 'EC.*' ] ]
+        prefixes = store.filter(conditions)
+        assert (len(prefixes) > 0)
+        assert (prefixes == [ p for p in load_data('ip-ranges/aws.json', 'prefixes')
+                              if p['region'] == 'us-east-1' and p['service'].startswith('EC') ])
+        prefixes[0]['region'] = 'modified'
+        assert (store.filter(conditions)[0]['region'] == 'us-east-1')
+        assert (store.filter(conditions, ip_only = True) == [ p['ip_prefix'] for p in prefixes ])
+        assert (store.filter([ [ 'region', 'equal', 'nowhere' ] ]) == [])
+        matches = store.lookup('23.20.1.2')
+        assert ('23.20.0.0/14' in [ p['ip_prefix'] for p in matches ])
+        assert (store.lookup('10.0.0.1') == [])
+        # Files are reloaded when their modification time or size changed
+        try:
+            save_blob_as_json('tmp1.json', {'prefixes': [{'ip_prefix': '1.2.3.4/32'}]}, True, False)
+            os.utime('tmp1.json', (1000, 1000))
+            store = get_ip_ranges_store('tmp1.json')
+            assert (store.stat_key[1] == os.stat('tmp1.json').st_size)
+            assert (read_ip_ranges('tmp1.json', ip_only = True) == ['1.2.3.4/32'])
+            assert (get_ip_ranges_store(os.path.join(os.getcwd(), 'tmp1.json')) is store)
+            save_blob_as_json('tmp1.json', {'prefixes': [{'ip_prefix': '10.20.30.40/32'}]}, True, False)
+            os.utime('tmp1.json', (1000, 1000))
+            reloaded = get_ip_ranges_store('tmp1.json')
+            assert (reloaded is not store)
+            assert (read_ip_ranges('tmp1.json', ip_only = True) == ['10.20.30.40/32'])
+            os.utime('tmp1.json', (2000, 2000))
+            assert (get_ip_ranges_store('tmp1.json') is not reloaded)
+        finally:
+            os.remove('tmp1.json')
+
+    def test_stream_data(self):
+        prefixes = load_data('ip-ranges/aws.json', 'prefixes')
+        assert (list(stream_data('ip-ranges/aws.json', 'prefixes', chunk_size = 1000)) == prefixes)
+        assert (list(load_data('ip-ranges/aws.json', 'prefixes', streaming = True)) == prefixes)
+        protocols = dict(stream_data('tests/data/protocols.json', ['protocols'], local_file = True))
+        assert (protocols['-2'] == 'TEST')
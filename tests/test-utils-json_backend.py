@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import io
+import json
+from collections import OrderedDict
+
+import opinel.utils.json_backend
+from opinel.utils.json_backend import *
+
+class TestOpinelUtilsJsonBackend:
+
+    def get_installed_backends(self):
+        backends = []
+        for backend in json_backends:
+            try:
+                set_json_backend(backend)
+                backends.append(backend)
+            except Exception:
+                pass
+        set_json_backend()
+        return backends
+
+    class Resource(object):
+        def __init__(self):
+            self.name = u'résource'
+            self.created = datetime.datetime(2017, 6, 12, 1, 2, 3)
+
+    def test_json_dumps(self):
+        blob = {'b': [1, 2.5, None, True, u'caf\xe9 / "quoted"'], 'a': self.Resource(), 'c': {2: 'x', 1: 'y'},
+                'date': datetime.datetime(2017, 6, 12), 'big': 2 ** 70}
+        expected = json.dumps(blob, separators=(',', ': '), sort_keys=True, cls=CustomJSONEncoder)
+        backends = self.get_installed_backends()
+        assert ('json' in backends)
+        try:
+            for backend in backends:
+                set_json_backend(backend)
+                output = json_dumps(blob)
+                assert (json.loads(output) == json.loads(expected))
+                assert (list(json.loads(output, object_pairs_hook = OrderedDict)) == ['a', 'b', 'big', 'c', 'date'])
+                assert (json_dumps(blob, indent = 4) == json.dumps(blob, indent=4, separators=(',', ': '), sort_keys=True, cls=CustomJSONEncoder))
+                assert (json_loads(output) == json.loads(expected))
+                assert (json_loads(output.encode('utf-8')) == json.loads(expected))
+                assert (json_load(io.StringIO(output)) == json.loads(expected))
+                try:
+                    json_loads('{"a": ')
+                    assert False
+                except ValueError:
+                    pass
+            set_json_backend('json')
+            assert (json_dumps(blob) == expected)
+            # NaN and infinite floats are written by the json library, not as null
+            blob = {'a': [1.5, float('inf'), None], 'b': {'c': float('nan')}, 'd': self.Resource()}
+            blob['d'].value = float('-inf')
+            expected = json.dumps(blob, separators=(',', ': '), sort_keys=True, cls=CustomJSONEncoder)
+            assert ('NaN' in expected and '-Infinity' in expected)
+            for backend in backends:
+                set_json_backend(backend)
+                assert (json_dumps(blob) == expected)
+        finally:
+            set_json_backend()
+
+    def test___has_non_finite_float(self):
+        has_non_finite_float = getattr(opinel.utils.json_backend, '__has_non_finite_float')
+        resource = self.Resource()
+        assert (has_non_finite_float([1, 2.5, None, True, 'NaN', {'a': resource}]) == False)
+        for value in [float('nan'), float('inf'), float('-inf')]:
+            assert (has_non_finite_float(value) == True)
+            assert (has_non_finite_float({'a': [(1, value)]}) == True)
+            resource.value = value
+            assert (has_non_finite_float([resource]) == True)
+
+    def test_get_json_backend(self):
+        backends = self.get_installed_backends()
+        try:
+            assert (get_json_backend() == backends[0])
+            set_json_backend('json')
+            assert (get_json_backend() == 'json')
+        finally:
+            set_json_backend()
+
+    def test_get_key_separator(self):
+        try:
+            for backend in self.get_installed_backends():
+                set_json_backend(backend)
+                assert (json_dumps({'a': 1}) == '{"a"%s1}' % get_key_separator())
+        finally:
+            set_json_backend()
+
+    def test_json_default(self):
+        assert (json_default(datetime.datetime(2017, 6, 12, 1, 2, 3)) == '2017-06-12 01:02:03')
+        assert (json_default(self.Resource()) == {'name': u'résource', 'created': datetime.datetime(2017, 6, 12, 1, 2, 3)})
+        try:
+            json_default(object())
+            assert False
+        except AttributeError:
+            pass
+
+    def test_json_loads(self):
+        try:
+            for backend in self.get_installed_backends():
+                set_json_backend(backend)
+                for s in ['{"a": [1, 2.5, null, true]}', b'{"a": [1, 2.5, null, true]}', memoryview(b'{"a": [1, 2.5, null, true]}')]:
+                    assert (json_loads(s) == {'a': [1, 2.5, None, True]})
+                # Numbers out of the range of faster libraries fall back to the json library
+                assert (json_loads('[%d]' % 2 ** 70) == [2 ** 70])
+                for s in ['', '{"a": ', b'[1,]']:
+                    try:
+                        json_loads(s)
+                        assert False
+                    except ValueError:
+                        pass
+        finally:
+            set_json_backend()
+
+    def test_json_load(self):
+        try:
+            for backend in self.get_installed_backends():
+                set_json_backend(backend)
+                assert (json_load(io.StringIO(u'{"a": "caf\u00e9"}')) == {'a': u'caf\xe9'})
+                assert (json_load(io.BytesIO(b'{"a": 1}')) == {'a': 1})
+        finally:
+            set_json_backend()
+
+    def test_set_json_backend(self):
+        assert (set_json_backend() == self.get_installed_backends()[0])
+        try:
+            set_json_backend('unknown')
+            assert False
+        except Exception:
+            pass
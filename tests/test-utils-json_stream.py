@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+
+from opinel.utils.json_stream import *
+
+class TestOpinelUtilsJsonStream:
+
+    def test_iter_json_items(self):
+        document = {
+            'skipped': {'a': [1, 2, {'b': 'x"]}'}], 'c': 'escaped \\" quote \\\\'},
+            'number': 1234567890,
+            'nested': {'prefixes': [{'ip_prefix': '1.2.3.4/32', 'n': 1.5}, 'two', None, [3, 4], 12345678]},
+            'object': {'1': 'ICMP', '6': 'TCP'},
+            'empty': []
+        }
+        text = u'%s' % json.dumps(document)
+        for chunk_size in [1, 3, 7, 65536]:
+            items = list(iter_json_items(io.StringIO(text), ['nested', 'prefixes'], chunk_size))
+            assert (items == document['nested']['prefixes'])
+            items = dict(iter_json_items(io.StringIO(text), ['object'], chunk_size))
+            assert (items == document['object'])
+            assert (list(iter_json_items(io.StringIO(text), ['empty'], chunk_size)) == [])
+            assert (JSONStreamReader(io.StringIO(text), chunk_size).load(['number']) == 1234567890)
+        floats = [1.25, -3e10, 2.5e-07, 1e+100, 0.001, 123456.789, -0.5, 10, 7]
+        floats_text = u'{"floats": [1.25, -3e10, 2.5e-07, 1E+100, 0.001, 123456.789, -0.5, 10, 7]}'
+        for chunk_size in range(1, 12):
+            assert (list(iter_json_items(io.StringIO(floats_text), ['floats'], chunk_size)) == floats)
+        for key_path in [['missing'], ['nested', 'missing']]:
+            try:
+                list(iter_json_items(io.StringIO(text), key_path))
+                assert False
+            except KeyError:
+                pass
+        for key_path, bad_text in [(['number'], text), ([], text[:-10])]:
+            try:
+                list(iter_json_items(io.StringIO(bad_text), key_path))
+                assert False
+            except ValueError:
+                pass
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import os
+import time
+import zlib
+
+from opinel.utils.processes import *
+
+
+def square(target, params):
+    if target == 3:
+        raise ValueError('3')
+    return {'square': target * target, 'pid': os.getpid(), 'date': datetime.datetime(2017, 6, 12)}
+
+
+def sleep(target, params):
+    time.sleep(target)
+    return target
+
+
+class TestOpinelUtilsProcesses:
+
+    def test_shard_targets(self):
+        assert (shard_targets(['a', 'b', 'c'], 2) == [[(0, 'a'), (2, 'c')], [(1, 'b')]])
+        assert (shard_targets(['a'], 3) == [[(0, 'a')]])
+
+
+    def test_execute(self):
+        targets = list(range(6))
+        for mode in execution_modes:
+            results = execute(targets, square, {}, mode = mode, max_workers = 2, num_processes = 2)
+            assert ([r.target for r in results] == targets)
+            assert ([r.result['square'] for r in results if r.status == 'done'] == [0, 1, 4, 16, 25])
+            assert (results[3].status == 'failed')
+            if mode == 'threads':
+                assert (type(results[3].exception) == ValueError)
+            else:
+                assert (results[3].exception.type_name == 'ValueError')
+                assert (os.getpid() not in [r.result['pid'] for r in results if r.result])
+                assert (results[0].result['date'] == '2017-06-12 00:00:00')
+        assert (process_map([], square) == [])
+        try:
+            execute(targets, square, mode = 'opinelunittest')
+            assert (False)
+        except Exception:
+            pass
+
+
+    def test_process_map(self):
+        results = process_map([1, 2], square, num_processes = 2)
+        assert ([r.result['square'] for r in results] == [1, 4])
+        # Shards that complete before the timeout keep their results, the others are reported as timed out
+        results = process_map([0, 5, 0, 5], sleep, num_processes = 2, timeout = 1)
+        assert ([r.status for r in results] == ['done', 'timeout', 'done', 'timeout'])
+        assert ([r.result for r in results] == [0, None, 0, None])
+        # Shards that cannot run (e.g. functions that cannot be pickled) are reported as failed
+        results = process_map([1], lambda target, params: target)
+        assert (results[0].status == 'failed' and results[0].exception is not None)
+
+
+    def test_init_worker_process(self):
+        from opinel.utils.aws import client_cache
+        from opinel.utils.throttling import get_throttling_controller
+        client_cache.set(('fingerprint', 'iam', None, None), 'client')
+        get_throttling_controller().call(('123456789012', 'us-east-1', 'iam'), lambda **params: 'ok', {}, lambda e: False)
+        init_worker_process()
+        assert (len(client_cache) == 0)
+        assert (get_throttling_controller().get_metrics() == {})
+
+
+    def test_run_shard(self):
+        output = run_shard(([(4, 1), (7, 3)], square, {}, 2))
+        entries = json_loads(zlib.decompress(output))
+        assert ([entry[0] for entry in entries] == [4, 7])
+        assert (entries[0][1] == 'done' and entries[0][2]['square'] == 1 and entries[0][3] == None)
+        assert (entries[1][1] == 'failed' and entries[1][3] == ['ValueError', '3'])
+
+
+    def test_merge_shard_outputs(self):
+        outputs = [run_shard(([(0, 'a'), (2, 'c')], sleep, {}, 1)), run_shard(([(1, 3)], square, {}, 1))]
+        results = merge_shard_outputs(['a', 3, 'c', 'd'], outputs)
+        assert ([r.target for r in results] == ['a', 3, 'c', 'd'])
+        assert ([r.status for r in results] == ['failed', 'failed', 'failed', 'pending'])
+        assert (type(results[1].exception) == RemoteException and results[1].exception.type_name == 'ValueError')
@@ -68,3 +68,18 @@ class TestOpinelUtilsAWSProfiles(object):
         profile = AWSProfile(name = 'l01cd3v-2')
         profile.set_attribute('aws_mfa_serial', 'arn:aws:iam::123456789222:mfa/l01cd3v-2')
         profile.write()
+
+
+    def test_find_profiles_in_file(self):
+        filename = os.path.join(aws_dir, 'duplicates')
+        with open(filename, 'wt') as f:
+            f.write('[a]\nrole_arn = 1\n[profile b]\nrole_arn = 2\n[a]\nsource_profile = c\n')
+        profiles = AWSProfiles.find_profiles_in_file(filename, ['a', 'b'])
+        assert ([profile.name for profile in profiles] == ['a', 'b', 'a'])
+        assert (profiles[0].raw_profile == '[a]\nrole_arn = 1\n')
+        assert (profiles[1].attributes == {'role_arn': '2'})
+        assert (profiles[2].raw_profile == '[a]\nsource_profile = c\n')
+        assert ([profile.name for profile in AWSProfiles.find_profiles_in_file(filename, 'b|x')] == ['b'])
+        assert (len(AWSProfiles.find_profiles_in_file(filename)) == 3)
+        assert (AWSProfiles.get_name_filter(['a', 'b']) is AWSProfiles.get_name_filter(['a', 'b']))
+        os.remove(filename)
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+from threading import current_thread
+import time
+
 from opinel.utils.console import configPrintException
 from opinel.utils.threads import *
 
@@ -31,3 +34,65 @@ class TestOpinelUtilsThreads:
     def test_threaded_per_region(self):
         regions = [ 'us-east-1', 'us-east-2', 'us-west-1', 'us-west-2' ]
         thread_work(regions, threaded_per_region, params = {'method': self.callback})
+
+
+    def square(self, target, params):
+        params['target'] = target
+        if target == 3:
+            raise ValueError('3')
+        return target * target
+
+
+    def sleep(self, target, params):
+        time.sleep(target)
+        return target
+
+
+    def test_worker_pool(self):
+        pool = WorkerPool(max_workers = 4)
+        params = {'foo': 'bar'}
+        results = pool.map(list(range(10)), self.square, params)
+        assert ([r.target for r in results] == list(range(10)))
+        assert (results[2].result == 4 and results[2].status == 'done')
+        assert (results[3].status == 'failed' and type(results[3].exception) == ValueError)
+        assert (params == {'foo': 'bar'})
+        workers = list(pool.workers)
+        assert (len(workers) == 4)
+        pool.map(list(range(10)), self.square)
+        assert (pool.workers == workers)
+        assert (pool.map([], self.square) == [])
+
+
+    def test_worker_pool_timeout_and_cancel(self):
+        pool = WorkerPool(max_workers = 1)
+        results = pool.map([0.5, 0, 0], self.sleep, timeout = 0.1)
+        assert ([r.status for r in results] == ['timeout', 'cancelled', 'cancelled'])
+        batch = pool.submit([0.1, 0, 0], self.sleep)
+        batch.cancel()
+        statuses = [r.status for r in batch.wait()]
+        assert (statuses.count('cancelled') >= 2)
+
+
+    def test_get_worker_pool(self):
+        pool = get_worker_pool(3)
+        assert (get_worker_pool(3) is pool)
+        assert (get_worker_pool(4) is not pool)
+        assert (get_worker_pool(4).max_workers == 4)
+        # A nested thread_map call from one of the pool's workers runs inline, on the worker's own thread
+        def outer(target, params):
+            inner = thread_map([1, 2], lambda target, params: current_thread().name, max_workers = 3)
+            return current_thread().name, [r.result for r in inner]
+        results = thread_map([0], outer, max_workers = 3)
+        assert (results[0].status == 'done')
+        worker_name, inner_names = results[0].result
+        assert (worker_name != current_thread().name)
+        assert (inner_names == [worker_name, worker_name])
+
+
+    def test_thread_map(self):
+        results = thread_map([1, 2], self.square, max_workers = 2)
+        assert ([r.result for r in results] == [1, 4])
+        assert (get_worker_pool(2) is get_worker_pool(2))
+        # Nested calls run inline instead of deadlocking the pool
+        nested = thread_map([1], lambda target, params: [r.result for r in thread_map([target, 2], self.square, max_workers = 1)], max_workers = 1)
+        assert (nested[0].result == [1, 4])
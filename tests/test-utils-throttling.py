@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+from opinel.utils.throttling import *
+
+class TestOpinelUtilsThrottling:
+
+    def is_throttled(self, e):
+        return type(e) == ThrottlingException
+
+    def flaky_callback(self, **params):
+        params['calls'].append(1)
+        if len(params['calls']) <= params['failures']:
+            raise ThrottlingException()
+        return 'ok'
+
+    def failing_callback(self, **params):
+        raise ValueError()
+
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate = 100, min_rate = 10, max_rate = 120, increase = 50)
+        assert (bucket.acquire() == 0)
+        bucket.on_success()
+        assert (bucket.rate == 120)
+        bucket.on_throttle()
+        assert (bucket.rate == 60)
+        for i in range(5):
+            bucket.on_throttle()
+        assert (bucket.rate == 10)
+
+
+    def test_call(self):
+        controller = ThrottlingController(rate = 1000, min_rate = 100, base_delay = 0.001, max_delay = 0.01, max_retries = 3)
+        key = ('123456789012', 'us-east-1', 'iam')
+        assert (controller.call(key, self.flaky_callback, {'calls': [], 'failures': 2}, self.is_throttled) == 'ok')
+        metrics = controller.get_metrics(key)
+        assert (metrics['requests'] == 3)
+        assert (metrics['throttles'] == 2)
+        assert (metrics['retries'] == 2)
+        assert (metrics['effective_rps'] > 0)
+        assert (metrics['rate'] < 1000)
+        try:
+            controller.call(key, self.flaky_callback, {'calls': [], 'failures': 5}, self.is_throttled)
+            assert (False)
+        except ThrottlingException:
+            pass
+        try:
+            controller.call(key, self.failing_callback, {}, self.is_throttled)
+            assert (False)
+        except ValueError:
+            pass
+        assert (controller.get_metrics(key)['throttles'] == 6)
+        assert (get_throttling_controller().get_metrics(key) == None)
+        controller.reset()
+        assert (controller.get_metrics() == {})
+
+
+    def test_retry_budget(self):
+        controller = ThrottlingController(rate = 1000, base_delay = 0.001, max_delay = 0.01, retry_budget = 1)
+        key = (None, None, 'flaky_callback')
+        try:
+            controller.call(key, self.flaky_callback, {'calls': [], 'failures': 2}, self.is_throttled)
+            assert (False)
+        except ThrottlingException:
+            pass
+        assert (controller.get_metrics(key)['retries'] == 1)
+
+
+    def test_get_throttling_controller(self):
+        controller = get_throttling_controller()
+        assert (isinstance(controller, ThrottlingController))
+        assert (get_throttling_controller() is controller)
+
+
+    def test_set_throttling_controller(self):
+        default_controller = get_throttling_controller()
+        controller = ThrottlingController()
+        set_throttling_controller(controller)
+        assert (get_throttling_controller() is controller)
+        set_throttling_controller(default_controller)
+
+
+
+class ThrottlingException(Exception):
+    pass